@@ -5,7 +5,27 @@ d = { 'settings': { 'branch': 'master',
                 'doc_host': 'https://drscotthawley.github.io',
                 'git_url': 'https://github.com/drscotthawley/shazbot/tree/master/',
                 'lib_path': 'shazbot'},
-  'syms': { 'shazbot.blocks_utils': { 'shazbot.blocks_utils.EMAWarmup': ('blocks_utils.html#emawarmup', 'shazbot/blocks_utils.py'),
+  'syms': { 'shazbot.bench': { 'shazbot.bench._TinyDecoder': ('bench.html#_tinydecoder', 'shazbot/bench.py'),
+                               'shazbot.bench._TinyDecoder.__init__': ('bench.html#__init__', 'shazbot/bench.py'),
+                               'shazbot.bench._TinyDecoder.forward': ('bench.html#forward', 'shazbot/bench.py'),
+                               'shazbot.bench._aa_model': ('bench.html#_aa_model', 'shazbot/bench.py'),
+                               'shazbot.bench._git': ('bench.html#_git', 'shazbot/bench.py'),
+                               'shazbot.bench._stems': ('bench.html#_stems', 'shazbot/bench.py'),
+                               'shazbot.bench.bench_aa_forward': ('bench.html#bench_aa_forward', 'shazbot/bench.py'),
+                               'shazbot.bench.bench_aa_train': ('bench.html#bench_aa_train', 'shazbot/bench.py'),
+                               'shazbot.bench.bench_batch_it_crazy': ('bench.html#bench_batch_it_crazy', 'shazbot/bench.py'),
+                               'shazbot.bench.bench_dataset': ('bench.html#bench_dataset', 'shazbot/bench.py'),
+                               'shazbot.bench.bench_decode_long': ('bench.html#bench_decode_long', 'shazbot/bench.py'),
+                               'shazbot.bench.bench_ema_update': ('bench.html#bench_ema_update', 'shazbot/bench.py'),
+                               'shazbot.bench.bench_get_stems_faders': ('bench.html#bench_get_stems_faders', 'shazbot/bench.py'),
+                               'shazbot.bench.bench_sample': ('bench.html#bench_sample', 'shazbot/bench.py'),
+                               'shazbot.bench.benchmark': ('bench.html#benchmark', 'shazbot/bench.py'),
+                               'shazbot.bench.compare_results': ('bench.html#compare_results', 'shazbot/bench.py'),
+                               'shazbot.bench.main': ('bench.html#main', 'shazbot/bench.py'),
+                               'shazbot.bench.run_benchmarks': ('bench.html#run_benchmarks', 'shazbot/bench.py'),
+                               'shazbot.bench.run_info': ('bench.html#run_info', 'shazbot/bench.py'),
+                               'shazbot.bench.time_it': ('bench.html#time_it', 'shazbot/bench.py')},
+            'shazbot.blocks_utils': { 'shazbot.blocks_utils.EMAWarmup': ('blocks_utils.html#emawarmup', 'shazbot/blocks_utils.py'),
                                       'shazbot.blocks_utils.EMAWarmup.__init__': ('blocks_utils.html#__init__', 'shazbot/blocks_utils.py'),
                                       'shazbot.blocks_utils.EMAWarmup.get_value': ( 'blocks_utils.html#get_value',
                                                                                     'shazbot/blocks_utils.py'),
@@ -24,28 +44,87 @@ d = { 'settings': { 'branch': 'master',
                                       'shazbot.blocks_utils.eval_mode': ('blocks_utils.html#eval_mode', 'shazbot/blocks_utils.py'),
                                       'shazbot.blocks_utils.n_params': ('blocks_utils.html#n_params', 'shazbot/blocks_utils.py'),
                                       'shazbot.blocks_utils.train_mode': ('blocks_utils.html#train_mode', 'shazbot/blocks_utils.py')},
-            'shazbot.core': { 'shazbot.core.HostPrinter': ('core.html#hostprinter', 'shazbot/core.py'),
+            'shazbot.core': { 'shazbot.core.DeviceMetrics': ('core.html#devicemetrics', 'shazbot/core.py'),
+                              'shazbot.core.DeviceMetrics.__init__': ('core.html#__init__', 'shazbot/core.py'),
+                              'shazbot.core.DeviceMetrics.add': ('core.html#add', 'shazbot/core.py'),
+                              'shazbot.core.DeviceMetrics.due': ('core.html#due', 'shazbot/core.py'),
+                              'shazbot.core.DeviceMetrics.flush': ('core.html#flush', 'shazbot/core.py'),
+                              'shazbot.core.Heartbeat': ('core.html#heartbeat', 'shazbot/core.py'),
+                              'shazbot.core.Heartbeat.__init__': ('core.html#__init__', 'shazbot/core.py'),
+                              'shazbot.core.Heartbeat._gather': ('core.html#_gather', 'shazbot/core.py'),
+                              'shazbot.core.Heartbeat._measure': ('core.html#_measure', 'shazbot/core.py'),
+                              'shazbot.core.Heartbeat.beat': ('core.html#beat', 'shazbot/core.py'),
+                              'shazbot.core.Heartbeat.describe': ('core.html#describe', 'shazbot/core.py'),
+                              'shazbot.core.Heartbeat.log_dict': ('core.html#log_dict', 'shazbot/core.py'),
+                              'shazbot.core.Heartbeat.step': ('core.html#step', 'shazbot/core.py'),
+                              'shazbot.core.HostPrinter': ('core.html#hostprinter', 'shazbot/core.py'),
                               'shazbot.core.HostPrinter.__call__': ('core.html#__call__', 'shazbot/core.py'),
                               'shazbot.core.HostPrinter.__init__': ('core.html#__init__', 'shazbot/core.py'),
+                              'shazbot.core.LowPrecision': ('core.html#lowprecision', 'shazbot/core.py'),
+                              'shazbot.core.LowPrecision.__init__': ('core.html#__init__', 'shazbot/core.py'),
+                              'shazbot.core.LowPrecision.forward': ('core.html#forward', 'shazbot/core.py'),
                               'shazbot.core.Mish': ('core.html#mish', 'shazbot/core.py'),
                               'shazbot.core.Mish.__init__': ('core.html#__init__', 'shazbot/core.py'),
                               'shazbot.core.Mish.forward': ('core.html#forward', 'shazbot/core.py'),
                               'shazbot.core.Mish_func': ('core.html#mish_func', 'shazbot/core.py'),
                               'shazbot.core.Mish_func.backward': ('core.html#backward', 'shazbot/core.py'),
                               'shazbot.core.Mish_func.forward': ('core.html#forward', 'shazbot/core.py'),
+                              'shazbot.core.OnDemandTrace': ('core.html#ondemandtrace', 'shazbot/core.py'),
+                              'shazbot.core.OnDemandTrace.__init__': ('core.html#__init__', 'shazbot/core.py'),
+                              'shazbot.core.OnDemandTrace._check_sentinel': ('core.html#_check_sentinel', 'shazbot/core.py'),
+                              'shazbot.core.OnDemandTrace._finish': ('core.html#_finish', 'shazbot/core.py'),
+                              'shazbot.core.OnDemandTrace._mtime': ('core.html#_mtime', 'shazbot/core.py'),
+                              'shazbot.core.OnDemandTrace._start': ('core.html#_start', 'shazbot/core.py'),
+                              'shazbot.core.OnDemandTrace.close': ('core.html#close', 'shazbot/core.py'),
+                              'shazbot.core.OnDemandTrace.request': ('core.html#request', 'shazbot/core.py'),
+                              'shazbot.core.OnDemandTrace.step': ('core.html#step', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler': ('core.html#stepprofiler', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler.__init__': ('core.html#__init__', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler._charge': ('core.html#_charge', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler.breakdown': ('core.html#breakdown', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler.close': ('core.html#close', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler.iterate': ('core.html#iterate', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler.log_dict': ('core.html#log_dict', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler.phase': ('core.html#phase', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler.stats': ('core.html#stats', 'shazbot/core.py'),
+                              'shazbot.core.StepProfiler.step': ('core.html#step', 'shazbot/core.py'),
+                              'shazbot.core.StreamingPCA': ('core.html#streamingpca', 'shazbot/core.py'),
+                              'shazbot.core.StreamingPCA.__init__': ('core.html#__init__', 'shazbot/core.py'),
+                              'shazbot.core.StreamingPCA.components': ('core.html#components', 'shazbot/core.py'),
+                              'shazbot.core.StreamingPCA.project': ('core.html#project', 'shazbot/core.py'),
+                              'shazbot.core.StreamingPCA.update': ('core.html#update', 'shazbot/core.py'),
                               'shazbot.core.Swish': ('core.html#swish', 'shazbot/core.py'),
                               'shazbot.core.Swish.__init__': ('core.html#__init__', 'shazbot/core.py'),
                               'shazbot.core.Swish.forward': ('core.html#forward', 'shazbot/core.py'),
                               'shazbot.core.Swish_func': ('core.html#swish_func', 'shazbot/core.py'),
                               'shazbot.core.Swish_func.backward': ('core.html#backward', 'shazbot/core.py'),
                               'shazbot.core.Swish_func.forward': ('core.html#forward', 'shazbot/core.py'),
+                              'shazbot.core._proc_stat': ('core.html#_proc_stat', 'shazbot/core.py'),
+                              'shazbot.core._to_float': ('core.html#_to_float', 'shazbot/core.py'),
+                              'shazbot.core.autocast': ('core.html#autocast', 'shazbot/core.py'),
+                              'shazbot.core.bake_weight_norm': ('core.html#bake_weight_norm', 'shazbot/core.py'),
+                              'shazbot.core.check_precision': ('core.html#check_precision', 'shazbot/core.py'),
+                              'shazbot.core.compare_inference': ('core.html#compare_inference', 'shazbot/core.py'),
+                              'shazbot.core.cpus_per_process': ('core.html#cpus_per_process', 'shazbot/core.py'),
+                              'shazbot.core.encode_long': ('core.html#encode_long', 'shazbot/core.py'),
+                              'shazbot.core.find_audio_files': ('core.html#find_audio_files', 'shazbot/core.py'),
+                              'shazbot.core.find_stragglers': ('core.html#find_stragglers', 'shazbot/core.py'),
+                              'shazbot.core.fit_batch_to_memory': ('core.html#fit_batch_to_memory', 'shazbot/core.py'),
                               'shazbot.core.freeze': ('core.html#freeze', 'shazbot/core.py'),
                               'shazbot.core.get_accel_config': ('core.html#get_accel_config', 'shazbot/core.py'),
+                              'shazbot.core.get_rng_state': ('core.html#get_rng_state', 'shazbot/core.py'),
                               'shazbot.core.is_silence': ('core.html#is_silence', 'shazbot/core.py'),
                               'shazbot.core.load_audio': ('core.html#load_audio', 'shazbot/core.py'),
                               'shazbot.core.makedir': ('core.html#makedir', 'shazbot/core.py'),
+                              'shazbot.core.measure_peak_memory': ('core.html#measure_peak_memory', 'shazbot/core.py'),
                               'shazbot.core.n_params': ('core.html#n_params', 'shazbot/core.py'),
-                              'shazbot.core.save': ('core.html#save', 'shazbot/core.py')},
+                              'shazbot.core.phase': ('core.html#phase', 'shazbot/core.py'),
+                              'shazbot.core.precision_for': ('core.html#precision_for', 'shazbot/core.py'),
+                              'shazbot.core.quantize_frozen': ('core.html#quantize_frozen', 'shazbot/core.py'),
+                              'shazbot.core.save': ('core.html#save', 'shazbot/core.py'),
+                              'shazbot.core.set_precision': ('core.html#set_precision', 'shazbot/core.py'),
+                              'shazbot.core.set_profiler': ('core.html#set_profiler', 'shazbot/core.py'),
+                              'shazbot.core.set_rng_state': ('core.html#set_rng_state', 'shazbot/core.py')},
             'shazbot.data': { 'shazbot.data.FillTheNoise': ('data.html#fillthenoise', 'shazbot/data.py'),
                               'shazbot.data.FillTheNoise.__call__': ('data.html#__call__', 'shazbot/data.py'),
                               'shazbot.data.FillTheNoise.__init__': ('data.html#__init__', 'shazbot/data.py'),
@@ -55,6 +134,7 @@ d = { 'settings': { 'branch': 'master',
                               'shazbot.data.MultiStemDataset.__getitem__': ('data.html#__getitem__', 'shazbot/data.py'),
                               'shazbot.data.MultiStemDataset.__init__': ('data.html#__init__', 'shazbot/data.py'),
                               'shazbot.data.MultiStemDataset.__len__': ('data.html#__len__', 'shazbot/data.py'),
+                              'shazbot.data.MultiStemDataset.cache_file': ('data.html#cache_file', 'shazbot/data.py'),
                               'shazbot.data.MultiStemDataset.get_data_range': ('data.html#get_data_range', 'shazbot/data.py'),
                               'shazbot.data.MultiStemDataset.load_file': ('data.html#load_file', 'shazbot/data.py'),
                               'shazbot.data.MultiStemDataset.load_file_ind': ('data.html#load_file_ind', 'shazbot/data.py'),
@@ -74,29 +154,175 @@ d = { 'settings': { 'branch': 'master',
                               'shazbot.data.RandomGain': ('data.html#randomgain', 'shazbot/data.py'),
                               'shazbot.data.RandomGain.__call__': ('data.html#__call__', 'shazbot/data.py'),
                               'shazbot.data.RandomGain.__init__': ('data.html#__init__', 'shazbot/data.py'),
+                              'shazbot.data.ResumableSampler': ('data.html#resumablesampler', 'shazbot/data.py'),
+                              'shazbot.data.ResumableSampler.__init__': ('data.html#__init__', 'shazbot/data.py'),
+                              'shazbot.data.ResumableSampler.__iter__': ('data.html#__iter__', 'shazbot/data.py'),
+                              'shazbot.data.ResumableSampler.__len__': ('data.html#__len__', 'shazbot/data.py'),
+                              'shazbot.data.ResumableSampler.advance': ('data.html#advance', 'shazbot/data.py'),
+                              'shazbot.data.ResumableSampler.load_state_dict': ('data.html#load_state_dict', 'shazbot/data.py'),
+                              'shazbot.data.ResumableSampler.order': ('data.html#order', 'shazbot/data.py'),
+                              'shazbot.data.ResumableSampler.set_epoch': ('data.html#set_epoch', 'shazbot/data.py'),
+                              'shazbot.data.ResumableSampler.state_dict': ('data.html#state_dict', 'shazbot/data.py'),
                               'shazbot.data.Stereo': ('data.html#stereo', 'shazbot/data.py'),
                               'shazbot.data.Stereo.__call__': ('data.html#__call__', 'shazbot/data.py')},
+            'shazbot.embed': { 'shazbot.embed.EmbedFiles': ('embed.html#embedfiles', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbedFiles.__getitem__': ('embed.html#__getitem__', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbedFiles.__init__': ('embed.html#__init__', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbedFiles.__len__': ('embed.html#__len__', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore': ('embed.html#embeddingstore', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.__init__': ('embed.html#__init__', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.__len__': ('embed.html#__len__', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore._files': ('embed.html#_files', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore._repair': ('embed.html#_repair', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.add': ('embed.html#add', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.done_paths': ('embed.html#done_paths', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.get': ('embed.html#get', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.index': ('embed.html#index', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.iter_batches': ('embed.html#iter_batches', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.rows': ('embed.html#rows', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.shard_vectors': ('embed.html#shard_vectors', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.shards': ('embed.html#shards', 'shazbot/embed.py'),
+                               'shazbot.embed.EmbeddingStore.vectors': ('embed.html#vectors', 'shazbot/embed.py'),
+                               'shazbot.embed._chunk_vectors': ('embed.html#_chunk_vectors', 'shazbot/embed.py'),
+                               'shazbot.embed._model_settings': ('embed.html#_model_settings', 'shazbot/embed.py'),
+                               'shazbot.embed.chunk_audio': ('embed.html#chunk_audio', 'shazbot/embed.py'),
+                               'shazbot.embed.embed_audio': ('embed.html#embed_audio', 'shazbot/embed.py'),
+                               'shazbot.embed.embed_files': ('embed.html#embed_files', 'shazbot/embed.py'),
+                               'shazbot.embed.load_stereo': ('embed.html#load_stereo', 'shazbot/embed.py'),
+                               'shazbot.embed.main': ('embed.html#main', 'shazbot/embed.py'),
+                               'shazbot.embed.pool_frames': ('embed.html#pool_frames', 'shazbot/embed.py')},
             'shazbot.icebox': { 'shazbot.icebox.IceBoxModel': ('icebox.html#iceboxmodel', 'shazbot/icebox.py'),
                                 'shazbot.icebox.IceBoxModel.__init__': ('icebox.html#__init__', 'shazbot/icebox.py'),
+                                'shazbot.icebox.IceBoxModel._encode': ('icebox.html#_encode', 'shazbot/icebox.py'),
                                 'shazbot.icebox.IceBoxModel.decode': ('icebox.html#decode', 'shazbot/icebox.py'),
+                                'shazbot.icebox.IceBoxModel.decoder': ('icebox.html#decoder', 'shazbot/icebox.py'),
                                 'shazbot.icebox.IceBoxModel.encode': ('icebox.html#encode', 'shazbot/icebox.py'),
+                                'shazbot.icebox.IceBoxModel.encode_file': ('icebox.html#encode_file', 'shazbot/icebox.py'),
+                                'shazbot.icebox.IceBoxModel.encoder': ('icebox.html#encoder', 'shazbot/icebox.py'),
+                                'shazbot.icebox.IceBoxModel.quantize': ('icebox.html#quantize', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JbxFiles': ('icebox.html#jbxfiles', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JbxFiles.__getitem__': ('icebox.html#__getitem__', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JbxFiles.__init__': ('icebox.html#__init__', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JbxFiles.__len__': ('icebox.html#__len__', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JukeboxCache': ('icebox.html#jukeboxcache', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JukeboxCache.__init__': ('icebox.html#__init__', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JukeboxCache.audio_hash': ('icebox.html#audio_hash', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JukeboxCache.entry': ('icebox.html#entry', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JukeboxCache.file_hash': ('icebox.html#file_hash', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JukeboxCache.get': ('icebox.html#get', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JukeboxCache.put': ('icebox.html#put', 'shazbot/icebox.py'),
+                                'shazbot.icebox.JukeboxCache.stats': ('icebox.html#stats', 'shazbot/icebox.py'),
                                 'shazbot.icebox.audio_for_jbx': ('icebox.html#audio_for_jbx', 'shazbot/icebox.py'),
                                 'shazbot.icebox.batch_it_crazy': ('icebox.html#batch_it_crazy', 'shazbot/icebox.py'),
+                                'shazbot.icebox.benchmark_icebox': ('icebox.html#benchmark_icebox', 'shazbot/icebox.py'),
+                                'shazbot.icebox.encode_files': ('icebox.html#encode_files', 'shazbot/icebox.py'),
                                 'shazbot.icebox.init_jukebox_sample_rate': ('icebox.html#init_jukebox_sample_rate', 'shazbot/icebox.py'),
+                                'shazbot.icebox.length_buckets': ('icebox.html#length_buckets', 'shazbot/icebox.py'),
                                 'shazbot.icebox.load_audio_for_jbx': ('icebox.html#load_audio_for_jbx', 'shazbot/icebox.py'),
                                 'shazbot.icebox.main': ('icebox.html#main', 'shazbot/icebox.py'),
-                                'shazbot.icebox.stereo': ('icebox.html#stereo', 'shazbot/icebox.py')},
+                                'shazbot.icebox.make_encoder_vqvae': ('icebox.html#make_encoder_vqvae', 'shazbot/icebox.py'),
+                                'shazbot.icebox.pad_batch_for_jbx': ('icebox.html#pad_batch_for_jbx', 'shazbot/icebox.py'),
+                                'shazbot.icebox.stereo': ('icebox.html#stereo', 'shazbot/icebox.py'),
+                                'shazbot.icebox.warm_cache': ('icebox.html#warm_cache', 'shazbot/icebox.py')},
+            'shazbot.inference': { 'shazbot.inference.EmbedChain': ('inference.html#embedchain', 'shazbot/inference.py'),
+                                   'shazbot.inference.EmbedChain.__init__': ('inference.html#__init__', 'shazbot/inference.py'),
+                                   'shazbot.inference.EmbedChain.forward': ('inference.html#forward', 'shazbot/inference.py'),
+                                   'shazbot.inference.Embedder': ('inference.html#embedder', 'shazbot/inference.py'),
+                                   'shazbot.inference.Embedder.__call__': ('inference.html#__call__', 'shazbot/inference.py'),
+                                   'shazbot.inference.Embedder.__init__': ('inference.html#__init__', 'shazbot/inference.py'),
+                                   'shazbot.inference.FaderSession': ('inference.html#fadersession', 'shazbot/inference.py'),
+                                   'shazbot.inference.FaderSession.__init__': ('inference.html#__init__', 'shazbot/inference.py'),
+                                   'shazbot.inference.FaderSession._embed': ('inference.html#_embed', 'shazbot/inference.py'),
+                                   'shazbot.inference.FaderSession._latents': ('inference.html#_latents', 'shazbot/inference.py'),
+                                   'shazbot.inference.FaderSession.add_stem': ('inference.html#add_stem', 'shazbot/inference.py'),
+                                   'shazbot.inference.FaderSession.mix_embedding': ('inference.html#mix_embedding', 'shazbot/inference.py'),
+                                   'shazbot.inference.FaderSession.remove_stem': ('inference.html#remove_stem', 'shazbot/inference.py'),
+                                   'shazbot.inference.FaderSession.set_gain': ('inference.html#set_gain', 'shazbot/inference.py'),
+                                   'shazbot.inference.benchmark_embedder': ('inference.html#benchmark_embedder', 'shazbot/inference.py'),
+                                   'shazbot.inference.benchmark_faders': ('inference.html#benchmark_faders', 'shazbot/inference.py'),
+                                   'shazbot.inference.export_embedder': ('inference.html#export_embedder', 'shazbot/inference.py'),
+                                   'shazbot.inference.fold_embed_block': ('inference.html#fold_embed_block', 'shazbot/inference.py'),
+                                   'shazbot.inference.fold_reembedding': ('inference.html#fold_reembedding', 'shazbot/inference.py'),
+                                   'shazbot.inference.load_embedder': ('inference.html#load_embedder', 'shazbot/inference.py'),
+                                   'shazbot.inference.make_embed_chain': ('inference.html#make_embed_chain', 'shazbot/inference.py')},
+            'shazbot.search': { 'shazbot.search.IVFPQIndex': ('search.html#ivfpqindex', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex.__init__': ('search.html#__init__', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex.__len__': ('search.html#__len__', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex._list': ('search.html#_list', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex._prep': ('search.html#_prep', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex.add': ('search.html#add', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex.add_from_store': ('search.html#add_from_store', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex.encode': ('search.html#encode', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex.is_trained': ('search.html#is_trained', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex.search': ('search.html#search', 'shazbot/search.py'),
+                                'shazbot.search.IVFPQIndex.train': ('search.html#train', 'shazbot/search.py'),
+                                'shazbot.search.benchmark_index': ('search.html#benchmark_index', 'shazbot/search.py'),
+                                'shazbot.search.build_index': ('search.html#build_index', 'shazbot/search.py'),
+                                'shazbot.search.exact_search': ('search.html#exact_search', 'shazbot/search.py'),
+                                'shazbot.search.find_stems': ('search.html#find_stems', 'shazbot/search.py'),
+                                'shazbot.search.kmeans': ('search.html#kmeans', 'shazbot/search.py'),
+                                'shazbot.search.load_index': ('search.html#load_index', 'shazbot/search.py'),
+                                'shazbot.search.nearest': ('search.html#nearest', 'shazbot/search.py'),
+                                'shazbot.search.save_index': ('search.html#save_index', 'shazbot/search.py')},
+            'shazbot.serve': { 'shazbot.serve.EmbedClient': ('serve.html#embedclient', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedClient.__init__': ('serve.html#__init__', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedClient._request': ('serve.html#_request', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedClient.close': ('serve.html#close', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedClient.embed': ('serve.html#embed', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedClient.stats': ('serve.html#stats', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer': ('serve.html#embedserver', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer.__init__': ('serve.html#__init__', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer._batch_loop': ('serve.html#_batch_loop', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer._forward': ('serve.html#_forward', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer._handle': ('serve.html#_handle', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer._respond': ('serve.html#_respond', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer._route': ('serve.html#_route', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer.close': ('serve.html#close', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer.embed': ('serve.html#embed', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer.reset_stats': ('serve.html#reset_stats', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer.start': ('serve.html#start', 'shazbot/serve.py'),
+                               'shazbot.serve.EmbedServer.stats': ('serve.html#stats', 'shazbot/serve.py'),
+                               'shazbot.serve.benchmark_server': ('serve.html#benchmark_server', 'shazbot/serve.py'),
+                               'shazbot.serve.from_npy': ('serve.html#from_npy', 'shazbot/serve.py'),
+                               'shazbot.serve.load_test': ('serve.html#load_test', 'shazbot/serve.py'),
+                               'shazbot.serve.main': ('serve.html#main', 'shazbot/serve.py'),
+                               'shazbot.serve.read_headers': ('serve.html#read_headers', 'shazbot/serve.py'),
+                               'shazbot.serve.run_async': ('serve.html#run_async', 'shazbot/serve.py'),
+                               'shazbot.serve.to_npy': ('serve.html#to_npy', 'shazbot/serve.py')},
+            'shazbot.streaming': { 'shazbot.streaming.StreamingEncoder': ('streaming.html#streamingencoder', 'shazbot/streaming.py'),
+                                   'shazbot.streaming.StreamingEncoder.__init__': ('streaming.html#__init__', 'shazbot/streaming.py'),
+                                   'shazbot.streaming.StreamingEncoder.encode_stream': ( 'streaming.html#encode_stream',
+                                                                                         'shazbot/streaming.py'),
+                                   'shazbot.streaming.StreamingEncoder.forward': ('streaming.html#forward', 'shazbot/streaming.py'),
+                                   'shazbot.streaming.StreamingEncoder.reset': ('streaming.html#reset', 'shazbot/streaming.py'),
+                                   'shazbot.streaming.benchmark_streaming': ('streaming.html#benchmark_streaming', 'shazbot/streaming.py'),
+                                   'shazbot.streaming.check_streaming': ('streaming.html#check_streaming', 'shazbot/streaming.py')},
             'shazbot.train_aa_mixer': { 'shazbot.train_aa_mixer.AudioAlgebra': ( 'train_aa_mixer.html#audioalgebra',
                                                                                  'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.AudioAlgebra.__init__': ( 'train_aa_mixer.html#__init__',
                                                                                           'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.AudioAlgebra.distance': ( 'train_aa_mixer.html#distance',
                                                                                           'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.AudioAlgebra.embed': ( 'train_aa_mixer.html#embed',
+                                                                                       'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.AudioAlgebra.forward': ( 'train_aa_mixer.html#forward',
                                                                                          'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.AudioAlgebra.loss': ( 'train_aa_mixer.html#loss',
                                                                                       'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.AudioAlgebra.mag': ('train_aa_mixer.html#mag', 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.DemoWorker': ( 'train_aa_mixer.html#demoworker',
+                                                                               'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.DemoWorker.__init__': ( 'train_aa_mixer.html#__init__',
+                                                                                        'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.DemoWorker.close': ( 'train_aa_mixer.html#close',
+                                                                                     'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.DemoWorker.collect': ( 'train_aa_mixer.html#collect',
+                                                                                       'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.DemoWorker.render': ( 'train_aa_mixer.html#render',
+                                                                                      'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.DemoWorker.run': ('train_aa_mixer.html#run', 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.DemoWorker.submit': ( 'train_aa_mixer.html#submit',
+                                                                                      'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.DiffusionDVAE': ( 'train_aa_mixer.html#diffusiondvae',
                                                                                   'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.DiffusionDVAE.__init__': ( 'train_aa_mixer.html#__init__',
@@ -115,17 +341,66 @@ d = { 'settings': { 'branch': 'master',
                                                                                         'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.EmbedBlock.forward': ( 'train_aa_mixer.html#forward',
                                                                                        'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.MicroBatcher': ( 'train_aa_mixer.html#microbatcher',
+                                                                                 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.MicroBatcher.__init__': ( 'train_aa_mixer.html#__init__',
+                                                                                          'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.MicroBatcher.run': ('train_aa_mixer.html#run', 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.MicroBatcher.size': ( 'train_aa_mixer.html#size',
+                                                                                      'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.VizWorker': ('train_aa_mixer.html#vizworker', 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.VizWorker.__init__': ( 'train_aa_mixer.html#__init__',
+                                                                                       'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.VizWorker.close': ( 'train_aa_mixer.html#close',
+                                                                                    'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.VizWorker.collect': ( 'train_aa_mixer.html#collect',
+                                                                                      'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.VizWorker.run': ('train_aa_mixer.html#run', 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.VizWorker.submit': ( 'train_aa_mixer.html#submit',
+                                                                                     'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer._cat_outputs': ( 'train_aa_mixer.html#_cat_outputs',
+                                                                                 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer._ddp_bench_job': ( 'train_aa_mixer.html#_ddp_bench_job',
+                                                                                   'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer._ddp_sync_job': ( 'train_aa_mixer.html#_ddp_sync_job',
+                                                                                  'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer._local_worker': ( 'train_aa_mixer.html#_local_worker',
+                                                                                  'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer._random_stems': ( 'train_aa_mixer.html#_random_stems',
+                                                                                  'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer._straggler_job': ( 'train_aa_mixer.html#_straggler_job',
+                                                                                   'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer._tiny_aa_setup': ( 'train_aa_mixer.html#_tiny_aa_setup',
+                                                                                   'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer._tuning_job': ( 'train_aa_mixer.html#_tuning_job',
+                                                                                'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.ad_encode_it': ( 'train_aa_mixer.html#ad_encode_it',
                                                                                  'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.alpha_sigma_to_t': ( 'train_aa_mixer.html#alpha_sigma_to_t',
                                                                                      'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.benchmark_ddp_scaling': ( 'train_aa_mixer.html#benchmark_ddp_scaling',
+                                                                                          'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.check_ddp_sync': ( 'train_aa_mixer.html#check_ddp_sync',
+                                                                                   'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.check_stragglers': ( 'train_aa_mixer.html#check_stragglers',
+                                                                                     'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.crossfade_window': ( 'train_aa_mixer.html#crossfade_window',
+                                                                                     'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.decode_long': ( 'train_aa_mixer.html#decode_long',
+                                                                                'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.demo': ('train_aa_mixer.html#demo', 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.embed_long': ( 'train_aa_mixer.html#embed_long',
+                                                                               'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.get_alphas_sigmas': ( 'train_aa_mixer.html#get_alphas_sigmas',
                                                                                       'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.get_crash_schedule': ( 'train_aa_mixer.html#get_crash_schedule',
                                                                                        'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.get_stems_faders': ( 'train_aa_mixer.html#get_stems_faders',
                                                                                      'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.in_batch_negatives': ( 'train_aa_mixer.html#in_batch_negatives',
+                                                                                       'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.launch_local': ( 'train_aa_mixer.html#launch_local',
+                                                                                 'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.main': ('train_aa_mixer.html#main', 'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.make_autocast_model_fn': ( 'train_aa_mixer.html#make_autocast_model_fn',
                                                                                            'shazbot/train_aa_mixer.py'),
@@ -133,6 +408,8 @@ d = { 'settings': { 'branch': 'master',
                                                                                        'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.make_eps_model_fn': ( 'train_aa_mixer.html#make_eps_model_fn',
                                                                                       'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.max_batch_for_memory': ( 'train_aa_mixer.html#max_batch_for_memory',
+                                                                                         'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.pie_sample': ( 'train_aa_mixer.html#pie_sample',
                                                                                'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.pie_step': ('train_aa_mixer.html#pie_step', 'shazbot/train_aa_mixer.py'),
@@ -146,7 +423,35 @@ d = { 'settings': { 'branch': 'master',
                                         'shazbot.train_aa_mixer.prk_sample': ( 'train_aa_mixer.html#prk_sample',
                                                                                'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.prk_step': ('train_aa_mixer.html#prk_step', 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.quantize_dvae_encoder': ( 'train_aa_mixer.html#quantize_dvae_encoder',
+                                                                                          'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.sample': ('train_aa_mixer.html#sample', 'shazbot/train_aa_mixer.py'),
                                         'shazbot.train_aa_mixer.setup_weights': ( 'train_aa_mixer.html#setup_weights',
                                                                                   'shazbot/train_aa_mixer.py'),
-                                        'shazbot.train_aa_mixer.transfer': ('train_aa_mixer.html#transfer', 'shazbot/train_aa_mixer.py')}}}
\ No newline at end of file
+                                        'shazbot.train_aa_mixer.sync_tuning': ( 'train_aa_mixer.html#sync_tuning',
+                                                                                'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.tiny_dvae': ('train_aa_mixer.html#tiny_dvae', 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.train_step': ( 'train_aa_mixer.html#train_step',
+                                                                               'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.transfer': ('train_aa_mixer.html#transfer', 'shazbot/train_aa_mixer.py'),
+                                        'shazbot.train_aa_mixer.wandb_audio': ( 'train_aa_mixer.html#wandb_audio',
+                                                                                'shazbot/train_aa_mixer.py')},
+            'shazbot.tune': { 'shazbot.tune.SyntheticStems': ('tune.html#syntheticstems', 'shazbot/tune.py'),
+                              'shazbot.tune.SyntheticStems.__getitem__': ('tune.html#__getitem__', 'shazbot/tune.py'),
+                              'shazbot.tune.SyntheticStems.__init__': ('tune.html#__init__', 'shazbot/tune.py'),
+                              'shazbot.tune.SyntheticStems.__len__': ('tune.html#__len__', 'shazbot/tune.py'),
+                              'shazbot.tune.TimedBatches': ('tune.html#timedbatches', 'shazbot/tune.py'),
+                              'shazbot.tune.TimedBatches.__init__': ('tune.html#__init__', 'shazbot/tune.py'),
+                              'shazbot.tune.TimedBatches.__iter__': ('tune.html#__iter__', 'shazbot/tune.py'),
+                              'shazbot.tune.TimedBatches.__next__': ('tune.html#__next__', 'shazbot/tune.py'),
+                              'shazbot.tune._candidates': ('tune.html#_candidates', 'shazbot/tune.py'),
+                              'shazbot.tune._pick': ('tune.html#_pick', 'shazbot/tune.py'),
+                              'shazbot.tune._time_steps': ('tune.html#_time_steps', 'shazbot/tune.py'),
+                              'shazbot.tune.aa_step_fn': ('tune.html#aa_step_fn', 'shazbot/tune.py'),
+                              'shazbot.tune.apply_tuning': ('tune.html#apply_tuning', 'shazbot/tune.py'),
+                              'shazbot.tune.autotune': ('tune.html#autotune', 'shazbot/tune.py'),
+                              'shazbot.tune.load_tuning': ('tune.html#load_tuning', 'shazbot/tune.py'),
+                              'shazbot.tune.save_tuning': ('tune.html#save_tuning', 'shazbot/tune.py'),
+                              'shazbot.tune.time_pipeline': ('tune.html#time_pipeline', 'shazbot/tune.py'),
+                              'shazbot.tune.tuning_file': ('tune.html#tuning_file', 'shazbot/tune.py'),
+                              'shazbot.tune.tuning_key': ('tune.html#tuning_key', 'shazbot/tune.py')}}}
\ No newline at end of file
@@ -0,0 +1,245 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/bench.ipynb.
+
+# %% auto 0
+__all__ = ['BENCHMARKS', 'time_it', 'benchmark', 'bench_dataset', 'bench_get_stems_faders', 'bench_aa_forward', 'bench_aa_train',
+           'bench_ema_update', 'bench_sample', 'bench_decode_long', 'bench_batch_it_crazy', 'run_info',
+           'run_benchmarks', 'compare_results', 'main']
+
+# %% ../nbs/bench.ipynb 3
+import os
+import json
+import time
+import socket
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import numpy as np
+import torch
+from torch import nn
+from torch.nn import functional as F
+from .tune import SyntheticStems, TimedBatches
+
+# %% ../nbs/bench.ipynb 5
+def time_it(fn, reps=10, warmup=2, items=1, device='cpu') -> dict:
+    "times fn() over reps calls; returns seconds per call (median, min, mean, std) and items/sec"
+    sync = torch.cuda.synchronize if torch.device(device).type == 'cuda' else (lambda: None)
+    for _ in range(warmup): fn()
+    sync()
+    times = []
+    for _ in range(reps):
+        t = time.perf_counter()
+        fn()
+        sync()
+        times.append(time.perf_counter() - t)
+    med = statistics.median(times)
+    return {'reps': reps, 'median_s': med, 'min_s': min(times), 'mean_s': statistics.mean(times),
+            'std_s': statistics.pstdev(times), 'items_per_sec': items / med if med > 0 else float('inf')}
+
+# %% ../nbs/bench.ipynb 8
+BENCHMARKS = {}   # name: benchmark function, in the order they run
+
+
+def benchmark(name:str):
+    "decorator adding a benchmark function to BENCHMARKS under name"
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+class _TinyDecoder(nn.Module):
+    "a small random stand-in for the diffusion decoder: v = model(x, t, z), with z upsampled to the audio's length"
+    def __init__(self, latent_dim=32, channels=16):
+        super().__init__()
+        self.inp, self.cond = nn.Conv1d(2, channels, 5, padding=2), nn.Conv1d(latent_dim, channels, 1)
+        self.out = nn.Conv1d(channels, 2, 5, padding=2)
+
+    def forward(self, x, t, z):
+        c = F.interpolate(self.cond(z), size=x.shape[-1])
+        return self.out(torch.tanh(self.inp(x) + c + t[:, None, None]))
+
+
+def _aa_model(latent_dim=32, sample_size=2**15, device='cpu'):
+    from shazbot.train_aa_mixer import AudioAlgebra, tiny_dvae
+    torch.manual_seed(0)
+    args = argparse.Namespace(latent_dim=latent_dim, sample_size=sample_size, num_quantizers=0)
+    return AudioAlgebra(args, torch.device(device), tiny_dvae(latent_dim)).to(device)
+
+
+def _stems(batch_size, sample_size, nstems=3, device='cpu'):
+    return [0.1*torch.randn(batch_size, 2, sample_size, device=device) for _ in range(nstems)], 2*torch.rand(nstems)-1
+
+# %% ../nbs/bench.ipynb 9
+@benchmark('dataset')
+def bench_dataset(batch_size, sample_size, reps, warmup, device, n_files=16, sample_rate=48000):
+    "MultiStemDataset items/sec, reading (uncached) wav files of 2*sample_size samples from a temp dir"
+    import soundfile as sf
+    from shazbot.data import MultiStemDataset
+    with tempfile.TemporaryDirectory() as tmp:
+        rng = np.random.default_rng(0)
+        for i in range(n_files):
+            sf.write(os.path.join(tmp, f'stem{i:03d}.wav'), 0.1*rng.standard_normal((2*sample_size, 2)).astype(np.float32), sample_rate)
+        args = argparse.Namespace(sample_size=sample_size, random_crop=True, sample_rate=sample_rate, num_gpus=1,
+                                  cache_training_data=False, load_frac=1.0)
+        ds = MultiStemDataset([tmp], args)
+        ds.load_file(ds.filenames[0])   # __getitem__ retries other files on errors; this surfaces them instead
+        def fn():
+            for i in range(len(ds)): ds[i]
+        return {**time_it(fn, reps, warmup, items=len(ds)), 'n_files': n_files}
+
+
+@benchmark('get_stems_faders')
+def bench_get_stems_faders(batch_size, sample_size, reps, warmup, device, maxstems=6):
+    "get_stems_faders pulling stems from a DataLoader over SyntheticStems"
+    from shazbot.train_aa_mixer import get_stems_faders
+    dl = torch.utils.data.DataLoader(SyntheticStems(64*batch_size, sample_size), batch_size=batch_size, shuffle=True)
+    batches = TimedBatches(dl)
+    return time_it(lambda: get_stems_faders(next(batches)[0], batches, maxstems), reps, warmup, items=batch_size)
+
+
+@benchmark('aa_forward')
+def bench_aa_forward(batch_size, sample_size, reps, warmup, device, nstems=3):
+    "AudioAlgebra forward with a tiny random encoder, no gradients"
+    aa_model = _aa_model(sample_size=sample_size, device=device)
+    stems, faders = _stems(batch_size, sample_size, nstems, device)
+    def fn():
+        with torch.no_grad(): aa_model(stems, faders)
+    return {**time_it(fn, reps, warmup, items=batch_size, device=device), 'nstems': nstems}
+
+
+@benchmark('aa_train')
+def bench_aa_train(batch_size, sample_size, reps, warmup, device, nstems=3):
+    "AudioAlgebra forward, loss & backward with a tiny random encoder"
+    aa_model = _aa_model(sample_size=sample_size, device=device)
+    stems, faders = _stems(batch_size, sample_size, nstems, device)
+    def fn():
+        zsum, zmix, archive = aa_model(stems, faders)
+        aa_model.loss(zsum, zmix, archive).backward()
+        aa_model.zero_grad(set_to_none=True)
+    return {**time_it(fn, reps, warmup, items=batch_size, device=device), 'nstems': nstems}
+
+
+@benchmark('ema_update')
+def bench_ema_update(batch_size, sample_size, reps, warmup, device, width=512, depth=8):
+    "ema_update on an MLP of depth width x width layers, about 2M parameters by default"
+    from shazbot.blocks_utils import ema_update, n_params
+    model = nn.Sequential(*[nn.Linear(width, width) for _ in range(depth)]).to(device)
+    model_ema = nn.Sequential(*[nn.Linear(width, width) for _ in range(depth)]).to(device)
+    n = n_params(model)
+    return {**time_it(lambda: ema_update(model, model_ema, 0.999), reps, warmup, items=n, device=device), 'n_params': n}
+
+
+@benchmark('sample')
+def bench_sample(batch_size, sample_size, reps, warmup, device, steps=50, latent_dim=32, hop_length=256):
+    "the DDIM sampler used for demos, with a tiny random decoder"
+    from shazbot.train_aa_mixer import sample
+    decoder = _TinyDecoder(latent_dim).to(device)
+    x = torch.randn(batch_size, 2, sample_size, device=device)
+    z = torch.randn(batch_size, latent_dim, sample_size // hop_length, device=device)
+    return {**time_it(lambda: sample(decoder, x, steps, 1, z), reps, warmup, items=batch_size*steps, device=device), 'steps': steps}
+
+
+@benchmark('decode_long')
+def bench_decode_long(batch_size, sample_size, reps, warmup, device, steps=10, latent_dim=32, hop_length=256, n_windows=4):
+    "decode_long on latents n_windows training windows long, with a tiny random decoder"
+    from shazbot.train_aa_mixer import decode_long
+    decoder = _TinyDecoder(latent_dim).to(device)
+    win_frames = sample_size // hop_length
+    z = torch.randn(1, latent_dim, n_windows * win_frames, device=device)
+    fn = lambda: decode_long(decoder, z, hop_length=hop_length, win_frames=win_frames, overlap_frames=win_frames//8, steps=steps, max_batch=batch_size)
+    return {**time_it(fn, reps, warmup, items=z.shape[-1]*hop_length, device=device), 'steps': steps}
+
+
+@benchmark('batch_it_crazy')
+def bench_batch_it_crazy(batch_size, sample_size, reps, warmup, device, seconds=60, sample_rate=48000):
+    "icebox's batch_it_crazy, chopping seconds of stereo audio into sample_size windows"
+    from shazbot.icebox import batch_it_crazy
+    x = torch.randn(2, seconds * sample_rate, device=device)
+    return time_it(lambda: batch_it_crazy(x, sample_size), reps, warmup, items=x.shape[-1], device=device)
+
+# %% ../nbs/bench.ipynb 11
+def _git(*args, cwd=None):
+    try:
+        return subprocess.run(['git', *args], cwd=cwd, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_info() -> dict:
+    "what a result depends on besides the code: commit, host, versions, threads"
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) if '__file__' in globals() else None
+    commit = _git('rev-parse', 'HEAD', cwd=repo)
+    return {'commit': commit, 'dirty': bool(_git('status', '--porcelain', '--untracked-files=no', cwd=repo)) if commit else None,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'host': socket.gethostname(), 'platform': platform.platform(),
+            'python': platform.python_version(), 'torch': torch.__version__, 'num_threads': torch.get_num_threads(),
+            'cpu_count': os.cpu_count(), 'cuda': torch.cuda.get_device_name() if torch.cuda.is_available() else None}
+
+
+def run_benchmarks(
+    names=None,         # which BENCHMARKS to run; None = all of them
+    out=None,           # JSON file to write the results to
+    batch_size=4,
+    sample_size=2**15,  # samples per training clip
+    reps=10,            # timed calls per benchmark
+    warmup=2,           # untimed calls first
+    device='cpu',
+    print=print,
+    ) -> dict:
+    "runs benchmarks; each one's results, or its error, go under results['benchmarks'][name]"
+    names = list(BENCHMARKS) if names is None else names
+    config = dict(batch_size=batch_size, sample_size=sample_size, reps=reps, warmup=warmup, device=device)
+    results = {'info': run_info(), 'config': config, 'benchmarks': {}}
+    for name in names:
+        torch.manual_seed(0)
+        try:
+            r = BENCHMARKS[name](**config)
+            print(f"{name:>20s}: {1e3*r['median_s']:9.3f} ms/call, {r['items_per_sec']:12.1f} items/sec")
+        except Exception as e:
+            r = {'error': f'{type(e).__name__}: {e}'}
+            print(f"{name:>20s}: failed, {r['error']}")
+        results['benchmarks'][name] = r
+    if out:
+        os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+        with open(out + '.tmp', 'w') as f: json.dump(results, f, indent=1)
+        os.replace(out + '.tmp', out)
+    return results
+
+
+def compare_results(old:dict, new:dict, threshold=0.1, print=print) -> list:
+    "median time ratios new/old for benchmarks in both; ratios beyond 1 +/- threshold are flagged as slower or faster"
+    rows = []
+    print(f"{old['info'].get('commit') or '?'} -> {new['info'].get('commit') or '?'}")
+    for name, n in new['benchmarks'].items():
+        o = old['benchmarks'].get(name)
+        if o is None or 'median_s' not in o or 'median_s' not in n: continue
+        ratio = n['median_s'] / o['median_s']
+        flag = 'slower' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else ''
+        rows.append({'name': name, 'old_s': o['median_s'], 'new_s': n['median_s'], 'ratio': ratio, 'flag': flag})
+        print(f"{name:>20s}: {1e3*o['median_s']:9.3f} -> {1e3*n['median_s']:9.3f} ms  x{ratio:.2f} {flag}")
+    return rows
+
+# %% ../nbs/bench.ipynb 14
+def main():
+    "shazbot_bench [options]: runs the benchmarks and saves the results as JSON"
+    parser = argparse.ArgumentParser(description="Times shazbot's main code paths on synthetic data",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--only', nargs='+', default=None, choices=list(BENCHMARKS), help="benchmarks to run; default: all")
+    parser.add_argument('--out', default=None, help="JSON file for the results; default: bench-<commit>.json")
+    parser.add_argument('--compare', default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change in median time worth flagging")
+    parser.add_argument('--batch_size', type=int, default=4)
+    parser.add_argument('--sample_size', type=int, default=2**15)
+    parser.add_argument('--reps', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--num_threads', type=int, default=None, help="torch threads; default: torch's choice")
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    if args.num_threads: torch.set_num_threads(args.num_threads)
+    out = args.out or f"bench-{(run_info()['commit'] or 'nogit')[:10]}.json"
+    results = run_benchmarks(args.only, out=out, batch_size=args.batch_size, sample_size=args.sample_size,
+                             reps=args.reps, warmup=args.warmup, device=args.device)
+    print(f"Results saved to {out}")
+    if args.compare: compare_results(json.load(open(args.compare)), results, threshold=args.threshold)
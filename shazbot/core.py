@@ -1,8 +1,12 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/core.ipynb.
 
 # %% auto 0
-__all__ = ['is_silence', 'load_audio', 'makedir', 'get_accel_config', 'HostPrinter', 'save', 'n_params', 'freeze', 'Mish_func',
-           'Mish', 'Swish_func', 'Swish']
+__all__ = ['AUDIO_EXTS', 'PRECISION', 'PRECISION_DTYPES', 'PROFILER', 'HEARTBEAT_PHASES', 'is_silence', 'load_audio', 'makedir',
+           'find_audio_files', 'get_accel_config', 'cpus_per_process', 'HostPrinter', 'save', 'n_params', 'freeze',
+           'get_rng_state', 'set_rng_state', 'measure_peak_memory', 'fit_batch_to_memory', 'encode_long',
+           'set_precision', 'precision_for', 'autocast', 'check_precision', 'bake_weight_norm', 'LowPrecision',
+           'quantize_frozen', 'compare_inference', 'StepProfiler', 'set_profiler', 'phase', 'OnDemandTrace',
+           'find_stragglers', 'Heartbeat', 'DeviceMetrics', 'StreamingPCA', 'Mish_func', 'Mish', 'Swish_func', 'Swish']
 
 # %% ../nbs/core.ipynb 3
 import torch
@@ -15,6 +19,17 @@ import tqdm
 from pathlib import Path
 import yaml
 import os
+import math
+import random
+import numpy as np
+import time
+import json
+import signal
+import socket
+import contextlib
+from collections import deque
+from glob import glob
+from copy import deepcopy
 
 # %% ../nbs/core.ipynb 5
 def is_silence(
@@ -50,6 +65,17 @@ def makedir(
     except:                # don't really care about errors
         pass
 
+
+AUDIO_EXTS = ('.wav', '.flac', '.mp3', '.ogg', '.aif', '.aiff')
+
+def find_audio_files(paths) -> list:
+    "paths can be a directory (searched recursively), a text file listing audio files one per line, or a list of files"
+    if isinstance(paths, str) and os.path.isdir(paths):
+        return sorted(f for f in glob(os.path.join(paths, '**', '*'), recursive=True) if f.lower().endswith(AUDIO_EXTS))
+    if isinstance(paths, str):
+        with open(paths) as f: return [line.strip() for line in f if line.strip()]
+    return list(paths)
+
 # %% ../nbs/core.ipynb 9
 def get_accel_config(filename='~/.cache/huggingface/accelerate/default_config.yaml'):
     "get huggingface accelerate config info"
@@ -70,6 +96,15 @@ def get_accel_config(filename='~/.cache/huggingface/accelerate/default_config.ya
 
     return ac
 
+
+def cpus_per_process() -> int:
+    "CPU cores this process can use without fighting the other processes (ranks) of this run on the same machine"
+    try:
+        n = len(os.sched_getaffinity(0))
+    except AttributeError:   # not on Linux
+        n = os.cpu_count() or 1
+    return max(1, n // max(1, int(os.getenv('LOCAL_WORLD_SIZE', 1))))
+
 # %% ../nbs/core.ipynb 11
 class HostPrinter():
     "lil accelerate utility for only printing on host node"
@@ -80,16 +115,17 @@ class HostPrinter():
             print(self.tag + s + self.untag, flush=True)
 
 # %% ../nbs/core.ipynb 14
-def save(accelerator, args, model, opt=None, epoch=None, step=None):
-    "for checkpointing & model saves"
+def save(accelerator, args, model, opt=None, epoch=None, step=None, extra=None):
+    "for checkpointing & model saves. extra: dict of anything else to keep, e.g. sampler & RNG state"
     accelerator.wait_for_everyone()
     filename = f'{args.name}_{step:08}.pth' if (step is not None) else f'{args.name}.pth'
     if accelerator.is_main_process:
-        tqdm.write(f'Saving to {filename}...')
+        tqdm.tqdm.write(f'Saving to {filename}...')
     obj = {'model': accelerator.unwrap_model(model).state_dict() }
     if opt is not None:   obj['opt'] = opt.state_dict()
     if epoch is not None: obj['epoch'] = epoch
     if step is not None:  obj['step'] = step
+    if extra is not None: obj.update(extra)
     accelerator.save(obj, filename)
     
 
@@ -103,7 +139,633 @@ def freeze(model):
     for param in model.parameters():  
         param.requires_grad = False
 
-# %% ../nbs/core.ipynb 16
+
+def get_rng_state(sobol=()) -> dict:
+    "the state of every random number generator we use (Python, numpy, torch, CUDA, and any SobolEngines), for checkpoints"
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state(),
+             'sobol': [{k: v.clone() if torch.is_tensor(v) else v for k, v in vars(e).items()} for e in sobol]}
+    if torch.cuda.is_available(): state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state:dict, sobol=()):
+    "puts back what get_rng_state saved. sobol: the same SobolEngines, in the same order"
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available(): torch.cuda.set_rng_state_all(state['cuda'])
+    for e, s in zip(sobol, state.get('sobol', [])): vars(e).update(s)
+
+# %% ../nbs/core.ipynb 17
+def measure_peak_memory(fn, device) -> int:
+    "runs fn() and returns the peak memory (in bytes) it allocated on a CUDA device, or None on other devices"
+    device = torch.device(device)
+    if device.type != 'cuda': return None
+    torch.cuda.synchronize(device)
+    base = torch.cuda.memory_allocated(device)
+    torch.cuda.reset_peak_memory_stats(device)
+    fn()
+    torch.cuda.synchronize(device)
+    return torch.cuda.max_memory_allocated(device) - base
+
+
+def fit_batch_to_memory(
+    fn,                   # function that processes a batch
+    example,              # one example input with a leading batch dim of 1, e.g. (1, d, n)
+    mem_target=2**30,     # peak memory target in bytes
+    bytes_per_item=None,  # estimate to use where memory can't be measured (i.e. not on CUDA). default: 256x the input size
+    upper=64,             # never go beyond this batch size
+    ) -> int:
+    "largest batch size for fn that keeps peak memory under mem_target. measured from batch sizes 1 & 2 on CUDA, else estimated"
+    with torch.no_grad():
+        peak1 = measure_peak_memory(lambda: fn(example), example.device)
+        peak2 = measure_peak_memory(lambda: fn(torch.cat([example, example])), example.device)
+    if peak1 is not None:
+        per_item, overhead = max(peak2 - peak1, 1), max(2*peak1 - peak2, 0)
+    else:
+        per_item = bytes_per_item if bytes_per_item is not None else 256 * example.numel() * example.element_size()
+        overhead = 0
+    return int(max(1, min(upper, (mem_target - overhead) // per_item)))
+
+
+@torch.inference_mode()
+def encode_long(
+    audio,             # audio to encode, (c, n), of any length n
+    encode_fn,         # maps a batch of windows (b, c, win_len) to latents (b, d, win_len//downsample)
+    win_len=32768,     # window length in samples
+    hop=None,          # hop between windows in samples. default = win_len (no overlap)
+    max_batch=None,    # max windows per encode_fn call. None = choose from mem_target
+    mem_target=2**30,  # peak memory target in bytes, used when max_batch is None
+    ):
+    """Streams long audio through encode_fn in overlapping windows, a bounded number at a time, and
+    stitches the latents back together along time: returns (d, ceil(n/downsample)). Where windows
+    overlap, each keeps only its central frames so every output frame comes from well inside some window"""
+    hop = win_len if hop is None else hop
+    assert 0 < hop <= win_len, f"need 0 < hop <= win_len, got hop={hop}, win_len={win_len}"
+    n = audio.shape[-1]
+    n_windows = 1 + max(0, math.ceil((n - win_len) / hop))
+    audio = F.pad(audio, (0, (n_windows - 1) * hop + win_len - n))   # zero-pad end so windows tile exactly
+    windows = audio.unfold(-1, win_len, hop).transpose(0, 1)        # (n_windows, c, win_len), a view: no copies yet
+
+    if max_batch is None: max_batch = fit_batch_to_memory(encode_fn, windows[:1].contiguous(), mem_target=mem_target)
+    zs = [encode_fn(windows[i:i + max_batch].contiguous()) for i in range(0, n_windows, max_batch)]
+    z = torch.cat(zs)                                                 # (n_windows, d, win_frames)
+
+    win_frames = z.shape[-1]
+    downsample = win_len // win_frames
+    assert hop % downsample == 0, f"hop ({hop}) must be a multiple of the encoder's downsampling factor ({downsample})"
+    hop_frames = hop // downsample
+    trim = (win_frames - hop_frames) // 2
+    pieces = []
+    for i in range(n_windows):
+        start = 0 if i == 0 else trim
+        end = win_frames if i == n_windows - 1 else trim + hop_frames
+        pieces.append(z[i, :, start:end])
+    return torch.cat(pieces, -1)[:, :math.ceil(n / downsample)]
+
+# %% ../nbs/core.ipynb 20
+PRECISION = 'auto'
+PRECISION_DTYPES = {'fp32': None, 'fp16': torch.float16, 'bf16': torch.bfloat16}
+
+def set_precision(
+    precision='auto',  # 'fp32', 'fp16', 'bf16', or 'auto' = fp16 on CUDA, fp32 elsewhere
+    ):
+    "sets the mixed-precision policy used by `autocast`"
+    global PRECISION
+    assert precision == 'auto' or precision in PRECISION_DTYPES, f"unknown precision '{precision}'"
+    PRECISION = precision
+
+def precision_for(device_type:str) -> str:
+    "what the current policy means on a device type: 'fp32', 'fp16' or 'bf16'"
+    if PRECISION != 'auto': return PRECISION
+    return 'fp16' if device_type == 'cuda' else 'fp32'
+
+def autocast(
+    device='cuda',  # a torch.device, device string, or a tensor on the device
+    enabled=True,   # False forces fp32 inside, whatever the policy
+    ):
+    "torch.autocast for device according to the precision policy"
+    if isinstance(device, torch.Tensor): device = device.device
+    device_type = torch.device(device).type
+    dtype = PRECISION_DTYPES[precision_for(device_type)]
+    if dtype is None or not enabled: return torch.autocast(device_type, enabled=False)
+    return torch.autocast(device_type, dtype=dtype)
+
+# %% ../nbs/core.ipynb 22
+def check_precision(
+    fn,                           # function to run, e.g. a model's forward
+    *args,                        # its (tensor) inputs
+    precisions=('fp16', 'bf16'),  # what to compare against fp32
+    repeats=3,                    # timing runs per precision (the best one counts)
+    print=print,
+    ) -> dict:
+    "runs fn under each precision policy; returns the relative error against fp32 and the speedup"
+    device = next(a for a in args if isinstance(a, torch.Tensor)).device
+    old, results = PRECISION, {}
+    try:
+        for p in ('fp32',) + tuple(precisions):
+            set_precision(p)
+            with torch.no_grad(), autocast(device):
+                out = fn(*args).float()           # warmup & output
+                times = []
+                for _ in range(repeats):
+                    t0 = time.time()
+                    fn(*args)
+                    if device.type == 'cuda': torch.cuda.synchronize(device)
+                    times.append(time.time() - t0)
+            if p == 'fp32': ref, ref_time = out, min(times)
+            rel_err = ((out - ref).norm() / ref.norm().clamp(min=1e-12)).item()
+            results[p] = {'rel_err': rel_err, 'max_abs_err': (out - ref).abs().max().item(), 'speedup': ref_time / min(times)}
+            print(f"{p}: rel. error {rel_err:.2e}, speedup {results[p]['speedup']:.2f}x")
+    finally:
+        set_precision(old)
+    return results
+
+# %% ../nbs/core.ipynb 25
+def bake_weight_norm(module:nn.Module) -> nn.Module:
+    "removes weight norm (hooks or parametrizations) in-place, keeping the current weights, so the module can be quantized or traced"
+    for m in list(module.modules()):   # (a copy, since we change the tree)
+        if hasattr(m, 'parametrizations'):
+            # not parametrize.remove_parametrizations: that edits the Parametrized class, which deepcopies share
+            tensors = {name: getattr(m, name).detach().clone() for name in m.parametrizations.keys()}
+            del m._modules['parametrizations']
+            m.__class__ = type(m).__bases__[0]
+            for name, t in tensors.items(): m.register_parameter(name, nn.Parameter(t, requires_grad=False))
+        if any(type(h).__name__ == 'WeightNorm' for h in m._forward_pre_hooks.values()):
+            torch.nn.utils.remove_weight_norm(m)
+    return module
+
+
+def _to_float(out):
+    if isinstance(out, torch.Tensor): return out.float() if out.is_floating_point() else out
+    if isinstance(out, (list, tuple)): return type(out)(_to_float(o) for o in out)
+    return out
+
+
+class LowPrecision(nn.Module):
+    "runs a module with its weights in a lower float dtype: float inputs get cast on the way in, outputs go back to float32"
+    def __init__(self, module, dtype=torch.bfloat16):
+        super().__init__()
+        self.module, self.dtype = module.to(dtype), dtype
+    def forward(self, *args, **kwargs):
+        args = [a.to(self.dtype) if isinstance(a, torch.Tensor) and a.is_floating_point() else a for a in args]
+        return _to_float(self.module(*args, **kwargs))
+
+
+def quantize_frozen(
+    module:nn.Module,  # a frozen module that only needs to run inference
+    mode='int8',       # 'int8', 'fp16' or 'bf16'
+    calib=None,        # for int8: list of example inputs to calibrate static quantization with
+    print=print,
+    ) -> nn.Module:
+    """Low-precision copy of module for CPU inference. int8 is static (convs & linears, calibrated on calib) where the module
+    can be FX-traced, else dynamic for its linear layers; if it has none of those either, we settle for bf16 weights"""
+    assert mode in ('int8', 'fp16', 'bf16'), f"unknown mode '{mode}'"
+    module = bake_weight_norm(deepcopy(module).cpu().eval())
+    if mode != 'int8': return LowPrecision(module, PRECISION_DTYPES[mode]).eval()
+    try:
+        from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+    except ImportError:   # torch.ao.quantization moved to torchao in newer PyTorch
+        print("quantize_frozen: torch.ao.quantization isn't available; using bf16 weights instead of int8")
+        return LowPrecision(module, torch.bfloat16).eval()
+    if calib:
+        try:
+            prepared = prepare_fx(module, get_default_qconfig_mapping(), example_inputs=(calib[0],))
+            with torch.inference_mode():
+                for x in calib: prepared(x)
+            return convert_fx(prepared)
+        except Exception as e:
+            print(f"quantize_frozen: static int8 didn't work for {type(module).__name__} ({type(e).__name__}); trying dynamic")
+    if any(isinstance(m, (nn.Linear, nn.LSTM, nn.GRU)) for m in module.modules()):
+        return quantize_dynamic(module, {nn.Linear, nn.LSTM, nn.GRU}, dtype=torch.qint8)
+    print(f"quantize_frozen: nothing in {type(module).__name__} can be int8 without calibration; using bf16 weights")
+    return LowPrecision(module, torch.bfloat16).eval()
+
+
+def compare_inference(
+    ref_fn,       # reference, e.g. the fp32 model
+    fn,           # low-precision version
+    *args,        # inputs for both
+    repeats=3,    # timing runs (the best one counts)
+    print=print,
+    ) -> dict:
+    """Error & speedup of fn against ref_fn, run under inference_mode. For float outputs the error is relative (L2),
+    for integer outputs (e.g. codebook indices) it's the fraction of entries that changed"""
+    def flat(out):
+        out = out if isinstance(out, (list, tuple)) else [out]
+        return torch.cat([o.flatten() for o in out if isinstance(o, torch.Tensor)])
+    times = {}
+    with torch.inference_mode():
+        for name, f in (('ref', ref_fn), ('fn', fn)):
+            out = flat(f(*args))
+            t = []
+            for _ in range(repeats):
+                t0 = time.time()
+                f(*args)
+                t.append(time.time() - t0)
+            times[name] = min(t)
+            if name == 'ref': ref = out
+    if ref.is_floating_point():
+        res = {'rel_err': ((out.float() - ref).norm() / ref.norm().clamp(min=1e-12)).item()}
+    else:
+        res = {'mismatch': (out != ref).float().mean().item()}
+    res['speedup'] = times['ref'] / times['fn']
+    print(', '.join(f"{k} {v:.3g}" for k, v in res.items()))
+    return res
+
+# %% ../nbs/core.ipynb 28
+class StepProfiler():
+    "named, nestable phase timers for a training loop, with rolling percentiles; cheap enough to leave on"
+    def __init__(self,
+        sync=False,      # synchronize the (CUDA) device around each phase, for accurate per-phase GPU times
+        device=None,     # the device to synchronize
+        window=200,      # number of recent steps the percentiles are over
+        jsonl=None,      # optional file to append every step's phase times (ms) to, one JSON object per line
+        enabled=True,    # False makes every call a no-op
+        ):
+        self.sync = sync and device is not None and torch.device(device).type == 'cuda'
+        self.device, self.window, self.enabled = device, window, enabled
+        self.jsonl = open(jsonl, 'a') if (jsonl and enabled) else None
+        self.history, self.current, self.n_steps = {}, {}, 0   # phase -> recent step times; this step's times (s)
+        self._stack, self._t, self.t_step = [], None, time.perf_counter()
+
+    def _charge(self, now):
+        "adds the time since the last event to the innermost open phase"
+        if self._stack: self.current[self._stack[-1]] = self.current.get(self._stack[-1], 0.0) + now - self._t
+        self._t = now
+
+    @contextlib.contextmanager
+    def phase(self, name:str):
+        "times the with-block as phase name (minus any phases nested in it)"
+        if not self.enabled:
+            yield
+            return
+        if self.sync: torch.cuda.synchronize(self.device)
+        self._charge(time.perf_counter())
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            if self.sync: torch.cuda.synchronize(self.device)
+            self._charge(time.perf_counter())
+            self._stack.pop()
+
+    def iterate(self, iterable, name='data'):
+        "wraps an iterable, e.g. a DataLoader, so that waiting for each item counts as phase name"
+        it = iter(iterable)
+        while True:
+            with self.phase(name):
+                try: item = next(it)
+                except StopIteration: return
+            yield item
+
+    def step(self, step=None) -> dict:
+        "ends a step: records its phase times and total (in ms) and returns them"
+        if not self.enabled: return {}
+        now = time.perf_counter()
+        times = {k: 1000 * v for k, v in self.current.items()}
+        times['total'] = 1000 * (now - self.t_step)
+        times['other'] = max(0.0, times['total'] - sum(v for k, v in times.items() if k != 'total'))
+        for k in set(self.history) | set(times):   # phases that didn't happen this step count as 0
+            self.history.setdefault(k, deque(maxlen=self.window)).append(times.get(k, 0.0))
+        if self.jsonl:
+            self.jsonl.write(json.dumps({'step': self.n_steps if step is None else step, **{k: round(v, 3) for k, v in times.items()}}) + '\n')
+            if self.n_steps % 100 == 0: self.jsonl.flush()
+        self.current, self.t_step, self.n_steps = {}, now, self.n_steps + 1
+        return times
+
+    def stats(self, percentiles=(50, 90, 99)) -> dict:
+        "rolling {phase: {'mean': ms, 'p50': ms, ...}} over the last `window` steps"
+        out = {}
+        for k, h in self.history.items():
+            v = sorted(h)
+            out[k] = {'mean': sum(v) / len(v), **{f'p{p}': v[min(len(v) - 1, int(p / 100 * len(v)))] for p in percentiles}}
+        return out
+
+    def log_dict(self, prefix='time/') -> dict:
+        "the stats flattened for wandb.log, e.g. {'time/encode_p50_ms': 12.3, ...}"
+        return {f'{prefix}{k}_{s}_ms': v for k, st in self.stats().items() for s, v in st.items()}
+
+    def breakdown(self) -> str:
+        "one line with the mean step time and each phase's share of it, biggest first"
+        st = self.stats()
+        if 'total' not in st: return "no steps timed yet"
+        total = st['total']['mean']
+        parts = sorted(((v['mean'], k) for k, v in st.items() if k != 'total'), reverse=True)
+        return f"step {total:.1f} ms (p99 {st['total']['p99']:.1f}): " + ", ".join(f"{k} {m:.1f} ({m / max(total, 1e-9):.0%})" for m, k in parts)
+
+    def close(self):
+        if self.jsonl: self.jsonl.close()
+
+
+PROFILER = None   # the StepProfiler that phase() reports to, if any
+_NO_PHASE = contextlib.nullcontext()
+
+def set_profiler(profiler:StepProfiler=None):
+    "installs profiler (None to remove) as the one phase() reports to"
+    global PROFILER
+    PROFILER = profiler
+
+def phase(name:str):
+    "context manager timing a phase on the installed StepProfiler; does nothing if there's none"
+    return _NO_PHASE if PROFILER is None else PROFILER.phase(name)
+
+# %% ../nbs/core.ipynb 32
+class OnDemandTrace():
+    "records a bounded torch.profiler trace of the next few steps when triggered by a signal, a sentinel file, or request()"
+    def __init__(self,
+        trace_dir='traces',      # where the Chrome traces go
+        steps=5,                 # steps per trace
+        sentinel=None,           # file to watch; touching it starts a trace. default: trace_dir/TRACE
+        signum=getattr(signal, 'SIGUSR2', None),  # signal that starts a trace; None = don't install a handler
+        check_every=10,          # look at the sentinel every this many steps
+        memory=True,             # record memory allocations
+        stack=True,              # record Python stacks
+        rank=0,                  # goes into the trace file names
+        print=print,
+        ):
+        self.trace_dir, self.steps, self.check_every, self.memory, self.stack, self.rank, self.print = trace_dir, steps, check_every, memory, stack, rank, print
+        self.sentinel = sentinel or os.path.join(trace_dir, 'TRACE')
+        self.seen = self._mtime()                 # a sentinel left over from before doesn't count
+        self.requested, self.prof, self.n_steps, self.left, self.last_path = 0, None, 0, 0, None
+        self.signum, self.old_handler = None, None
+        if signum is not None:
+            try:
+                self.old_handler = signal.signal(signum, lambda *_: self.request())
+                self.signum = signum
+            except ValueError:                    # not the main thread: the sentinel file still works
+                pass
+
+    def _mtime(self):
+        try: return os.stat(self.sentinel).st_mtime_ns
+        except OSError: return None
+
+    def request(self, steps=None):
+        "trace the next `steps` steps (default: self.steps); safe to call from a signal handler"
+        self.requested = steps or self.steps
+
+    def _check_sentinel(self):
+        mtime = self._mtime()
+        if mtime is None or mtime == self.seen: return
+        self.seen = mtime
+        try:
+            with open(self.sentinel) as f: n = f.read().strip()
+            self.request(int(n) if n.isdigit() else None)
+        except OSError:
+            self.request()
+
+    def step(self, step=None):
+        "call at the end of every step: starts, advances or finishes a trace as needed"
+        self.n_steps += 1
+        if self.prof is not None:
+            self.left -= 1
+            if self.left <= 0: self._finish()
+            return
+        if self.check_every and self.n_steps % self.check_every == 0: self._check_sentinel()
+        if self.requested: self._start(self.n_steps if step is None else step)
+
+    def _start(self, step):
+        activities = [torch.profiler.ProfilerActivity.CPU] + ([torch.profiler.ProfilerActivity.CUDA] if torch.cuda.is_available() else [])
+        self.prof = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=self.memory, with_stack=self.stack)
+        self.prof.start()
+        self.left, self.requested, self.start_step = self.requested, 0, step + 1
+        self.print(f"OnDemandTrace: tracing the next {self.left} steps")
+
+    def _finish(self):
+        self.prof.stop()
+        os.makedirs(self.trace_dir, exist_ok=True)
+        path = os.path.join(self.trace_dir, f"trace_rank{self.rank}_step{self.start_step}.json")
+        self.prof.export_chrome_trace(path)
+        self.print(f"OnDemandTrace: wrote {path}\n" + self.prof.key_averages().table(sort_by='self_cpu_time_total', row_limit=10))
+        self.prof, self.last_path = None, path
+
+    def close(self):
+        "finishes any trace in progress, and puts the old signal handler back"
+        if self.prof is not None: self._finish()
+        if self.signum is not None:
+            signal.signal(self.signum, self.old_handler)
+            self.signum = None
+
+# %% ../nbs/core.ipynb 36
+HEARTBEAT_PHASES = ('data', 'stems', 'forward', 'encode', 'reembed', 'loss', 'backward', 'opt_step', 'log', 'demo', 'save', 'other')
+_SYS_KEYS = ('cpu_per_wall', 'load_per_core', 'iowait', 'steal')
+
+def _proc_stat():
+    "system-wide CPU time counters from /proc/stat: (total, iowait, steal), or None where there's no /proc"
+    try:
+        with open('/proc/stat') as f: v = [int(x) for x in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    return sum(v[:8]), v[4], (v[7] if len(v) > 7 else 0)
+
+def find_stragglers(
+    beats:list,           # one heartbeat dict per rank, as made by Heartbeat
+    threshold=1.5,        # flag a phase taking more than this times the other ranks' median...
+    min_ms=5.0,           # ...and at least this many ms more
+    wait_phases=('backward', 'save'),  # phases with the collectives, where ranks wait for each other; never flagged
+    data_phases=('data', 'stems'),
+    ) -> list:
+    """flags ranks whose phases take much longer than on the other ranks, with a guess at the cause. Also flags
+    phase 'compute', the step time minus wait & data phases, when that's slow but none of its phases are on their own"""
+    flags = []
+    if len(beats) < 2: return flags
+    compute_ms = lambda b: b['step_ms'] - sum(ms for p, ms in b['phases'].items() if p in wait_phases or p in data_phases)
+    def is_slow(ms, others):
+        med = sorted(others)[len(others) // 2]
+        return med, ms > threshold * med and ms - med >= min_ms
+    for b in beats:
+        others = [o for o in beats if o['rank'] != b['rank']]
+        cpu_cause = 'throttled CPU' if (b['steal'] > 0.05 or b['load_per_core'] > 1.0) else 'slow compute'
+        flagged_compute = False
+        for p, ms in b['phases'].items():
+            if p in wait_phases: continue
+            med, slow = is_slow(ms, [o['phases'].get(p, 0.0) for o in others])
+            if not slow: continue
+            if p in data_phases:
+                cause = 'slow disk' if b['iowait'] > 0.1 else 'data-starved'
+            else:
+                cause, flagged_compute = cpu_cause, True
+            flags.append({'rank': b['rank'], 'phase': p, 'ms': ms, 'median_ms': med, 'cause': cause})
+        med, slow = is_slow(compute_ms(b), [compute_ms(o) for o in others])
+        if slow and not flagged_compute:
+            flags.append({'rank': b['rank'], 'phase': 'compute', 'ms': compute_ms(b), 'median_ms': med, 'cause': cpu_cause})
+    return sorted(flags, key=lambda f: f['median_ms'] - f['ms'])
+
+# %% ../nbs/core.ipynb 37
+class Heartbeat():
+    "every few steps, each rank's step time, phase breakdown & load: written to a local file, and gathered to flag stragglers"
+    def __init__(self,
+        profiler:StepProfiler=None, # where the phase times come from; None = step times only
+        every=50,                 # steps between heartbeats. 0 = off
+        heartbeat_dir=None,       # directory for the per-rank rank<N>.json files; None = no files
+        phases=HEARTBEAT_PHASES,  # phases to report. must be the same on every rank
+        threshold=1.5, min_ms=5.0, # see find_stragglers
+        device='cpu',             # device for the gather, e.g. accelerator.device (NCCL needs a GPU tensor)
+        print=print,              # print function. stragglers get printed on rank 0 only
+        ):
+        dist = torch.distributed
+        self.distributed = dist.is_available() and dist.is_initialized()
+        self.rank = dist.get_rank() if self.distributed else 0
+        self.world_size = dist.get_world_size() if self.distributed else 1
+        self.profiler, self.every, self.phases, self.device, self.print = profiler, every, tuple(phases), device, print
+        self.threshold, self.min_ms = threshold, min_ms
+        self.path = os.path.join(heartbeat_dir, f'rank{self.rank}.json') if heartbeat_dir else None
+        if self.path: os.makedirs(heartbeat_dir, exist_ok=True)
+        self.host, self.n, self.n_last = socket.gethostname(), 0, 0
+        self.t_last, self.cpu_last, self.stat_last = time.perf_counter(), sum(os.times()[:2]), _proc_stat()
+        self.last, self.beats, self.stragglers = None, [], []
+
+    def step(self, step=None):
+        "call once per step, on every rank. every `every` steps, beats; returns all ranks' heartbeats then, else None"
+        self.n += 1
+        if self.every <= 0 or self.n % self.every: return None
+        return self.beat(self.n if step is None else step)
+
+    def _measure(self, step) -> dict:
+        now, cpu, stat = time.perf_counter(), sum(os.times()[:2]), _proc_stat()
+        n, wall = max(1, self.n - self.n_last), max(1e-9, now - self.t_last)
+        phases = {}
+        for p in self.phases:
+            h = list(self.profiler.history.get(p, ())) if self.profiler is not None else []
+            h = h[-n:]
+            phases[p] = sum(h) / len(h) if h else 0.0
+        iowait = steal = 0.0
+        if stat is not None and self.stat_last is not None and stat[0] > self.stat_last[0]:
+            dt = stat[0] - self.stat_last[0]
+            iowait, steal = (stat[1] - self.stat_last[1]) / dt, (stat[2] - self.stat_last[2]) / dt
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            load = 0.0
+        beat = {'rank': self.rank, 'step': step, 'step_ms': 1000 * wall / n, 'phases': phases,
+                'cpu_per_wall': (cpu - self.cpu_last) / wall, 'load_per_core': load, 'iowait': iowait, 'steal': steal}
+        self.n_last, self.t_last, self.cpu_last, self.stat_last = self.n, now, cpu, stat
+        return beat
+
+    def _gather(self, beat) -> list:
+        if not self.distributed: return [beat]
+        row = torch.tensor([beat['rank'], beat['step'], beat['step_ms'], *beat['phases'].values(), *[beat[k] for k in _SYS_KEYS]],
+                           dtype=torch.float64, device=self.device)
+        rows = [torch.empty_like(row) for _ in range(self.world_size)]
+        torch.distributed.all_gather(rows, row)
+        beats = []
+        for r in torch.stack(rows).cpu().tolist():
+            ph, sys_ = r[3:3 + len(self.phases)], r[3 + len(self.phases):]
+            beats.append({'rank': int(r[0]), 'step': int(r[1]), 'step_ms': r[2], 'phases': dict(zip(self.phases, ph)), **dict(zip(_SYS_KEYS, sys_))})
+        return beats
+
+    def beat(self, step) -> list:
+        "measures, writes this rank's file, gathers everyone's heartbeats and flags stragglers. a collective: call on every rank"
+        self.last = self._measure(step)
+        self.beats = self._gather(self.last)
+        self.stragglers = find_stragglers(self.beats, self.threshold, self.min_ms)
+        if self.path:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({**self.last, 'host': self.host, 'pid': os.getpid(), 'time': time.time(), 'stragglers': self.stragglers}, f)
+            os.replace(tmp, self.path)   # so a reader never sees half a file
+        if self.rank == 0:
+            for s in self.stragglers:
+                self.print(f"Straggler at step {step}: rank {s['rank']} spends {s['ms']:.1f} ms/step in {s['phase']} "
+                           f"vs. {s['median_ms']:.1f} ms on the others ({s['cause']}?)")
+        return self.beats
+
+    def log_dict(self, prefix='heartbeat/') -> dict:
+        "a summary of the last gathered heartbeats, for wandb.log"
+        if not self.beats: return {}
+        out = {f'{prefix}stragglers': len(self.stragglers), f'{prefix}step_ms': max(b['step_ms'] for b in self.beats)}
+        for p in self.phases: out[f'{prefix}{p}_max_ms'] = max(b['phases'][p] for b in self.beats)
+        return out
+
+    def describe(self) -> str:
+        "one line about this rank and its last heartbeat, e.g. for an error message"
+        s = f"rank {self.rank}/{self.world_size} on {self.host} (pid {os.getpid()})"
+        if self.last is None: return s + ": no heartbeat yet"
+        top = sorted(self.last['phases'].items(), key=lambda kv: -kv[1])[:3]
+        return (s + f": last heartbeat at step {self.last['step']}, {time.perf_counter() - self.t_last:.0f} s ago, "
+                f"{self.last['step_ms']:.1f} ms/step (" + ", ".join(f"{k} {v:.1f}" for k, v in top) + ")")
+
+# %% ../nbs/core.ipynb 41
+class DeviceMetrics():
+    "accumulates scalar metrics on the device, and syncs them to the host only every `every` steps"
+    def __init__(self,
+        every=25,     # steps between flushes. 0 = never due
+        ):
+        self.every = every
+        self.sums, self.counts = {}, {}
+
+    def add(self, **metrics):
+        "adds one value per metric: 0-dim tensors (which stay on the device) or plain numbers"
+        for k, v in metrics.items():
+            if torch.is_tensor(v): v = v.detach().float()
+            self.sums[k] = v if k not in self.sums else self.sums[k] + v
+            self.counts[k] = self.counts.get(k, 0) + 1
+
+    def due(self, step:int) -> bool:
+        "whether it's time to flush at this step"
+        return self.every > 0 and step % self.every == 0 and len(self.counts) > 0
+
+    def flush(self) -> dict:
+        "returns the mean of each metric since the last flush, as floats, and starts over"
+        keys = [k for k, v in self.sums.items() if torch.is_tensor(v)]
+        values = dict(zip(keys, torch.stack([self.sums[k] for k in keys]).tolist())) if keys else {}  # the one sync
+        out = {k: values.get(k, v) / self.counts[k] for k, v in self.sums.items()}
+        self.sums, self.counts = {}, {}
+        return out
+
+# %% ../nbs/core.ipynb 45
+class StreamingPCA():
+    "PCA of a stream of vectors in fixed memory: a running mean & covariance, updated on the device"
+    def __init__(self,
+        k=3,          # number of components to project onto
+        decay=1.0,    # weight kept by the statistics so far at each update. 1 = remember everything
+        ):
+        self.k, self.decay = k, decay
+        self.n, self.mean, self.m2 = 0.0, None, None   # weight, mean & scatter matrix of everything seen
+        self.basis = None
+
+    @torch.no_grad()
+    def update(self, x):
+        "adds a batch of vectors, x: (..., d). no host sync"
+        x = x.detach().float().reshape(-1, x.shape[-1])
+        nb, mb = x.shape[0], x.mean(0)
+        xc = x - mb
+        m2b = xc.T @ xc
+        if self.mean is None:
+            self.n, self.mean, self.m2 = float(nb), mb, m2b
+            return self
+        n = self.n * self.decay
+        delta = mb - self.mean
+        self.mean = self.mean + delta * (nb / (n + nb))
+        self.m2 = self.m2 * self.decay + m2b + torch.outer(delta, delta) * (n * nb / (n + nb))
+        self.n = n + nb
+        return self
+
+    def components(self):
+        "the top k principal axes as columns, (d, k), with signs kept consistent from call to call"
+        cov = (self.m2 / self.n).double().cpu()
+        evals, evecs = torch.linalg.eigh(cov)   # ascending
+        V = evecs[:, -self.k:].flip(-1)
+        if self.basis is None:  # first time: make each axis' biggest entry positive
+            signs = V.gather(0, V.abs().argmax(0, keepdim=True)).sign()
+        else:                   # afterwards: point the same way as last time
+            signs = (V * self.basis.double().cpu()).sum(0).sign()
+        V = V * torch.where(signs == 0, torch.ones_like(signs), signs)
+        self.explained = (evals.flip(-1)[:self.k] / evals.sum().clamp(min=1e-12)).tolist()
+        self.basis = V.float().to(self.mean.device)
+        return self.basis
+
+    @torch.no_grad()
+    def project(self,
+        x,              # vectors to project, (..., d)
+        refresh=True,   # recompute the axes from all the data so far; False = reuse the last ones
+        ):
+        "projects x onto the principal axes, (..., k)"
+        V = self.components() if refresh or self.basis is None else self.basis
+        return (x.detach().float() - self.mean) @ V
+
+# %% ../nbs/core.ipynb 49
 # cf https://github.com/tyunist/memory_efficient_mish_swish
 class Mish_func(torch.autograd.Function):
     @staticmethod
@@ -2,7 +2,7 @@
 
 # %% auto 0
 __all__ = ['PadCrop', 'PhaseFlipper', 'FillTheNoise', 'RandPool', 'NormInputs', 'Mono', 'Stereo', 'RandomGain',
-           'MultiStemDataset']
+           'MultiStemDataset', 'ResumableSampler']
 
 # %% ../nbs/data.ipynb 2
 import torch
@@ -13,9 +13,11 @@ from torchaudio import transforms as T
 import random
 from glob import glob
 import os
+import hashlib
 import tqdm
 from multiprocessing import Pool, cpu_count, Barrier
 from functools import partial
+from .core import cpus_per_process
 
 # %% ../nbs/data.ipynb 4
 class PadCrop(nn.Module):
@@ -128,6 +130,7 @@ class MultiStemDataset(torch.utils.data.Dataset):
     for path in paths:   # get a list of relevant filenames
       for ext in ['wav','flac','ogg','aiff','aif','mp3']:
         self.filenames += glob(f'{path}/**/*.{ext}', recursive=True)
+    self.filenames = sorted(self.filenames)   # same order every run, so a resumed run sees the same data order
 
     self.sr = global_args.sample_rate
     if hasattr(global_args,'load_frac'):
@@ -140,6 +143,7 @@ class MultiStemDataset(torch.utils.data.Dataset):
     self.num_gpus = global_args.num_gpus
 
     self.cache_training_data = global_args.cache_training_data
+    self.cache_dir = getattr(global_args, 'data_cache_dir', '') or None   # where to keep the preloaded audio between runs
 
     if self.cache_training_data: self.preload_files()
 
@@ -168,12 +172,32 @@ class MultiStemDataset(torch.utils.data.Dataset):
       start, stop = 0, len(self.filenames)//self.num_gpus
       return start, stop
 
+  def cache_file(self, start, stop):
+    "file in cache_dir for the preloaded audio of files start:stop. its name changes if any of them (or the sample rate) does"
+    h = hashlib.sha256(str(self.sr).encode())
+    for f in self.filenames[start:stop]:
+      st = os.stat(f)
+      h.update(f"|{os.path.abspath(f)}|{st.st_size}|{st.st_mtime_ns}".encode())
+    return os.path.join(self.cache_dir, f'stems-{h.hexdigest()[:16]}.pt')
+
   def preload_files(self):
+      start, stop = self.get_data_range()
+      cache_file = self.cache_file(start, stop) if self.cache_dir else None
+      if cache_file and os.path.exists(cache_file):
+        print(f"Loading {stop-start} cached input audio files from {cache_file}")
+        try:   # memory-mapped, so this takes seconds and pages the audio in as it's used
+          self.audio_files = torch.load(cache_file, mmap=True, weights_only=True)
+        except TypeError:   # older torch
+          self.audio_files = torch.load(cache_file)
+        return
       print(f"Caching {self.n_files} input audio files:")
       wrapper = partial(self.load_file_ind, self.filenames)
-      start, stop = self.get_data_range()
-      with Pool(processes=cpu_count()) as p:   # //8 to avoid FS bottleneck and/or too many processes (b/c * num_gpus)
+      with Pool(processes=cpus_per_process()) as p:   # this rank's share of the cores, not all of them for every rank
         self.audio_files = list(tqdm.tqdm(p.imap(wrapper, range(start,stop)), total=stop-start))
+      if cache_file:
+        makedirs(self.cache_dir, exist_ok=True)
+        torch.save(self.audio_files, cache_file + '.tmp')
+        os.replace(cache_file + '.tmp', cache_file)   # so a crash mid-save can't leave a broken cache
 
   def __len__(self):
     return len(self.filenames)
@@ -201,3 +225,41 @@ class MultiStemDataset(torch.utils.data.Dataset):
      # print(f'Couldn\'t load file {audio_filename}: {e}')
       return self[random.randrange(len(self))]
 
+
+# %% ../nbs/data.ipynb 8
+class ResumableSampler(torch.utils.data.Sampler):
+    "shuffled sampler whose order is a function of (seed, epoch), so it can pick up mid-epoch from a checkpoint"
+    def __init__(self,
+        n:int,          # number of samples in the dataset
+        seed=0,         # same seed, same order every time
+        shuffle=True,   # False = in order
+        ):
+        self.n, self.seed, self.shuffle = n, seed, shuffle
+        self.epoch, self.start, self.consumed = 0, 0, 0
+
+    def set_epoch(self, epoch:int):
+        "starts epoch (from the beginning), unless it's already the current one"
+        if epoch != self.epoch: self.epoch, self.start, self.consumed = epoch, 0, 0
+
+    def order(self) -> list:
+        "this epoch's sample order"
+        if not self.shuffle: return list(range(self.n))
+        return torch.randperm(self.n, generator=torch.Generator().manual_seed(self.seed + 100003 * self.epoch)).tolist()
+
+    def __iter__(self):
+        start, self.start = self.start, 0   # only the first pass after a resume skips ahead
+        return iter(self.order()[start:])
+
+    def __len__(self): return self.n - self.start
+
+    def advance(self, n_samples:int):
+        "records that the training loop has used n_samples more samples of this epoch"
+        self.consumed += n_samples
+
+    def state_dict(self) -> dict:
+        return {'seed': self.seed, 'epoch': self.epoch, 'consumed': self.consumed}
+
+    def load_state_dict(self, state:dict):
+        "resume where state left off: the next pass starts after the samples already used"
+        self.seed, self.epoch = state['seed'], state['epoch']
+        self.consumed = self.start = min(state['consumed'], self.n)
@@ -0,0 +1,333 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/embed.ipynb.
+
+# %% auto 0
+__all__ = ['POOLS', 'EmbeddingStore', 'chunk_audio', 'pool_frames', 'embed_audio', 'load_stereo', 'EmbedFiles', 'embed_files',
+           'main']
+
+# %% ../nbs/embed.ipynb 3
+import os
+import json
+import math
+import time
+import argparse
+from glob import glob
+import numpy as np
+import torch
+import librosa
+import tqdm
+from .core import find_audio_files, OnDemandTrace
+from .data import Stereo
+from .inference import load_embedder
+
+# %% ../nbs/embed.ipynb 5
+class EmbeddingStore():
+    "append-only, memory-mapped store of float16 vectors, with an id/path/offset index"
+    def __init__(self,
+        root:str,         # directory for the store
+        dim:int=None,     # vector size; only needed to create a new store
+        shard:int=None,   # which shard to append to; None = read-only
+        meta:dict=None,   # extra info to save with a new store, e.g. chunking & pooling settings
+        ):
+        self.root, self.shard, self._rows = root, shard, {}
+        meta_file = os.path.join(root, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file) as f: self.meta = json.load(f)
+            assert dim is None or dim == self.meta['dim'], f"store {root} has dim {self.meta['dim']}, not {dim}"
+        else:
+            assert dim is not None, f"there's no store at {root}, and making one needs a dim"
+            os.makedirs(root, exist_ok=True)
+            self.meta = {'dim': dim, 'dtype': 'float16', **(meta or {})}
+            tmp = f"{meta_file}.{os.getpid()}"
+            with open(tmp, 'w') as f: json.dump(self.meta, f)
+            os.replace(tmp, meta_file)   # other writers may be doing the same right now
+        self.dim = self.meta['dim']
+        if shard is not None: self._repair(shard)
+
+    def _files(self, shard):
+        return os.path.join(self.root, f'vectors-{shard:03d}.f16'), os.path.join(self.root, f'index-{shard:03d}.jsonl')
+
+    def _repair(self, shard):
+        "cuts off whatever a killed run left past the last complete index row"
+        vec_file, index_file = self._files(shard)
+        for f in (vec_file, index_file): open(f, 'ab').close()
+        with open(index_file, 'rb+') as f:
+            data = f.read()
+            f.truncate(data.rfind(b'\n') + 1)
+        n = len(self.rows(shard))
+        assert os.path.getsize(vec_file) >= 2 * n * self.dim, f"{vec_file} is missing vectors for its index"
+        with open(vec_file, 'rb+') as f: f.truncate(2 * n * self.dim)
+
+    def shards(self) -> list:
+        return sorted(int(f[-9:-6]) for f in glob(os.path.join(self.root, 'index-*.jsonl')))
+
+    def rows(self, shard) -> list:
+        "the index rows of one shard (re-read only when the shard has grown)"
+        index_file = self._files(shard)[1]
+        size = os.path.getsize(index_file)
+        if self._rows.get(shard, (None,))[0] != size:
+            with open(index_file) as f:
+                lines = f.read().split('\n')[:-1]   # a partly-written last line has no '\n' yet
+            self._rows[shard] = (size, [json.loads(line) for line in lines])
+        return self._rows[shard][1]
+
+    def shard_vectors(self, shard):
+        "one shard's vectors as a read-only (n, dim) float16 memmap"
+        n = len(self.rows(shard))
+        if n == 0: return np.zeros((0, self.dim), dtype=np.float16)
+        return np.memmap(self._files(shard)[0], dtype=np.float16, mode='r', shape=(n, self.dim))
+
+    def add(self,
+        path:str,      # source file of the vectors
+        vectors,       # (k, dim) tensor or array
+        offsets,       # k start times in seconds
+        durs,          # k durations in seconds
+        ) -> list:
+        "appends one file's vectors; returns their ids"
+        assert self.shard is not None, "this store was opened read-only"
+        if torch.is_tensor(vectors): vectors = vectors.detach().float().cpu().numpy()
+        vectors = np.ascontiguousarray(vectors, dtype=np.float16)
+        assert vectors.ndim == 2 and vectors.shape[1] == self.dim, f"expected vectors of shape (k, {self.dim}), got {vectors.shape}"
+        vec_file, index_file = self._files(self.shard)
+        row0 = len(self.rows(self.shard))
+        ids = [(self.shard << 32) + row0 + k for k in range(len(vectors))]
+        with open(vec_file, 'ab') as f: f.write(vectors.tobytes())
+        with open(index_file, 'a') as f:
+            f.write(''.join(json.dumps({'id': i, 'path': path, 'offset': round(float(o), 4), 'dur': round(float(d), 4)}) + '\n'
+                            for i, o, d in zip(ids, offsets, durs)))
+        return ids
+
+    def __len__(self): return sum(len(self.rows(s)) for s in self.shards())
+
+    @property
+    def index(self) -> list:
+        "all index rows, shard by shard"
+        return [row for s in self.shards() for row in self.rows(s)]
+
+    @property
+    def vectors(self):
+        "all vectors (n, dim), in the order of `index`: a memmap if there's one shard, else concatenated in memory"
+        shards = self.shards()
+        if len(shards) == 1: return self.shard_vectors(shards[0])
+        return np.concatenate([self.shard_vectors(s) for s in shards]) if shards else np.zeros((0, self.dim), dtype=np.float16)
+
+    def iter_batches(self, batch_size=65536):
+        "yields (ids, vectors) in blocks of up to batch_size rows, straight from the memmaps"
+        for s in self.shards():
+            rows, vecs = self.rows(s), self.shard_vectors(s)
+            for b in range(0, len(rows), batch_size):
+                yield np.array([r['id'] for r in rows[b:b+batch_size]], dtype=np.int64), vecs[b:b+batch_size]
+
+    def get(self, ids) -> np.ndarray:
+        "vectors (k, dim) for a list of ids, as float32"
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.zeros((len(ids), self.dim), dtype=np.float32)
+        for s in np.unique(ids >> 32):
+            sel = (ids >> 32) == s
+            out[sel] = self.shard_vectors(int(s))[ids[sel] & 0xffffffff]
+        return out
+
+    def done_paths(self) -> set:
+        "paths that already have vectors in the store, in any shard"
+        return {row['path'] for row in self.index}
+
+# %% ../nbs/embed.ipynb 7
+POOLS = ('mean', 'max', 'none')
+
+def chunk_audio(
+    audio,             # (2, n)
+    chunk:int=None,    # chunk length in samples; None = the whole clip in one chunk
+    hop:int=None,      # samples between chunk starts; default = chunk, i.e. no overlap
+    multiple:int=1,    # round chunk up to a multiple of this, e.g. the encoder's hop length
+    ) -> tuple:
+    "cuts audio into chunks (k, 2, chunk), zero-padding the last; also returns each chunk's start & length (of real audio) in samples"
+    n = audio.shape[-1]
+    chunk = math.ceil(max(chunk or n, 1) / multiple) * multiple
+    hop = hop or chunk
+    starts = [i * hop for i in range(1 + max(0, math.ceil((n - chunk) / hop)))]
+    chunks = audio.new_zeros([len(starts), audio.shape[0], chunk])
+    for k, s in enumerate(starts): chunks[k, :, :min(chunk, n - s)] = audio[:, s:s+chunk]
+    return chunks, starts, [min(chunk, n - s) for s in starts]
+
+
+def pool_frames(
+    z,                 # latents for one chunk, (n_frames, d)
+    n_valid:int,       # how many of the frames cover real audio
+    pool='mean',       # one of POOLS
+    ):
+    "pools a chunk's frames into vectors: (1, d) for mean or max, (n_valid, d) for none"
+    z = z[:max(n_valid, 1)]
+    if pool == 'mean': return z.mean(0, keepdim=True)
+    if pool == 'max':  return z.amax(0, keepdim=True)
+    if pool == 'none': return z
+    raise ValueError(f"pool should be one of {POOLS}, not {pool!r}")
+
+
+def _chunk_vectors(z, start, length, hop_length, sample_rate, pool):
+    "vectors for one chunk's latents z, with their offsets & durations in seconds"
+    n_valid = math.ceil(length / hop_length)
+    v = pool_frames(z, n_valid, pool)
+    if pool != 'none': return v, [start / sample_rate], [length / sample_rate]
+    return v, [(start + f * hop_length) / sample_rate for f in range(len(v))], [hop_length / sample_rate] * len(v)
+
+
+def _model_settings(model, sample_rate=None, hop_length=None) -> tuple:
+    "sample_rate & hop_length as given, or else from the model's metadata"
+    meta = getattr(model, 'meta', {})
+    sample_rate, hop_length = sample_rate or meta.get('sample_rate'), hop_length or meta.get('hop_length')
+    if sample_rate is None: raise ValueError("the model doesn't say what sample rate it expects; pass sample_rate (--sample_rate for the embed command)")
+    if hop_length is None: raise ValueError("the model doesn't say what its hop length is; pass hop_length")
+    return sample_rate, hop_length
+
+# %% ../nbs/embed.ipynb 9
+def embed_audio(
+    model,                 # audio (b, 2, n) -> latents (b, n_frames, d)
+    audio,                 # one clip, (2, n)
+    sample_rate=None,      # default: model.meta['sample_rate']
+    chunk_sec=10.0,        # chunk length in seconds; None = whole clip
+    hop_sec=None,          # seconds between chunk starts; default = chunk_sec
+    pool='mean',           # one of POOLS
+    hop_length=None,       # encoder samples per latent frame; default: model.meta['hop_length']
+    batch_size=64,         # chunks per forward pass
+    device='cpu',
+    ) -> tuple:
+    "embeds one clip; returns vectors (k, d) and their offsets & durations in seconds"
+    sample_rate, hop_length = _model_settings(model, sample_rate, hop_length)
+    chunks, starts, lengths = chunk_audio(audio, chunk_sec and round(chunk_sec * sample_rate), hop_sec and round(hop_sec * sample_rate), hop_length)
+    vecs, offsets, durs = [], [], []
+    with torch.inference_mode():
+        for b in range(0, len(chunks), batch_size):
+            z = model(chunks[b:b+batch_size].to(device))
+            for zb, s, n in zip(z, starts[b:b+batch_size], lengths[b:b+batch_size]):
+                v, o, d = _chunk_vectors(zb, s, n, hop_length, sample_rate, pool)
+                vecs.append(v.float().cpu()); offsets += o; durs += d
+    return torch.cat(vecs), offsets, durs
+
+# %% ../nbs/embed.ipynb 11
+def load_stereo(path, sample_rate) -> torch.Tensor:
+    "loads an audio file as (2, n) at sample_rate"
+    audio, _ = librosa.load(path, sr=sample_rate, mono=False)
+    return Stereo()(torch.from_numpy(audio))
+
+
+class EmbedFiles(torch.utils.data.Dataset):
+    "audio files, loaded & chunked (see chunk_audio) in DataLoader workers"
+    def __init__(self, paths, sample_rate, chunk=None, hop=None, multiple=1):
+        self.paths, self.sample_rate, self.chunk, self.hop, self.multiple = paths, sample_rate, chunk, hop, multiple
+    def __len__(self): return len(self.paths)
+    def __getitem__(self, i):
+        try:
+            return i, chunk_audio(load_stereo(self.paths[i], self.sample_rate), self.chunk, self.hop, self.multiple), None
+        except Exception as e:   # a bad file shouldn't stop the whole run
+            return i, None, e
+
+
+def embed_files(
+    model,                 # audio (b, 2, n) -> latents (b, n_frames, d), see embed_audio
+    paths,                 # directory, text file with a list of files, or a list of files (see find_audio_files)
+    store_dir:str,         # EmbeddingStore to add to; created if needed
+    chunk_sec=10.0,        # chunk length in seconds; None = whole files (batched one file at a time)
+    hop_sec=None,          # seconds between chunk starts; default = chunk_sec
+    pool='mean',           # one of POOLS
+    sample_rate=None,      # default: model.meta['sample_rate']
+    hop_length=None,       # default: model.meta['hop_length']
+    batch_size=64,         # chunks per forward pass
+    num_workers=4,         # DataLoader workers for decoding, resampling & chunking
+    rank=0, world_size=1,  # for splitting the files among processes; each writes its own shard
+    device='cpu',
+    tracer:OnDemandTrace=None, # optional on-demand profiler; a step is one batch
+    print=print,
+    ) -> dict:
+    "embeds every file that isn't in the store yet; returns throughput stats"
+    assert pool in POOLS, f"pool should be one of {POOLS}, not {pool!r}"
+    sample_rate, hop_length = _model_settings(model, sample_rate, hop_length)
+    meta = getattr(model, 'meta', {})
+    settings = {'sample_rate': sample_rate, 'hop_length': hop_length, 'chunk_sec': chunk_sec, 'hop_sec': hop_sec, 'pool': pool}
+    dim = meta.get('latent_dim')
+    if dim is None:
+        with torch.inference_mode(): dim = model(torch.zeros(1, 2, hop_length, device=device)).shape[-1]
+    store = EmbeddingStore(store_dir, dim=dim, shard=rank, meta=settings)
+    assert all(store.meta.get(k) == v for k, v in settings.items()), f"store {store_dir} was made with other settings: {store.meta}"
+
+    paths = find_audio_files(paths)[rank::world_size]
+    done = store.done_paths()
+    todo = [p for p in paths if p not in done]
+    if len(todo) < len(paths): print(f"embed_files: {len(paths) - len(todo)} of {len(paths)} files are already in {store_dir}")
+    if not todo: return {'files': 0, 'vectors': 0}
+
+    chunk, hop = chunk_sec and round(chunk_sec * sample_rate), hop_sec and round(hop_sec * sample_rate)
+    loader = torch.utils.data.DataLoader(EmbedFiles(todo, sample_rate, chunk, hop, hop_length), batch_size=None, shuffle=False,
+                                         num_workers=num_workers, prefetch_factor=(4 if num_workers > 0 else None))
+    t_wait, n_files, n_vectors, n_chunks, n_samples, t_start = 0.0, 0, 0, 0, 0, time.time()
+    pending, batch = {}, []    # per file: [chunks left, vectors, offsets, durs]; & queued (file, chunk, start, length)
+
+    def run(batch):
+        nonlocal n_files, n_vectors, n_chunks
+        with torch.inference_mode():
+            z = model(torch.stack([c for _, c, _, _ in batch]).to(device))
+        for (i, _, s, n), zb in zip(batch, z):
+            v, o, d = _chunk_vectors(zb, s, n, hop_length, sample_rate, pool)
+            p = pending[i]
+            p[0] -= 1; p[1].append(v.float().cpu()); p[2] += o; p[3] += d
+            if p[0] == 0:    # file's done: into the store it goes
+                store.add(todo[i], torch.cat(p[1]), p[2], p[3])
+                n_files, n_vectors = n_files + 1, n_vectors + sum(len(x) for x in p[1])
+                del pending[i]
+        n_chunks += len(batch)
+        if tracer is not None: tracer.step()
+
+    it, bar = iter(loader), tqdm.tqdm(total=len(todo), disable=(rank != 0))
+    while True:
+        t0 = time.time()
+        try: i, item, err = next(it)
+        except StopIteration: break
+        t_wait += time.time() - t0
+        bar.update(1)
+        if err is not None:
+            print(f"embed_files: skipping {todo[i]}: {err}")
+            continue
+        chunks, starts, lengths = item
+        pending[i] = [len(chunks), [], [], []]
+        n_samples += sum(lengths)
+        for c, s, n in zip(chunks, starts, lengths):
+            if batch and (len(batch) == batch_size or batch[0][1].shape != c.shape):
+                run(batch); batch = []
+            batch.append((i, c, s, n))
+    if batch: run(batch)
+    bar.close()
+
+    elapsed = time.time() - t_start
+    stats = {'files': n_files, 'vectors': n_vectors, 'chunks': n_chunks, 'seconds': elapsed, 'files_per_sec': n_files / elapsed,
+             'chunks_per_sec': n_chunks / elapsed, 'realtime': n_samples / sample_rate / elapsed, 'data_wait': t_wait / elapsed}
+    print(f"embed_files: {n_files} files, {n_chunks} chunks -> {n_vectors} vectors in {elapsed:.1f} s = {stats['files_per_sec']:.2f} files/sec, "
+          f"{stats['chunks_per_sec']:.1f} chunks/sec, {stats['realtime']:.1f}x realtime, waited on data loading {stats['data_wait']:.0%} of the time")
+    return stats
+
+# %% ../nbs/embed.ipynb 13
+def main():
+    "embed <model> <audio dir or file list> <store dir> [options]"
+    parser = argparse.ArgumentParser(description="Embeds audio files with an exported AudioAlgebra model, into an EmbeddingStore",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('model', help="model file saved by shazbot.inference.export_embedder")
+    parser.add_argument('paths', help="directory of audio files, or a text file listing them")
+    parser.add_argument('store', help="directory of the EmbeddingStore to add to")
+    parser.add_argument('--chunk_sec', type=float, default=10.0, help="chunk length in seconds; 0 = whole files")
+    parser.add_argument('--hop_sec', type=float, default=None, help="seconds between chunk starts; default = chunk_sec")
+    parser.add_argument('--pool', default='mean', choices=POOLS)
+    parser.add_argument('--sample_rate', type=int, default=None, help="default: the model's")
+    parser.add_argument('--batch_size', type=int, default=64, help="chunks per forward pass")
+    parser.add_argument('--num_workers', type=int, default=4, help="DataLoader workers")
+    parser.add_argument('--num_threads', type=int, default=None, help="torch threads per process")
+    parser.add_argument('--rank', type=int, default=int(os.environ.get('RANK', 0)))
+    parser.add_argument('--world_size', type=int, default=int(os.environ.get('WORLD_SIZE', 1)))
+    parser.add_argument('--trace_dir', default='traces', help="where on-demand profiler traces go (kill -USR2 <pid>, or touch <trace_dir>/TRACE)")
+    parser.add_argument('--trace_steps', type=int, default=5, help="batches per on-demand trace")
+    args = parser.parse_args()
+
+    embedder = load_embedder(args.model, num_threads=args.num_threads)
+    tracer = OnDemandTrace(args.trace_dir, steps=args.trace_steps, rank=args.rank)
+    try:
+        embed_files(embedder, args.paths, args.store, chunk_sec=args.chunk_sec or None, hop_sec=args.hop_sec, pool=args.pool,
+                    sample_rate=args.sample_rate, batch_size=args.batch_size, num_workers=args.num_workers,
+                    rank=args.rank, world_size=args.world_size, tracer=tracer)
+    finally:
+        tracer.close()
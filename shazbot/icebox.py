@@ -1,8 +1,9 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/icebox.ipynb.
 
 # %% auto 0
-__all__ = ['JUKEBOX_SAMPLE_RATE', 'init_jukebox_sample_rate', 'stereo', 'audio_for_jbx', 'load_audio_for_jbx', 'IceBoxModel',
-           'batch_it_crazy', 'main']
+__all__ = ['JUKEBOX_SAMPLE_RATE', 'init_jukebox_sample_rate', 'stereo', 'audio_for_jbx', 'load_audio_for_jbx', 'JukeboxCache',
+           'make_encoder_vqvae', 'IceBoxModel', 'benchmark_icebox', 'batch_it_crazy', 'JbxFiles', 'pad_batch_for_jbx',
+           'length_buckets', 'encode_files', 'warm_cache', 'main']
 
 # %% ../nbs/icebox.ipynb 3
 import torch 
@@ -11,11 +12,18 @@ from torch import multiprocessing as mp
 import torch.distributed as dist
 from torch.nn import functional as F
 import torchaudio
-from jukebox.make_models import make_vqvae, make_prior, MODELS, make_model
+from einops import rearrange
+import math
+from jukebox.make_models import make_vqvae, make_prior, MODELS, make_model, load_checkpoint
 from jukebox.hparams import Hyperparams, setup_hparams
 import os
+import time
+import hashlib
+import numpy as np
+import tqdm
 import accelerate
 from aeiou.hpc import get_accel_config, HostPrinter
+from .core import autocast, quantize_frozen, find_audio_files, OnDemandTrace
 from aeiou.viz import embeddings_table, pca_point_cloud, audio_spectrogram_image, tokens_spectrogram_image, plot_jukebox_embeddings
 import librosa
 
@@ -75,8 +83,93 @@ def load_audio_for_jbx(path, offset=0.0, dur=None, trunc_sec=None, device=None):
     return audio_for_jbx(audio, trunc_sec, device=device)
 
 # %% ../nbs/icebox.ipynb 7
+class JukeboxCache():
+    "content-addressed on-disk cache of Jukebox codes, for audio files or audio tensors"
+    def __init__(self,
+        cache_dir:str,      # where to keep the cached codes
+        model_id='vqvae',   # identifies the model; different models never share entries
+        ):
+        self.cache_dir, self.model_id = cache_dir, model_id
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits, self.misses, self.bytes_read, self.bytes_written = 0, 0, 0, 0
+        self.hashes = {}    # (path, size, mtime) -> content hash, so we don't re-hash within a run
+
+    def file_hash(self, path, chunk_size=2**20):
+        "sha256 of the file's contents"
+        st = os.stat(path)
+        memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        if memo_key not in self.hashes:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''): h.update(chunk)
+            self.hashes[memo_key] = h.hexdigest()
+        return self.hashes[memo_key]
+
+    def audio_hash(self, audio:torch.Tensor):
+        "sha256 of an audio tensor's shape, dtype & samples"
+        a = audio.detach().cpu().contiguous().numpy()
+        return hashlib.sha256(f"{a.shape}|{a.dtype}|".encode() + a.tobytes()).hexdigest()
+
+    def entry(self, path, offset, dur, level):
+        "filename in the cache for these settings; path can also be an audio tensor, hashed by content"
+        h = self.audio_hash(path) if torch.is_tensor(path) else self.file_hash(path)
+        key = hashlib.sha256(f"{h}|{float(offset)}|{dur}|{level}|{self.model_id}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.npy')
+
+    def get(self, path, offset=0.0, dur=None, level=0, device='cpu'):
+        "the cached codes (as a LongTensor on device), or None on a miss"
+        entry = self.entry(path, offset, dur, level)
+        try:
+            z = np.load(entry)
+        except (OSError, ValueError):   # not there (or a half-written file from a crash)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_read += z.nbytes
+        return torch.from_numpy(z.astype(np.int64)).to(device)
+
+    def put(self, path, offset, dur, level, z):
+        "store codes z (any shape; Jukebox's codebooks fit in int16)"
+        entry = self.entry(path, offset, dur, level)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        z = z.detach().cpu().numpy().astype(np.int16)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f: np.save(f, z)
+        os.replace(tmp, entry)   # atomic, so parallel workers never see partial files
+        self.bytes_written += z.nbytes
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'MB_read': self.bytes_read / 2**20, 'MB_written': self.bytes_written / 2**20}
+
+# %% ../nbs/icebox.ipynb 9
+def make_encoder_vqvae(hps, device, levels=(0,1,2)):
+    """Like Jukebox's make_vqvae, but only the encoders for the given levels (plus the bottleneck) get real weights.
+    The skeleton is built on the meta device, so the decoders & unused encoders never take any time or memory"""
+    with torch.device('meta'):
+        vqvae = make_vqvae(Hyperparams({**hps, 'restore_vqvae': ''}), 'meta')  # '' = don't load a checkpoint yet
+    del vqvae.decoders
+    for l in range(len(vqvae.encoders)):
+        if l not in levels: vqvae.encoders[l] = nn.Identity()
+    vqvae = vqvae.to_empty(device=device)
+
+    keep = tuple(f'encoders.{l}.' for l in levels) + ('bottleneck.',)
+    checkpoint = load_checkpoint(hps.restore_vqvae)
+    state_dict = {k[7:] if k.startswith('module.') else k: v for k, v in checkpoint['model'].items()}
+    state_dict = {k: v for k, v in state_dict.items() if k.startswith(keep)}
+    del checkpoint
+    missing, _ = vqvae.load_state_dict(state_dict, strict=False)
+    assert not [k for k in missing if k.startswith(keep)], f"missing weights: {missing}"
+    return vqvae.eval()
+
+# %% ../nbs/icebox.ipynb 10
 class IceBoxModel(nn.Module):
-    def __init__(self, global_args, device, port=9500):
+    def __init__(self, global_args, device, port=9500,
+        encoder_only=False, # only build & load the encoder(s) in levels; the full VQ-VAE gets made on the first decode()
+        levels=None,        # Jukebox levels to encode with by default, e.g. [0]. None = all 3
+        cache_dir=None,     # directory for an on-disk JukeboxCache of encodings, used by encode & encode_file. None = no cache
+        ):
         super().__init__()
 
         n_io_channels = 2
@@ -96,35 +189,226 @@ class IceBoxModel(nn.Module):
         self.hps.levels = 3
         self.hps.hop_fraction = [.5,.5,.125]
 
-        vqvae = "vqvae"
-        self.vqvae = make_vqvae(setup_hparams(vqvae, dict(sample_length = 1048576)), device)
+        self.device, self.encoder_only = device, encoder_only
+        self.levels = list(range(self.hps.levels)) if levels is None else list(levels)
+        self.vqvae_hps = setup_hparams("vqvae", dict(sample_length = 1048576))
+        self.model_id = f"{self.vqvae_hps.restore_vqvae}@{self.hps.sr}"   # what the cache needs to know about the model
+        self.cache = JukeboxCache(cache_dir, self.model_id) if cache_dir else None
+        self.vqvae = make_encoder_vqvae(self.vqvae_hps, device, self.levels) if encoder_only else make_vqvae(self.vqvae_hps, device)
         for param in self.vqvae.parameters():  # FREEZE IT.  "IceBox"
             param.requires_grad = False
             
         self.dummy = nn.Linear(1,1) # just to allow DistributedDataParallel
 
-        self.encoder = self.vqvae.encode
-        self.decoder = self.vqvae.decode
-
         latent_dim = 64 # global_args.latent_dim. Jukebox is 64
         io_channels = 2#1 # 2.  Jukebox is mono but we decode in stereo
  
-    def encode(self, *args, **kwargs):
-        return self.encoder(*args, **kwargs)
+    def encode(self, *args, levels=None, **kwargs):
+        """With levels=None (and not encoder_only), same as Jukebox's vqvae.encode. Otherwise returns the codes for just
+        the given levels (default self.levels), running only those levels' encoders; Jukebox always runs all three.
+        With a cache, each batch item's codes get looked up by the audio's content, and only the misses get encoded"""
+        if levels is None and not self.encoder_only and (kwargs or self.cache is None):
+            return self.vqvae.encode(*args, **kwargs)
+        levels = self.levels if levels is None else levels
+        assert set(levels) <= set(self.levels), f"levels {levels} weren't loaded; this IceBoxModel only has {self.levels}"
+        x = args[0]
+        if self.cache is None: return self._encode(x, levels)
+        zs = [[self.cache.get(xi, level=l, device=x.device) for xi in x] for l in levels]
+        miss = [i for i in range(len(x)) if any(zl[i] is None for zl in zs)]
+        if miss:
+            for zl, l, z in zip(zs, levels, self._encode(x[miss], levels)):
+                for i, zi in zip(miss, z):
+                    zl[i] = zi
+                    self.cache.put(x[i], 0.0, None, l, zi)
+        return [torch.stack(zl) for zl in zs]
+
+    def _encode(self, x, levels):
+        "the codes for these levels, straight from the encoders"
+        x_in = self.vqvae.preprocess(x)
+        return [self.vqvae.bottleneck.level_blocks[l].encode(self.vqvae.encoders[l](x_in)[-1]) for l in levels]
+
+    def encode_file(self, path, offset=0.0, dur=None, levels=None):
+        "loads & encodes an audio file; levels found in the cache (if any) skip both the audio decoding and the encoder"
+        levels = self.levels if levels is None else levels
+        zs = {l: (self.cache.get(path, offset, dur, l, device=self.device) if self.cache else None) for l in levels}
+        todo = [l for l in levels if zs[l] is None]
+        if todo:
+            audio = load_audio_for_jbx(path, offset=offset, dur=dur).to(self.device)
+            with torch.inference_mode():
+                for l, z in zip(todo, self._encode(audio, levels=todo)):
+                    zs[l] = z
+                    if self.cache: self.cache.put(path, offset, dur, l, z)
+        return [zs[l] for l in levels]
+
+    def quantize(self,
+        mode='int8',   # 'int8', 'fp16' or 'bf16', see core.quantize_frozen
+        calib=None,    # for int8: list of audio batches (b, n, 1) as for encode()
+        ):
+        "swaps the encoders in self.levels for low-precision CPU copies (the codebooks stay fp32); check the code mismatch with compare_inference"
+        self.device = torch.device('cpu')
+        self.vqvae = self.vqvae.cpu()
+        for l in self.levels:
+            lcalib = None if calib is None else [self.vqvae.preprocess(x) for x in calib]
+            self.vqvae.encoders[l] = quantize_frozen(self.vqvae.encoders[l], mode, calib=lcalib)
+        self.model_id += f"+{mode}"   # the codes can differ, so keep them apart in the cache
+        if self.cache: self.cache.model_id = self.model_id
+        return self
 
     def decode(self, *args, **kwargs):
-        return self.decoder(*args, **kwargs)   
-
-# %% ../nbs/icebox.ipynb 8
+        if self.encoder_only:   # first decode: now we need the whole thing after all
+            self.vqvae = make_vqvae(self.vqvae_hps, self.device)
+            for param in self.vqvae.parameters(): param.requires_grad = False
+            self.encoder_only, self.levels = False, list(range(self.hps.levels))
+        return self.vqvae.decode(*args, **kwargs)
+
+    # kept for backwards compatibility
+    @property
+    def encoder(self): return self.encode
+    @property
+    def decoder(self): return self.decode
+
+# %% ../nbs/icebox.ipynb 12
+def benchmark_icebox(global_args, device='cpu', levels=[0], seconds=10.0, repeats=3):
+    "compares the full IceBoxModel with an encoder_only one for the given levels. returns a list of dicts"
+    results = []
+    audio = 0.1*torch.randn([1, int(seconds * 44100), 1], device=device)   # (b, n, 1), same as audio_for_jbx
+    for encoder_only in [False, True]:
+        t0 = time.perf_counter()
+        model = IceBoxModel(global_args, device, encoder_only=encoder_only, levels=levels)
+        startup = time.perf_counter() - t0
+        mbytes = sum(t.numel() * t.element_size() for t in [*model.parameters(), *model.buffers()]) / 2**20
+        with torch.no_grad():
+            model.encode(audio, levels=levels)   # warmup
+            t0 = time.perf_counter()
+            for _ in range(repeats): model.encode(audio, levels=None if not encoder_only else levels)
+            t_enc = (time.perf_counter() - t0) / repeats
+        results.append({'encoder_only': encoder_only, 'levels': levels, 'startup_s': startup, 'model_MB': mbytes,
+                        'encode_s': t_enc, 'audio_sec_per_sec': seconds / t_enc})
+        del model
+    return results
+
+# %% ../nbs/icebox.ipynb 13
 def batch_it_crazy(x, win_len):
     "(pun intended) Chop up long sequence into a batch of win_len windows"
     x_len = x.size()[-1]
-    n_windows = (x_len // win_len) + 1
+    n_windows = max(1, math.ceil(x_len / win_len))   # no extra all-zero window when win_len divides x_len
     pad_amt = win_len * n_windows - x_len  # pad end w. zeros to make lengths even when split
     xpad = F.pad(x, (0, pad_amt))
     return rearrange(xpad, 'd (b n) -> b d n', n=win_len)
 
-# %% ../nbs/icebox.ipynb 10
+# %% ../nbs/icebox.ipynb 15
+class JbxFiles(torch.utils.data.Dataset):
+    "audio files loaded for Jukebox, as 1D tensors (so it can be used with DataLoader workers)"
+    def __init__(self, paths, offset=0.0, dur=None):
+        self.paths, self.offset, self.dur = paths, offset, dur
+    def __len__(self): return len(self.paths)
+    def __getitem__(self, i):
+        try:
+            return i, load_audio_for_jbx(self.paths[i], offset=self.offset, dur=self.dur)[0,:,0], None
+        except Exception as e:   # a bad file shouldn't stop the whole run
+            return i, None, e
+
+
+def pad_batch_for_jbx(clips:list, multiple=1):
+    "like audio_for_jbx but for a list of 1D clips: zero-pads to a common length (a multiple of `multiple`), returns audio (b,n,1) & mask (b,n)"
+    lengths = torch.tensor([len(c) for c in clips])
+    n = math.ceil(lengths.max().item() / multiple) * multiple
+    audio = torch.zeros(len(clips), n, 1)
+    for i, c in enumerate(clips): audio[i, :len(c), 0] = c
+    mask = torch.arange(n)[None] < lengths[:, None]
+    return audio, mask
+
+
+def length_buckets(items, batch_size=8, window=64):
+    "groups a stream of (i, clip) into batches of similar-length clips, sorting each window of clips by length"
+    pool = []
+    def flush():
+        pool.sort(key=lambda item: len(item[1]))
+        for b in range(0, len(pool), batch_size): yield pool[b:b+batch_size]
+        pool.clear()
+    for item in items:
+        pool.append(item)
+        if len(pool) >= window: yield from flush()
+    yield from flush()
+
+
+def encode_files(icebox:IceBoxModel,
+    paths,                   # directory, text file with a list of files, or a list of files (see find_audio_files)
+    offset=0.0, dur=None,    # the part of each file to encode, as in load_audio_for_jbx
+    levels=None,             # which levels to encode; None = icebox.levels
+    batch_size=8,
+    num_workers=4,           # DataLoader workers for decoding & resampling
+    bucket_batches=8,        # sort this many batches' worth of clips by length at a time
+    tracer:OnDemandTrace=None, # optional on-demand profiler; a step is one batch
+    print=print,
+    ):
+    """Yields (path, codes) for every file, with codes a list (one per level) of (1,t) LongTensors, just like
+    icebox.encode_file. Files that are in icebox's cache (if any) are yielded right away; others in batch order"""
+    if JUKEBOX_SAMPLE_RATE is None: init_jukebox_sample_rate()
+    levels = icebox.levels if levels is None else levels
+    paths = find_audio_files(paths)
+    hops = [int(icebox.vqvae.hop_lengths[l]) for l in levels]
+    todo = []
+    for path in paths:
+        zs = [icebox.cache.get(path, offset, dur, l, device=icebox.device) for l in levels] if icebox.cache else [None]
+        if all(z is not None for z in zs): yield path, zs
+        else: todo.append(path)
+    if not todo: return
+
+    loader = torch.utils.data.DataLoader(JbxFiles(todo, offset, dur), batch_size=None, shuffle=False, num_workers=num_workers,
+                                         prefetch_factor=(2*batch_size if num_workers > 0 else None))
+    t_wait, n_clips, n_samples, t_start = 0.0, 0, 0, time.time()
+    def loaded():   # the clips that loaded OK, timing how long we wait on the workers
+        nonlocal t_wait
+        it = iter(loader)
+        while True:
+            t0 = time.time()
+            try: i, clip, err = next(it)
+            except StopIteration: return
+            t_wait += time.time() - t0
+            if err is not None: print(f"encode_files: skipping {todo[i]}: {err}")
+            else: yield i, clip
+
+    for batch in length_buckets(loaded(), batch_size, window=batch_size*bucket_batches):
+        idx, clips = zip(*batch)
+        audio, mask = pad_batch_for_jbx(clips, multiple=max(icebox.vqvae.hop_lengths))
+        with torch.inference_mode():
+            zs = icebox._encode(audio.to(icebox.device), levels)   # padded clips: cache them by file below, not by content
+        for b, i in enumerate(idx):
+            n = mask[b].sum().item()
+            codes = [z[b:b+1, :math.ceil(n / hop)] for z, hop in zip(zs, hops)]
+            if icebox.cache:
+                for l, z in zip(levels, codes): icebox.cache.put(todo[i], offset, dur, l, z)
+            yield todo[i], codes
+        n_clips, n_samples = n_clips + len(clips), n_samples + mask.sum().item()
+        if tracer is not None: tracer.step()
+
+    elapsed = time.time() - t_start
+    if n_clips: print(f"encode_files: {n_clips} clips in {elapsed:.1f} s = {n_clips/elapsed:.2f} clips/sec, "
+                      f"{n_samples/JUKEBOX_SAMPLE_RATE/elapsed:.1f}x realtime, waited on data loading {t_wait/elapsed:.0%} of the time")
+
+# %% ../nbs/icebox.ipynb 17
+def warm_cache(icebox:IceBoxModel, # an IceBoxModel with a cache_dir
+    paths,                   # directory, text file with a list of files, or a list of files (see find_audio_files)
+    offset=0.0, dur=None,    # the part of each file to encode, as in load_audio_for_jbx
+    levels=None,             # which levels to encode; None = icebox.levels
+    batch_size=8, num_workers=4,
+    rank=0, world_size=1,    # for splitting the files among processes
+    tracer:OnDemandTrace=None, # optional on-demand profiler, see encode_files
+    print=print,
+    ) -> dict:
+    "encodes every file that isn't in icebox's cache yet; returns the cache's hit/miss stats"
+    assert icebox.cache is not None, "warm_cache needs an IceBoxModel made with a cache_dir"
+    paths = find_audio_files(paths)[rank::world_size]
+    for _ in tqdm.tqdm(encode_files(icebox, paths, offset=offset, dur=dur, levels=levels, batch_size=batch_size,
+                                    num_workers=num_workers, tracer=tracer, print=print), total=len(paths), disable=(rank != 0)):
+        pass
+    stats = icebox.cache.stats()
+    print(f"warm_cache: {len(paths)} files, {stats['hits']} hits, {stats['misses']} misses (hit rate {stats['hit_rate']:.1%}), "
+          f"{stats['MB_written']:.1f} MB written to {icebox.cache.cache_dir}")
+    return stats
+
+# %% ../nbs/icebox.ipynb 19
 def main():
     #from dotmap import DotMap  # only used for setting some args
     from prefigure.prefigure import get_all_args, push_wandb_config
@@ -155,8 +439,20 @@ def main():
     args.sample_rate = 44100
     args.rank = ac['machine_rank']
     os.environ["RANK"] = str(args.rank)
+    cache_dir = getattr(args, 'jukebox_cache_dir', '') or None
+    if getattr(args, 'warm_cache', ''):   # just fill up the cache and quit
+        icebox = IceBoxModel(args, device, port=port, encoder_only=True, levels=[args.jukebox_layer], cache_dir=cache_dir or 'jukebox_cache')
+        tracer = OnDemandTrace(getattr(args, 'trace_dir', 'traces'), steps=getattr(args, 'trace_steps', 5),
+                               rank=accelerator.process_index, print=print)
+        try:
+            warm_cache(icebox, args.warm_cache, batch_size=args.batch_size, num_workers=args.num_workers,
+                       rank=accelerator.process_index, world_size=accelerator.num_processes, tracer=tracer, print=print)
+        finally:
+            tracer.close()
+        return
+
     if device != 'cpu':
-        icebox = IceBoxModel(args, device, port=port)
+        icebox = IceBoxModel(args, device, port=port, cache_dir=cache_dir)
         hprint("IceBoxModel config finished!")
     else:
         print("can't start up icebox because no GPUs are available.")
@@ -170,8 +466,8 @@ def main():
 
 
     hprint(f"Encoding audio")
-    with torch.cuda.amp.autocast():
-        zs = accelerator.unwrap_model(icebox).encode(input_audio)
+    with autocast(device):
+        zs = accelerator.unwrap_model(icebox).encode_file(input_filename)   # from the cache, if it's been encoded before
         hprint(f"  len(zs) = {len(zs)}")
         for i, z in enumerate(zs):
             hprint(f"  zs[{i}].shape = {z.shape}")
@@ -0,0 +1,229 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/inference.ipynb.
+
+# %% auto 0
+__all__ = ['fold_embed_block', 'fold_reembedding', 'EmbedChain', 'make_embed_chain', 'export_embedder', 'Embedder',
+           'load_embedder', 'benchmark_embedder', 'FaderSession', 'benchmark_faders']
+
+# %% ../nbs/inference.ipynb 3
+import os
+import json
+import time
+from copy import deepcopy
+import contextlib
+import torch
+from torch import nn
+from .blocks_utils import eval_mode
+
+# %% ../nbs/inference.ipynb 5
+def fold_embed_block(block) -> nn.Sequential:
+    "an (eval-mode) EmbedBlock as one Linear with its BatchNorm folded in, plus the activation"
+    lin, bn = block.lin, block.bn
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    shift = -bn.running_mean * scale
+    if bn.affine: scale, shift = scale * bn.weight, shift * bn.weight + bn.bias
+    folded = nn.Linear(lin.in_features, lin.out_features)
+    with torch.no_grad():
+        folded.weight.copy_(lin.weight * scale[:, None])
+        folded.bias.copy_((lin.bias if lin.bias is not None else 0) * scale + shift)
+    act = nn.Mish() if type(block.act).__name__ == 'Mish' else deepcopy(block.act)  # nn.Mish is the same function, & traces/exports
+    return nn.Sequential(folded, act)
+
+
+def fold_reembedding(reembedding:nn.Sequential) -> nn.Sequential:
+    "AudioAlgebra.reembedding with every EmbedBlock folded, see fold_embed_block"
+    layers = []
+    for m in reembedding:
+        layers += list(fold_embed_block(m)) if hasattr(m, 'lin') and hasattr(m, 'bn') else [deepcopy(m)]
+    return nn.Sequential(*layers).eval()
+
+# %% ../nbs/inference.ipynb 7
+class EmbedChain(nn.Module):
+    "audio (b, 2, n) -> re-embedded latents (b, n_frames, d), laid out like AudioAlgebra's zsum & zmix"
+    def __init__(self,
+        encoder:nn.Module,     # frozen encoder, e.g. dvae.encoder_ema: (b, 2, n) -> (b, d, n_frames)
+        quantizer:nn.Module,   # e.g. dvae.quantizer_ema, returning (latents, indices); or None
+        reembedding:nn.Module, # e.g. aa_model.reembedding, or its folded version
+        ):
+        super().__init__()
+        self.encoder, self.quantizer, self.reembedding = encoder, quantizer, reembedding
+
+    def forward(self, audio):
+        z = self.encoder(audio).float().transpose(1, 2)   # (b, n_frames, d)
+        if self.quantizer is not None: z = self.quantizer(z)[0]
+        return self.reembedding(z)
+
+
+def make_embed_chain(dvae, reembedding, num_quantizers=None, fold=True) -> EmbedChain:
+    "the inference chain for a DiffusionDVAE's frozen encoder and an AudioAlgebra's reembedding, on CPU in eval mode"
+    from shazbot.core import bake_weight_norm   # only needed at export time
+    num_quantizers = getattr(dvae, 'num_quantizers', 0) if num_quantizers is None else num_quantizers
+    encoder = bake_weight_norm(deepcopy(dvae.encoder_ema).cpu().eval())
+    quantizer = deepcopy(dvae.quantizer_ema).cpu().eval() if num_quantizers > 0 else None
+    reembedding = deepcopy(reembedding).cpu().eval()
+    return EmbedChain(encoder, quantizer, fold_reembedding(reembedding) if fold else reembedding).eval()
+
+# %% ../nbs/inference.ipynb 9
+def export_embedder(
+    dvae,                 # DiffusionDVAE (or anything with encoder_ema & quantizer_ema)
+    reembedding,          # AudioAlgebra's reembedding
+    path:str,             # where to save: '.pt' for TorchScript, '.onnx' for ONNX
+    example_audio,        # (b, 2, n) audio to trace with; n should be a multiple of the encoder's hop length
+    num_quantizers=None,  # default: dvae.num_quantizers
+    sample_rate=48000,    # sample rate the model expects its audio at
+    meta:dict=None,       # extra info to store with the model
+    atol=1e-4,            # how close the export has to match the eager model
+    ) -> dict:
+    "saves the whole inference chain as one optimized file; returns its metadata"
+    eager = make_embed_chain(dvae, reembedding, num_quantizers, fold=False)
+    chain = make_embed_chain(dvae, reembedding, num_quantizers, fold=True)
+    example_audio = example_audio.cpu()
+    with torch.inference_mode():
+        ref = eager(example_audio)
+    meta = {'sample_rate': sample_rate, 'hop_length': example_audio.shape[-1] // ref.shape[1], 'latent_dim': ref.shape[-1],
+            'num_quantizers': 0 if chain.quantizer is None else (num_quantizers or getattr(dvae, 'num_quantizers', 0)), **(meta or {})}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.onnx'):
+        torch.onnx.export(chain, (example_audio,), path, input_names=['audio'], output_names=['latents'], dynamo=False,
+                          dynamic_axes={'audio': {0: 'batch', 2: 'samples'}, 'latents': {0: 'batch', 1: 'frames'}})
+        with open(path + '.json', 'w') as f: json.dump(meta, f)
+    else:
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(chain, (example_audio,), check_trace=False))
+        torch.jit.save(traced, path, _extra_files={'meta.json': json.dumps(meta)})
+    err = (load_embedder(path)(example_audio) - ref).abs().max().item()
+    assert err <= atol, f"exported model differs from the eager one by {err}"
+    return meta
+
+
+class Embedder():
+    "a loaded embedding model: call it on audio (b, 2, n) to get latents (b, n_frames, d)"
+    def __init__(self, fn, meta:dict):
+        self.fn, self.meta = fn, meta
+    def __call__(self, audio):
+        with torch.inference_mode():
+            return self.fn(audio)
+
+
+def load_embedder(
+    path:str,       # file saved by export_embedder
+    compile=False,  # also run torch.compile on the TorchScript model (slower start, maybe faster after)
+    num_threads=None,
+    ) -> Embedder:
+    "loads an exported model; needs only torch (or onnxruntime for .onnx)"
+    if num_threads: torch.set_num_threads(num_threads)
+    if path.endswith('.onnx'):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        if num_threads: opts.intra_op_num_threads = num_threads
+        sess = ort.InferenceSession(path, opts, providers=['CPUExecutionProvider'])
+        with open(path + '.json') as f: meta = json.load(f)
+        return Embedder(lambda audio: torch.from_numpy(sess.run(None, {'audio': audio.cpu().numpy()})[0]), meta)
+    extra = {'meta.json': ''}
+    model = torch.jit.load(path, map_location='cpu', _extra_files=extra)
+    model = torch.jit.optimize_for_inference(model)
+    return Embedder(torch.compile(model) if compile else model, json.loads(extra['meta.json']))
+
+# %% ../nbs/inference.ipynb 11
+def benchmark_embedder(
+    eager,             # the eager chain, e.g. make_embed_chain(dvae, reembedding, fold=False)
+    embedder,          # loaded with load_embedder
+    audio,             # (b, 2, n) input
+    repeats=10,
+    print=print,
+    ) -> dict:
+    "latency of the exported model against eager mode, and how far apart their outputs are"
+    times = {}
+    with torch.inference_mode():
+        for name, fn in (('eager', eager), ('exported', embedder)):
+            out = fn(audio)  # warmup
+            t = []
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                fn(audio)
+                t.append(1000 * (time.perf_counter() - t0))
+            times[name] = sorted(t)[len(t)//2]
+            if name == 'eager': ref = out
+    res = {'eager_ms': times['eager'], 'exported_ms': times['exported'], 'speedup': times['eager'] / times['exported'],
+           'max_abs_err': (out - ref).abs().max().item()}
+    print(f"eager {res['eager_ms']:.2f} ms, exported {res['exported_ms']:.2f} ms ({res['speedup']:.2f}x), max abs. error {res['max_abs_err']:.2e}")
+    return res
+
+# %% ../nbs/inference.ipynb 13
+class FaderSession():
+    "a set of stems with cached latents, so moving one fader only recomputes that stem's term of zsum"
+    def __init__(self,
+        embed_fn,          # audio (b, 2, n) -> latents (b, n_frames, d), e.g. AudioAlgebra.embed or load_embedder(...). If
+                           # it's a module (or a module's method), it runs in eval mode, then goes back to the mode it was in
+        stems,             # list of (2, n) stems, all the same length
+        gains=None,        # starting fader values; default all 1
+        grid=None,         # gains to precompute latents at, e.g. torch.linspace(0, 2, 41); None = exact latents only
+        batch_size=16,     # clips per embed_fn call when precomputing
+        memo=64,           # exact mode: how many past gains to remember per stem
+        ):
+        self.embed_fn, self.batch_size, self.memo = embed_fn, batch_size, memo
+        module = embed_fn if isinstance(embed_fn, nn.Module) else getattr(embed_fn, '__self__', None)
+        self.module = module if isinstance(module, nn.Module) else None   # so BatchNorm & dropout act as at inference
+        self.grid = None if grid is None else torch.as_tensor(grid, dtype=torch.float32).sort().values
+        self.stems, self.gains, self.z, self.cache = [], [], [], []
+        for i, s in enumerate(stems): self.add_stem(s, 1.0 if gains is None else gains[i], update=False)
+        self.zsum = torch.stack(self.z).sum(0)
+
+    def _embed(self, audio):
+        with torch.inference_mode(), (eval_mode(self.module) if self.module is not None else contextlib.nullcontext()):
+            return torch.cat([self.embed_fn(audio[b:b+self.batch_size]).float().cpu() for b in range(0, len(audio), self.batch_size)])
+
+    def _latents(self, i, gain):
+        "stem i's latents at this gain: interpolated from the grid, or exact (& memoized)"
+        if self.grid is not None:
+            g = min(max(gain, self.grid[0].item()), self.grid[-1].item())   # faders outside the grid stop at its ends
+            hi = min(max(int(torch.searchsorted(self.grid, torch.tensor(g))), 1), len(self.grid) - 1)
+            t = (g - self.grid[hi-1].item()) / (self.grid[hi] - self.grid[hi-1]).item()
+            return torch.lerp(self.cache[i][hi-1], self.cache[i][hi], t)
+        if gain not in self.cache[i]:
+            if len(self.cache[i]) >= self.memo: self.cache[i].pop(next(iter(self.cache[i])))
+            self.cache[i][gain] = self._embed(self.stems[i][None] * gain)[0]
+        return self.cache[i][gain]
+
+    def add_stem(self, audio, gain=1.0, update=True) -> int:
+        "adds a stem (2, n); returns its index"
+        audio = torch.as_tensor(audio).float()
+        self.stems.append(audio)
+        self.cache.append(self._embed(audio[None] * self.grid[:, None, None]) if self.grid is not None else {})
+        self.gains.append(float(gain))
+        self.z.append(self._latents(len(self.stems) - 1, float(gain)))
+        if update: self.zsum = self.zsum + self.z[-1]
+        return len(self.stems) - 1
+
+    def remove_stem(self, i):
+        self.zsum = self.zsum - self.z[i]
+        for l in (self.stems, self.gains, self.z, self.cache): del l[i]
+
+    def set_gain(self, i, gain) -> torch.Tensor:
+        "moves fader i; returns the new zsum (n_frames, d)"
+        z = self._latents(i, float(gain))
+        self.zsum = self.zsum + (z - self.z[i])
+        self.z[i], self.gains[i] = z, float(gain)
+        return self.zsum
+
+    def mix_embedding(self) -> torch.Tensor:
+        "the latents of the actual mix at the current gains: one full embedding call, to compare zsum against"
+        return self._embed((torch.stack(self.stems) * torch.tensor(self.gains)[:, None, None]).sum(0, keepdim=True))[0]
+
+
+def benchmark_faders(session:FaderSession, n_moves=200, seed=0, print=print) -> dict:
+    "times random single-fader moves (restoring the gains afterwards); returns update latency percentiles in ms"
+    rng, gains = torch.Generator().manual_seed(seed), list(session.gains)
+    lo, hi = (session.grid[0].item(), session.grid[-1].item()) if session.grid is not None else (0.0, 2.0)
+    times = []
+    for _ in range(n_moves):
+        i = int(torch.randint(len(session.stems), (1,), generator=rng))
+        g = lo + (hi - lo) * torch.rand(1, generator=rng).item()
+        t0 = time.perf_counter()
+        session.set_gain(i, g)
+        times.append(1000 * (time.perf_counter() - t0))
+    for i, g in enumerate(gains): session.set_gain(i, g)
+    times = torch.tensor(times)
+    res = {'p50_ms': times.quantile(0.5).item(), 'p99_ms': times.quantile(0.99).item(), 'max_ms': times.max().item()}
+    print(f"fader update: p50 {res['p50_ms']:.3f} ms, p99 {res['p99_ms']:.3f} ms, max {res['max_ms']:.3f} ms "
+          f"({len(session.stems)} stems, {'grid of ' + str(len(session.grid)) if session.grid is not None else 'exact'})")
+    return res
@@ -0,0 +1,277 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/search.ipynb.
+
+# %% auto 0
+__all__ = ['nearest', 'kmeans', 'IVFPQIndex', 'save_index', 'load_index', 'build_index', 'find_stems', 'exact_search',
+           'benchmark_index']
+
+# %% ../nbs/search.ipynb 3
+import os
+import json
+import math
+import time
+import numpy as np
+import torch
+from .embed import EmbeddingStore
+
+# %% ../nbs/search.ipynb 5
+def nearest(x, c, chunk=65536) -> tuple:
+    "for each row of x (n, d), the index of & squared distance to its nearest row of c (k, d)"
+    c2 = (c * c).sum(-1)
+    idx, dist = [], []
+    for b in range(0, len(x), chunk):
+        xb = x[b:b+chunk]
+        d = (xb * xb).sum(-1, keepdim=True) - 2 * xb @ c.T + c2
+        dmin, imin = d.min(-1)
+        idx.append(imin); dist.append(dmin.clamp(min=0))
+    return torch.cat(idx), torch.cat(dist)
+
+
+def kmeans(
+    x,                 # (n, d) tensor or array
+    k:int,             # number of clusters
+    iters=20,
+    seed=0,
+    ) -> torch.Tensor:
+    "plain Lloyd's k-means, with empty clusters re-seeded from random points; returns centroids (k, d)"
+    x = torch.as_tensor(np.asarray(x, dtype=np.float32))
+    assert len(x) >= k, f"need at least k={k} points, got {len(x)}"
+    g = torch.Generator().manual_seed(seed)
+    c = x[torch.randperm(len(x), generator=g)[:k]].clone()
+    for _ in range(iters):
+        a = nearest(x, c)[0]
+        counts = torch.bincount(a, minlength=k)
+        c = torch.zeros_like(c).index_add_(0, a, x) / counts.clamp(min=1)[:, None]
+        empty = counts == 0
+        if empty.any(): c[empty] = x[torch.randint(len(x), (int(empty.sum()),), generator=g)]
+    return c
+
+# %% ../nbs/search.ipynb 7
+class IVFPQIndex():
+    "inverted-file index with product-quantized residuals, and optional exact re-ranking from an EmbeddingStore"
+    def __init__(self,
+        dim:int,           # vector size
+        nlist=1024,        # number of clusters (inverted lists); ~4*sqrt(n) is a good start
+        m=8,               # sub-quantizers per vector, i.e. bytes per stored code; must divide dim
+        nbits=8,           # bits per sub-quantizer code (at most 8)
+        metric='l2',       # 'l2', or 'cosine', which normalizes vectors & queries
+        store:EmbeddingStore=None, # where exact vectors for re-ranking come from
+        ):
+        assert dim % m == 0, f"m={m} must divide dim={dim}"
+        assert 1 <= nbits <= 8 and metric in ('l2', 'cosine')
+        self.dim, self.nlist, self.m, self.nbits, self.metric, self.store = dim, nlist, m, nbits, metric, store
+        self.ksub, self.dsub = 2**nbits, dim // m
+        self.centroids = self.codebooks = None      # (nlist, dim) & (m, ksub, dsub), once trained
+        self.codes = [[] for _ in range(nlist)]     # per list: arrays of uint8 codes (n_i, m)
+        self.ids = [[] for _ in range(nlist)]       # per list: arrays of int64 ids (n_i,)
+        self.added = {}                             # store shard -> rows already added
+
+    @property
+    def is_trained(self): return self.centroids is not None
+
+    def __len__(self): return sum(len(a) for l in self.ids for a in l)
+
+    def _prep(self, x):
+        x = torch.as_tensor(np.asarray(x, dtype=np.float32))
+        return torch.nn.functional.normalize(x, dim=-1) if self.metric == 'cosine' else x
+
+    def train(self, x, iters=20, seed=0):
+        "learns the coarse centroids & the PQ codebooks from a sample of vectors (n, dim)"
+        x = self._prep(x)
+        assert len(x) >= max(self.nlist, self.ksub), f"need at least {max(self.nlist, self.ksub)} training vectors, got {len(x)}"
+        self.centroids = kmeans(x, self.nlist, iters, seed)
+        r = x - self.centroids[nearest(x, self.centroids)[0]]
+        self.codebooks = torch.stack([kmeans(r[:, j*self.dsub:(j+1)*self.dsub], self.ksub, iters, seed + 1 + j) for j in range(self.m)])
+        return self
+
+    def encode(self, x) -> tuple:
+        "(already prepped) vectors -> their lists & PQ codes (n, m)"
+        lists = nearest(x, self.centroids)[0]
+        r = x - self.centroids[lists]
+        codes = torch.stack([nearest(r[:, j*self.dsub:(j+1)*self.dsub], self.codebooks[j])[0] for j in range(self.m)], -1)
+        return lists, codes.to(torch.uint8)
+
+    def add(self, ids, x):
+        "adds vectors (n, dim) under the given int64 ids"
+        assert self.is_trained, "train the index first"
+        ids = np.asarray(ids, dtype=np.int64)
+        lists, codes = self.encode(self._prep(x))
+        order = torch.argsort(lists, stable=True)
+        lists, codes = lists[order].numpy(), codes[order].numpy()
+        ids = ids[order.numpy()]
+        bounds = np.searchsorted(lists, np.arange(self.nlist + 1))
+        for l in np.flatnonzero(np.diff(bounds)):
+            self.codes[l].append(codes[bounds[l]:bounds[l+1]])
+            self.ids[l].append(ids[bounds[l]:bounds[l+1]])
+
+    def add_from_store(self, store:EmbeddingStore=None, batch_size=65536):
+        "adds whatever the store has that this index doesn't yet, so the index can grow along with the store"
+        store = store or self.store
+        for s in store.shards():
+            n = len(store.rows(s))
+            vecs, rows = store.shard_vectors(s), store.rows(s)
+            for b in range(self.added.get(s, 0), n, batch_size):
+                self.add([r['id'] for r in rows[b:b+batch_size]], vecs[b:b+batch_size])
+            self.added[s] = n
+        return self
+
+    def _list(self, l):
+        "list l's codes & ids as single arrays"
+        if len(self.codes[l]) > 1:   # merge what add() appended
+            self.codes[l], self.ids[l] = [np.concatenate(self.codes[l])], [np.concatenate(self.ids[l])]
+        if not self.codes[l]: return np.zeros((0, self.m), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+        return self.codes[l][0], self.ids[l][0]
+
+    def search(self,
+        q,                 # queries (nq, dim)
+        k=10,              # neighbours per query
+        nprobe=8,          # lists to look in per query
+        rerank=100,        # exact distances for this many PQ candidates; 0 = PQ distances only
+        exclude=None,      # optional ids to leave out of the results, e.g. the query's own
+        ) -> tuple:
+        "returns squared distances & ids, both (nq, k), best first. Missing results have distance inf & id -1"
+        q = self._prep(q)
+        nq, nprobe = len(q), min(nprobe, self.nlist)
+        probe = torch.topk(-(q.pow(2).sum(-1, keepdim=True) - 2 * q @ self.centroids.T + self.centroids.pow(2).sum(-1)), nprobe).indices
+        n_cand = max(k, rerank)
+        cand_d, cand_i = [[] for _ in range(nq)], [[] for _ in range(nq)]
+        offs = torch.arange(self.m) * self.ksub
+        for l in torch.unique(probe).tolist():
+            codes, ids = self._list(l)
+            if len(ids) == 0: continue
+            qi = (probe == l).any(-1).nonzero()[:, 0]
+            r = (q[qi] - self.centroids[l]).reshape(len(qi), self.m, 1, self.dsub)
+            lut = (r - self.codebooks[None]).pow(2).sum(-1).reshape(len(qi), -1)   # (nq_l, m * ksub)
+            d = lut[:, torch.from_numpy(codes.astype(np.int64)) + offs].sum(-1)    # (nq_l, n_l)
+            d, j = torch.topk(-d, min(n_cand, len(ids)))
+            for row, i in enumerate(qi.tolist()):
+                cand_d[i].append(-d[row]); cand_i[i].append(ids[j[row].numpy()])
+        d_all, i_all = torch.full((nq, n_cand), float('inf')), np.full((nq, n_cand), -1, dtype=np.int64)
+        for i in range(nq):   # each query's best n_cand over all its lists
+            if not cand_i[i]: continue
+            d, ids = torch.cat(cand_d[i]), np.concatenate(cand_i[i])
+            if exclude is not None:
+                keep = ~np.isin(ids, np.asarray(exclude))
+                d, ids = d[torch.from_numpy(keep)], ids[keep]
+            top = torch.topk(-d, min(n_cand, len(ids))).indices
+            d_all[i, :len(top)], i_all[i, :len(top)] = d[top], ids[top.numpy()]
+        if rerank and self.store is not None:   # one read from the store for all queries
+            valid = i_all >= 0
+            x = torch.zeros(nq, n_cand, self.dim)
+            x[torch.from_numpy(valid)] = self._prep(self.store.get(i_all[valid]))
+            d_all = torch.where(torch.from_numpy(valid), (x - q[:, None]).pow(2).sum(-1), d_all)
+        d_all, top = torch.topk(-d_all, min(k, n_cand))
+        dists, out_ids = np.full((nq, k), np.inf, dtype=np.float32), np.full((nq, k), -1, dtype=np.int64)
+        dists[:, :top.shape[1]], out_ids[:, :top.shape[1]] = -d_all.numpy(), np.take_along_axis(i_all, top.numpy(), 1)
+        return dists, out_ids
+
+# %% ../nbs/search.ipynb 9
+def save_index(index:IVFPQIndex, path:str):
+    "saves the index to the directory path"
+    os.makedirs(path, exist_ok=True)
+    lists = [index._list(l) for l in range(index.nlist)]
+    np.save(os.path.join(path, 'centroids.npy'), index.centroids.numpy())
+    np.save(os.path.join(path, 'codebooks.npy'), index.codebooks.numpy())
+    np.save(os.path.join(path, 'codes.npy'), np.concatenate([c for c, _ in lists]))
+    np.save(os.path.join(path, 'ids.npy'), np.concatenate([i for _, i in lists]))
+    np.save(os.path.join(path, 'offsets.npy'), np.cumsum([0] + [len(i) for _, i in lists]))
+    meta = {'dim': index.dim, 'nlist': index.nlist, 'm': index.m, 'nbits': index.nbits, 'metric': index.metric,
+            'added': {str(s): n for s, n in index.added.items()}, 'store': index.store and os.path.abspath(index.store.root)}
+    with open(os.path.join(path, 'meta.json'), 'w') as f: json.dump(meta, f)
+
+
+def load_index(
+    path:str,                  # directory written by save_index
+    store:EmbeddingStore=None, # for re-ranking; default: the store the index was built from, if it's still there
+    mmap=True,                 # memory-map the codes & ids instead of reading them in
+    ) -> IVFPQIndex:
+    "loads an index saved by save_index"
+    with open(os.path.join(path, 'meta.json')) as f: meta = json.load(f)
+    if store is None and meta['store'] and os.path.exists(os.path.join(meta['store'], 'meta.json')): store = EmbeddingStore(meta['store'])
+    index = IVFPQIndex(meta['dim'], meta['nlist'], meta['m'], meta['nbits'], meta['metric'], store=store)
+    load = lambda name: np.load(os.path.join(path, name), mmap_mode=('r' if mmap else None))
+    index.centroids, index.codebooks = torch.from_numpy(load('centroids.npy').copy()), torch.from_numpy(load('codebooks.npy').copy())
+    codes, ids, offsets = load('codes.npy'), load('ids.npy'), np.load(os.path.join(path, 'offsets.npy'))
+    index.codes = [[codes[a:b]] if b > a else [] for a, b in zip(offsets[:-1], offsets[1:])]
+    index.ids = [[ids[a:b]] if b > a else [] for a, b in zip(offsets[:-1], offsets[1:])]
+    index.added = {int(s): n for s, n in meta['added'].items()}
+    return index
+
+
+def build_index(
+    store:EmbeddingStore,
+    nlist=None,         # default: about 4*sqrt(len(store))
+    m=8, nbits=8, metric='l2',
+    train_size=100000,  # vectors to train on, sampled at random from the store
+    seed=0,
+    ) -> IVFPQIndex:
+    "trains an IVFPQIndex on a sample of the store's vectors, and adds all of them"
+    ids = np.array([row['id'] for row in store.index], dtype=np.int64)
+    nlist = nlist or max(1, int(4 * math.sqrt(len(ids))))
+    sample = np.random.default_rng(seed).choice(ids, min(train_size, len(ids)), replace=False)
+    index = IVFPQIndex(store.dim, nlist, m, nbits, metric, store=store).train(store.get(np.sort(sample)), seed=seed)
+    return index.add_from_store(store)
+
+# %% ../nbs/search.ipynb 11
+def find_stems(
+    index:IVFPQIndex,
+    zmix,              # a mix embedding, (dim,)
+    max_stems=6,
+    nprobe=8, rerank=100,
+    exclude=None,      # ids never to pick, e.g. the mix's own
+    ) -> tuple:
+    "greedy decomposition of zmix into a sum of indexed vectors; returns their ids and the remainder"
+    assert index.metric == 'l2', "find_stems needs an l2 index"
+    residual = torch.as_tensor(np.asarray(zmix, dtype=np.float32)).clone()
+    picked, exclude = [], list(exclude if exclude is not None else [])
+    for _ in range(max_stems):
+        _, ids = index.search(residual[None], k=1, nprobe=nprobe, rerank=rerank, exclude=exclude + picked)
+        if ids[0, 0] < 0: break
+        v = torch.from_numpy(index.store.get(ids[0]))[0] if index.store is not None else None
+        if v is None or (residual - v).norm() >= residual.norm(): break
+        picked.append(int(ids[0, 0])); residual -= v
+    return picked, residual
+
+# %% ../nbs/search.ipynb 13
+def exact_search(store:EmbeddingStore, q, k=10, metric='l2', batch_size=65536) -> tuple:
+    "brute-force squared distances & ids (nq, k) over the whole store, for ground truth"
+    q = torch.as_tensor(np.asarray(q, dtype=np.float32))
+    if metric == 'cosine': q = torch.nn.functional.normalize(q, dim=-1)
+    best_d, best_i = torch.full((len(q), 0), float('inf')), torch.zeros((len(q), 0), dtype=torch.int64)
+    for ids, vecs in store.iter_batches(batch_size):
+        x = torch.from_numpy(np.asarray(vecs, dtype=np.float32))
+        if metric == 'cosine': x = torch.nn.functional.normalize(x, dim=-1)
+        d = (q.pow(2).sum(-1, keepdim=True) - 2 * q @ x.T + x.pow(2).sum(-1)).clamp(min=0)
+        best_d, best_i = torch.cat([best_d, d], 1), torch.cat([best_i, torch.from_numpy(ids).expand(len(q), -1)], 1)
+        best_d, j = torch.topk(-best_d, min(k, best_d.shape[1]))
+        best_d, best_i = -best_d, best_i.gather(1, j)
+    return best_d.numpy(), best_i.numpy()
+
+
+def benchmark_index(
+    index:IVFPQIndex,
+    queries=None,          # (nq, dim); default: n_queries random vectors from index.store
+    n_queries=100,
+    k=10,
+    nprobes=(1, 2, 4, 8, 16, 32),
+    reranks=(0, 100),
+    print=print,
+    ) -> list:
+    "recall@k against brute force, and per-query latency, for each nprobe & rerank setting (queries are searched as one batch)"
+    store = index.store
+    if queries is None:
+        ids = np.array([row['id'] for row in store.index], dtype=np.int64)
+        queries = store.get(np.random.default_rng(0).choice(ids, min(n_queries, len(ids)), replace=False))
+    t0 = time.perf_counter()
+    _, truth = exact_search(store, queries, k, index.metric)
+    exact_ms = 1000 * (time.perf_counter() - t0) / len(queries)
+    print(f"brute force: {exact_ms:.3f} ms/query over {len(store)} vectors")
+    results = []
+    for rerank in reranks:
+        for nprobe in nprobes:
+            t0 = time.perf_counter()
+            _, found = index.search(queries, k, nprobe=nprobe, rerank=rerank)
+            ms = 1000 * (time.perf_counter() - t0) / len(queries)
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            results.append({'nprobe': nprobe, 'rerank': rerank, f'recall@{k}': recall, 'ms_per_query': ms, 'speedup': exact_ms / ms})
+            print(f"nprobe {nprobe:3d}, rerank {rerank:4d}: recall@{k} {recall:.3f}, {ms:.3f} ms/query ({exact_ms/ms:.1f}x brute force)")
+    return results
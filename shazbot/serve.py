@@ -0,0 +1,284 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/serve.ipynb.
+
+# %% auto 0
+__all__ = ['to_npy', 'from_npy', 'read_headers', 'EmbedServer', 'EmbedClient', 'run_async', 'load_test', 'benchmark_server',
+           'main']
+
+# %% ../nbs/serve.ipynb 3
+import io
+import json
+import time
+import asyncio
+import argparse
+import threading
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+from .inference import load_embedder
+
+# %% ../nbs/serve.ipynb 5
+def to_npy(a) -> bytes:
+    f = io.BytesIO()
+    np.save(f, np.asarray(a), allow_pickle=False)
+    return f.getvalue()
+
+def from_npy(b:bytes) -> np.ndarray:
+    return np.load(io.BytesIO(b), allow_pickle=False)
+
+
+async def read_headers(reader) -> dict:
+    "reads HTTP headers up to the blank line, with lower-cased names"
+    headers = {}
+    while True:
+        h = await reader.readline()
+        if h in (b'\r\n', b'\n', b''): return headers
+        k, v = h.decode().split(':', 1)
+        headers[k.strip().lower()] = v.strip()
+
+
+class EmbedServer():
+    "asyncio HTTP front end that coalesces concurrent embed requests into batches for one warm model"
+    def __init__(self,
+        model,               # audio (b, 2, n) -> latents (b, n_frames, d), e.g. from inference.load_embedder
+        max_batch=32,        # most requests per forward pass
+        max_wait_ms=5.0,     # longest a request waits for others to batch with
+        device='cpu',
+        warmup_samples=None, # length of a dummy batch to run at startup; default: 1 second at the model's sample rate
+        keep_stats=10000,    # latencies to keep for the percentiles
+        ):
+        self.model, self.max_batch, self.max_wait, self.device = model, max_batch, max_wait_ms / 1000, device
+        self.warmup_samples = warmup_samples or getattr(model, 'meta', {}).get('sample_rate', 16000)
+        self.latencies, self.batch_sizes, self.n_requests = deque(maxlen=keep_stats), Counter(), 0
+        self.pending, self.server = [], None
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='embed-worker')
+
+    def _forward(self, audio:list) -> list:
+        "runs on the worker thread"
+        with torch.inference_mode():
+            z = self.model(torch.from_numpy(np.stack(audio)).to(self.device))
+        return list(z.float().cpu().numpy())
+
+    async def start(self, host='127.0.0.1', port=8765, unix_socket=None):
+        "warms up the model and starts listening; port=0 picks a free port (see self.port)"
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._forward, [np.zeros((2, self.warmup_samples), np.float32)])
+        self._wake = asyncio.Event()
+        self._batcher = asyncio.create_task(self._batch_loop())
+        if unix_socket: self.server = await asyncio.start_unix_server(self._handle, path=unix_socket)
+        else:           self.server = await asyncio.start_server(self._handle, host, port)
+        self.port = None if unix_socket else self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self._batcher.cancel()
+        self.executor.shutdown()
+
+    async def embed(self, audio) -> np.ndarray:
+        "queues one clip (2, n) or (n,) for the next batch; returns its latents (n_frames, d)"
+        audio = np.asarray(audio, dtype=np.float32)
+        if audio.ndim == 1: audio = np.stack([audio, audio])
+        assert audio.ndim == 2 and audio.shape[0] == 2, f"expected audio (2, n) or (n,), got {audio.shape}"
+        fut = asyncio.get_running_loop().create_future()
+        self.pending.append((time.perf_counter(), audio, fut))
+        self._wake.set()
+        return await fut
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self.pending:
+                self._wake.clear()
+                await self._wake.wait()
+            t_first, first, _ = self.pending[0]
+            same = lambda: [r for r in self.pending if r[1].shape == first.shape][:self.max_batch]
+            while len(same()) < self.max_batch:   # wait for more, but no longer than max_wait after the oldest arrived
+                timeout = t_first + self.max_wait - time.perf_counter()
+                if timeout <= 0: break
+                self._wake.clear()
+                try: await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError: break
+            batch = same()
+            self.pending = [r for r in self.pending if all(r is not b for b in batch)]
+            try:
+                out = await loop.run_in_executor(self.executor, self._forward, [a for _, a, _ in batch])
+                for (_, _, fut), z in zip(batch, out):
+                    if not fut.done(): fut.set_result(z)
+            except Exception as e:   # retry one by one, so one bad clip can't fail the others it got batched with
+                for _, a, fut in batch:
+                    try: z = e if len(batch) == 1 else (await loop.run_in_executor(self.executor, self._forward, [a]))[0]
+                    except Exception as e1: z = e1
+                    if fut.done(): continue
+                    if isinstance(z, Exception): fut.set_exception(z)
+                    else: fut.set_result(z)
+            t = time.perf_counter()
+            self.latencies.extend(1000 * (t - t0) for t0, _, _ in batch)
+            self.batch_sizes[len(batch)] += 1
+            self.n_requests += len(batch)
+
+    def stats(self) -> dict:
+        "latency percentiles (ms) over recent requests, and how many batches there were of each size"
+        lat = np.array(self.latencies) if self.latencies else np.zeros(1)
+        n_batches = sum(self.batch_sizes.values())
+        return {'requests': self.n_requests, 'batches': n_batches, 'mean_batch': self.n_requests / max(n_batches, 1),
+                **{f'p{p}_ms': float(np.percentile(lat, p)) for p in (50, 90, 99)}, 'max_ms': float(lat.max()),
+                'batch_hist': {int(k): v for k, v in sorted(self.batch_sizes.items())}}
+
+    def reset_stats(self):
+        self.latencies.clear(); self.batch_sizes.clear(); self.n_requests = 0
+
+    async def _handle(self, reader, writer):
+        "one HTTP/1.1 connection, with keep-alive"
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                try:
+                    method, path, _ = line.decode().split(' ', 2)
+                    headers = await read_headers(reader)
+                    length = int(headers.get('content-length', 0))
+                    if length < 0: raise ValueError(f"negative content-length {length}")
+                except (ValueError, UnicodeDecodeError) as e:   # can't tell where this request ends, so answer and hang up
+                    await self._respond(writer, '400 Bad Request', 'text/plain', f"malformed request: {e}".encode())
+                    break
+                body = await reader.readexactly(length)
+                await self._respond(writer, *await self._route(method, path, body))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, ctype, out:bytes):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(out)}\r\n\r\n".encode() + out)
+        await writer.drain()
+
+    async def _route(self, method, path, body) -> tuple:
+        if method == 'POST' and path == '/embed':
+            try: audio = from_npy(body)
+            except Exception as e: return '400 Bad Request', 'text/plain', f"body should be a .npy array: {e}".encode()
+            try: return '200 OK', 'application/octet-stream', to_npy(await self.embed(audio))
+            except AssertionError as e: return '400 Bad Request', 'text/plain', str(e).encode()
+            except Exception as e: return '500 Internal Server Error', 'text/plain', f"{type(e).__name__}: {e}".encode()
+        if method == 'GET' and path == '/stats':
+            return '200 OK', 'application/json', json.dumps(self.stats()).encode()
+        return '404 Not Found', 'text/plain', b"try POST /embed or GET /stats"
+
+# %% ../nbs/serve.ipynb 7
+class EmbedClient():
+    "async client for an EmbedServer, over one keep-alive connection (use one per concurrent caller)"
+    def __init__(self, host='127.0.0.1', port=8765, unix_socket=None):
+        self.host, self.port, self.unix_socket, self.reader = host, port, unix_socket, None
+
+    async def _request(self, method, path, body=b'') -> bytes:
+        if self.reader is None:
+            if self.unix_socket: self.reader, self.writer = await asyncio.open_unix_connection(self.unix_socket)
+            else:                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        await self.writer.drain()
+        status = (await self.reader.readline()).decode().split(' ', 2)
+        if len(status) < 2:
+            self.reader = None
+            raise ConnectionError(f"{method} {path}: the server closed the connection without a response")
+        headers = await read_headers(self.reader)
+        out = await self.reader.readexactly(int(headers['content-length']))
+        if status[1] != '200': raise RuntimeError(f"{' '.join(status[1:]).strip()}: {out.decode()}")
+        return out
+
+    async def embed(self, audio) -> np.ndarray:
+        return from_npy(await self._request('POST', '/embed', to_npy(np.asarray(audio, dtype=np.float32))))
+
+    async def stats(self) -> dict:
+        return json.loads(await self._request('GET', '/stats'))
+
+    async def close(self):
+        if self.reader is not None:
+            self.writer.close()
+            self.reader = None
+
+# %% ../nbs/serve.ipynb 9
+def run_async(coro):
+    "runs a coroutine to completion, also from inside a notebook, where an event loop is already running"
+    try: asyncio.get_running_loop()
+    except RuntimeError: return asyncio.run(coro)
+    result = {}
+    def target():
+        try: result['value'] = asyncio.run(coro)
+        except BaseException as e: result['error'] = e
+    t = threading.Thread(target=target)
+    t.start(); t.join()
+    if 'error' in result: raise result['error']
+    return result['value']
+
+
+async def load_test(
+    host='127.0.0.1', port=8765, unix_socket=None,
+    concurrency=16,        # clients sending at the same time
+    n_requests=256,        # total requests
+    n_samples=16384,       # length of each clip
+    ) -> dict:
+    "throughput & client-side latency percentiles (ms) for n_requests random clips"
+    clips = [0.1 * np.random.randn(2, n_samples).astype(np.float32) for _ in range(min(n_requests, 16))]
+    latencies, counter = [], iter(range(n_requests))
+    async def client_loop():
+        client = EmbedClient(host, port, unix_socket)
+        for i in counter:
+            t0 = time.perf_counter()
+            await client.embed(clips[i % len(clips)])
+            latencies.append(1000 * (time.perf_counter() - t0))
+        await client.close()
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - t0
+    lat = np.array(latencies)
+    return {'concurrency': concurrency, 'requests': n_requests, 'req_per_sec': n_requests / elapsed,
+            **{f'p{p}_ms': float(np.percentile(lat, p)) for p in (50, 90, 99)}}
+
+
+def benchmark_server(
+    model,                              # as for EmbedServer
+    settings=({'max_batch': 1}, {'max_batch': 32, 'max_wait_ms': 5}), # EmbedServer kwargs to compare
+    concurrencies=(1, 8, 32),
+    n_requests=256, n_samples=16384,
+    unix_socket=None,                   # default: a TCP port on localhost
+    print=print,
+    ) -> list:
+    "load-tests an in-process server for each setting & concurrency; returns a list of dicts of client & server stats"
+    async def run():
+        results = []
+        for kwargs in settings:
+            server = await EmbedServer(model, warmup_samples=n_samples, **kwargs).start(port=0, unix_socket=unix_socket)
+            for c in concurrencies:
+                server.reset_stats()
+                res = await load_test(port=server.port, unix_socket=unix_socket, concurrency=c, n_requests=n_requests, n_samples=n_samples)
+                s = server.stats()
+                res.update(kwargs, mean_batch=s['mean_batch'], batch_hist=s['batch_hist'], server_p99_ms=s['p99_ms'])
+                print(f"{kwargs}, concurrency {c:3d}: {res['req_per_sec']:7.1f} req/s, p50 {res['p50_ms']:7.2f} ms, "
+                      f"p99 {res['p99_ms']:7.2f} ms, mean batch {res['mean_batch']:.1f}")
+                results.append(res)
+            await server.close()
+        return results
+    return run_async(run())
+
+# %% ../nbs/serve.ipynb 11
+def main():
+    "embed_server <model> [options]: serves an exported model until interrupted"
+    parser = argparse.ArgumentParser(description="Local dynamic-batching server for an exported AudioAlgebra embedding model",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('model', help="model file saved by shazbot.inference.export_embedder")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix_socket', default=None, help="listen on this unix socket instead of a TCP port")
+    parser.add_argument('--max_batch', type=int, default=32)
+    parser.add_argument('--max_wait_ms', type=float, default=5.0)
+    parser.add_argument('--num_threads', type=int, default=None, help="torch threads")
+    args = parser.parse_args()
+
+    async def serve():
+        server = await EmbedServer(load_embedder(args.model, num_threads=args.num_threads), args.max_batch, args.max_wait_ms).start(
+            args.host, args.port, args.unix_socket)
+        print(f"embed_server: listening on {args.unix_socket or f'http://{args.host}:{server.port}'}", flush=True)
+        await server.server.serve_forever()
+    try: asyncio.run(serve())
+    except KeyboardInterrupt: pass
@@ -0,0 +1,121 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/streaming.ipynb.
+
+# %% auto 0
+__all__ = ['StreamingEncoder', 'check_streaming', 'benchmark_streaming']
+
+# %% ../nbs/streaming.ipynb 3
+import time
+import math
+from copy import deepcopy
+import torch
+from torch import nn
+import cached_conv as cc
+from einops import rearrange
+from encoders.encoders import RAVEEncoder
+from .core import freeze
+from .train_aa_mixer import DiffusionDVAE, ad_encode_it
+
+# %% ../nbs/streaming.ipynb 5
+class StreamingEncoder(nn.Module):
+    "Streaming front end for the AD encoder path (RAVEEncoder + quantizer): push audio blocks in, get latent frames out"
+    def __init__(self,
+        dvae,             # a DiffusionDVAE with trained weights. its encoder_ema & quantizer_ema get used
+        global_args,      # same args the DiffusionDVAE was made with
+        num_quantizers=None, # default: global_args.num_quantizers
+        ):
+        super().__init__()
+        assert global_args.pqmf_bands == 1, "streaming with PQMF sub-bands isn't supported"
+        cc.use_cached_conv(True)   # only affects layers constructed while it's on
+        try:
+            self.encoder = RAVEEncoder(2 * global_args.pqmf_bands, 64, global_args.latent_dim, ratios=DiffusionDVAE.ratios)
+        finally:
+            cc.use_cached_conv(False)
+        self.encoder.load_state_dict(dvae.encoder_ema.state_dict())
+        self.num_quantizers = global_args.num_quantizers if num_quantizers is None else num_quantizers
+        self.quantizer = deepcopy(dvae.quantizer_ema) if self.num_quantizers > 0 else None
+        self.latent_dim = global_args.latent_dim
+        self.hop_length = math.prod(DiffusionDVAE.ratios)              # samples per latent frame
+        self.delay = getattr(self.encoder, 'cumulative_delay', 0)     # latent frames of lag vs. the offline encoder
+        self.eval()
+        freeze(self)
+        self.pending = None   # leftover samples that don't yet make up a whole frame
+
+    def reset(self):
+        "forget the stream so far: clears leftover samples and zeros the conv caches"
+        self.pending = None
+        for m in self.encoder.modules():
+            if isinstance(m, cc.CachedPadding1d) and m.initialized: m.pad.zero_()
+
+    @torch.no_grad()
+    def forward(self,
+        block,            # next block of audio, (b, 2, n) for any n. b must stay the same for the whole stream
+        ):
+        "returns whatever latent frames are now complete, (b, d, k). k may be 0 for short blocks"
+        if self.pending is not None: block = torch.cat([self.pending, block], -1)
+        n_ready = (block.shape[-1] // self.hop_length) * self.hop_length
+        block, self.pending = block[..., :n_ready], block[..., n_ready:]
+        if n_ready == 0:
+            return block.new_zeros([block.shape[0], self.latent_dim, 0])
+        tokens = self.encoder(block)
+        if self.quantizer is not None:
+            tokens = rearrange(tokens, 'b d n -> b n d')
+            tokens, _ = self.quantizer(tokens)
+            tokens = rearrange(tokens, 'b n d -> b d n')
+        return tokens
+
+    def encode_stream(self, blocks):
+        "convenience: runs an iterable of blocks through, yielding latent frames as they become available"
+        for block in blocks:
+            z = self(block)
+            if z.shape[-1] > 0: yield z
+
+# %% ../nbs/streaming.ipynb 7
+def check_streaming(
+    senc:StreamingEncoder, # streaming encoder to check
+    dvae,                  # the DiffusionDVAE it was made from
+    audio,                 # test audio, (b, 2, n)
+    block_size=512,        # samples per streamed block
+    atol=1e-4,             # tolerance for the comparison
+    ):
+    "streams audio through senc in blocks and compares with offline ad_encode_it. returns (matches, max abs error)"
+    senc.reset()
+    device = next(senc.encoder.parameters()).device
+    with torch.no_grad():
+        offline = ad_encode_it(audio, device, dvae, num_quantizers=senc.num_quantizers)
+        streamed = torch.cat(list(senc.encode_stream(audio.to(device).split(block_size, -1))), -1)
+    senc.reset()
+    d = senc.delay
+    n = min(offline.shape[-1], streamed.shape[-1]) - d
+    # the streamed output lags the offline output by d frames: streamed frame t+d is offline frame t
+    err = (streamed[..., 2*d:n] - offline[..., d:n-d]).abs().max().item()
+    return err <= atol, err
+
+# %% ../nbs/streaming.ipynb 9
+def benchmark_streaming(
+    senc:StreamingEncoder,
+    block_sizes=(256, 512, 1024, 2048, 4096), # samples per block
+    seconds=10.0,        # length of (random) audio to stream for each block size
+    sample_rate=44100,
+    device='cpu',
+    num_threads=None,    # torch intra-op threads; None = leave as is
+    ) -> list:
+    "streams random audio at each block size; returns a list of dicts of latency stats in ms, and real-time factor"
+    if num_threads is not None: torch.set_num_threads(num_threads)
+    senc = senc.to(device)
+    results = []
+    for bs in block_sizes:
+        senc.reset()
+        audio = 0.1 * torch.randn([1, 2, int(seconds * sample_rate)], device=device)
+        times = []
+        for block in audio.split(bs, -1):
+            t0 = time.perf_counter()
+            senc(block)
+            times.append(time.perf_counter() - t0)
+        times = torch.tensor(times[1:]) * 1000   # skip first call, which allocates the caches
+        block_ms = 1000 * bs / sample_rate
+        results.append({'block_size': bs, 'block_ms': block_ms,
+            'p50_ms': times.quantile(0.5).item(), 'p99_ms': times.quantile(0.99).item(), 'max_ms': times.max().item(),
+            'rtf': times.mean().item() / block_ms,
+            'latency_ms': times.quantile(0.99).item() + 1000 * (senc.delay + 1) * senc.hop_length / sample_rate})
+        senc.reset()
+    return results
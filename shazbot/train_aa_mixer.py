@@ -1,18 +1,24 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/train_aa_mixer.ipynb.
 
 # %% auto 0
-__all__ = ['DiffusionDVAE', 'setup_weights', 'ad_encode_it', 'EmbedBlock', 'AudioAlgebra', 'get_alphas_sigmas',
-           'get_crash_schedule', 'alpha_sigma_to_t', 'sample', 'make_eps_model_fn', 'make_autocast_model_fn',
-           'transfer', 'prk_step', 'plms_step', 'prk_sample', 'plms_sample', 'pie_step', 'plms2_step', 'pie_sample',
-           'plms2_sample', 'make_cond_model_fn', 'demo', 'get_stems_faders', 'main']
+__all__ = ['DiffusionDVAE', 'setup_weights', 'ad_encode_it', 'embed_long', 'quantize_dvae_encoder', 'EmbedBlock',
+           'in_batch_negatives', 'AudioAlgebra', 'get_alphas_sigmas', 'get_crash_schedule', 'alpha_sigma_to_t',
+           'sample', 'make_eps_model_fn', 'make_autocast_model_fn', 'transfer', 'prk_step', 'plms_step', 'prk_sample',
+           'plms_sample', 'pie_step', 'plms2_step', 'pie_sample', 'plms2_sample', 'make_cond_model_fn', 'wandb_audio',
+           'demo', 'crossfade_window', 'max_batch_for_memory', 'decode_long', 'DemoWorker', 'VizWorker',
+           'get_stems_faders', 'MicroBatcher', 'train_step', 'tiny_dvae', 'launch_local', 'check_ddp_sync',
+           'benchmark_ddp_scaling', 'check_stragglers', 'sync_tuning', 'main']
 
 # %% ../nbs/train_aa_mixer.ipynb 4
 from prefigure.prefigure import get_all_args, push_wandb_config
 from copy import deepcopy
 import math
 import json
+import threading, queue
+import time, socket, argparse, contextlib, warnings
 
 import accelerate
+from accelerate.utils import broadcast_object_list
 import os, sys
 import torch
 import torchaudio
@@ -28,11 +34,15 @@ import wandb
 import subprocess
 
 from aeiou.viz import embeddings_table, pca_point_cloud, audio_spectrogram_image, tokens_spectrogram_image
-from aeiou.hpc import load, save, HostPrinter
-from .core import n_params, freeze, Mish
+from aeiou.hpc import load, HostPrinter
+from .core import save, n_params, freeze, Mish, measure_peak_memory, fit_batch_to_memory, encode_long
+from .core import set_precision, precision_for, autocast, check_precision, quantize_frozen, compare_inference
+from .core import StepProfiler, set_profiler, phase, OnDemandTrace, DeviceMetrics, StreamingPCA, Heartbeat
+from .core import get_rng_state, set_rng_state
+from .tune import autotune, aa_step_fn, tuning_file, tuning_key, save_tuning, load_tuning, apply_tuning
 #import shazbot.blocks_utils as blocks_utils
 from .icebox import load_audio_for_jbx, IceBoxModel
-from .data import MultiStemDataset
+from .data import MultiStemDataset, ResumableSampler
 
 
 # audio-diffusion imports
@@ -48,6 +58,8 @@ from decoders.diffusion_decoder import DiffusionDecoder
 # %% ../nbs/train_aa_mixer.ipynb 5
 #audio diffusion classes
 class DiffusionDVAE(nn.Module):
+    ratios = [2, 2, 2, 2, 4, 4]   # encoder downsampling ratios; one latent frame per prod(ratios)=256 samples
+
     def __init__(self, global_args, device):
         super().__init__()
         self.device = device
@@ -57,7 +69,7 @@ class DiffusionDVAE(nn.Module):
         if self.pqmf_bands > 1:
             self.pqmf = PQMF(2, 70, global_args.pqmf_bands)
 
-        self.encoder = RAVEEncoder(2 * global_args.pqmf_bands, 64, global_args.latent_dim, ratios=[2, 2, 2, 2, 4, 4])
+        self.encoder = RAVEEncoder(2 * global_args.pqmf_bands, 64, global_args.latent_dim, ratios=self.ratios)
         self.encoder_ema = deepcopy(self.encoder)
             
         self.diffusion = DiffusionDecoder(global_args.latent_dim, 2)
@@ -121,7 +133,7 @@ class DiffusionDVAE(nn.Module):
         targets = noise * alphas - reals * sigmas
 
         # Compute the model output and the loss.
-        with torch.cuda.amp.autocast():
+        with autocast(reals.device):
             tokens = self.encoder(encoder_input).float()
 
         if self.num_quantizers > 0:
@@ -133,7 +145,7 @@ class DiffusionDVAE(nn.Module):
 
             tokens = rearrange(tokens, 'b n d -> b d n')
 
-        with torch.cuda.amp.autocast():
+        with autocast(reals.device):
             v = self.diffusion(noised_reals, t, tokens)
             mse_loss = F.mse_loss(v, targets)
             loss = mse_loss
@@ -170,16 +182,62 @@ def ad_encode_it(reals, device, dvaemodel, sample_size=32768, num_quantizers=8):
     encoder_input = reals.to(device)
     noise = torch.randn([reals.shape[0], 2, sample_size]).to(device)
 
-    tokens = dvaemodel.encoder_ema(encoder_input)
-    if num_quantizers > 0:
-        #Rearrange for Memcodes
-        tokens = rearrange(tokens, 'b d n -> b n d')
-        tokens, _= dvaemodel.quantizer_ema(tokens)
-        tokens = rearrange(tokens, 'b n d -> b d n')
+    with autocast(encoder_input.device):
+        tokens = dvaemodel.encoder_ema(encoder_input)
+        if num_quantizers > 0:
+            #Rearrange for Memcodes
+            tokens = rearrange(tokens, 'b d n -> b n d')
+            tokens, _= dvaemodel.quantizer_ema(tokens)
+            tokens = rearrange(tokens, 'b n d -> b d n')
 
-    return tokens
+    return tokens.float()
+
+
+def embed_long(
+    audio,             # audio of any length, (c, n), at the encoder's sample rate
+    model,             # frozen encoder: a DiffusionDVAE or an IceBoxModel
+    win_len=32768,     # window length in samples
+    hop=None,          # hop between windows in samples; default = win_len (no overlap)
+    max_batch=None,    # max windows per encoder call. None = choose from mem_target
+    mem_target=2**30,  # peak memory target in bytes
+    level=0,           # which Jukebox level to return (IceBoxModel only)
+    num_quantizers=8,  # (DiffusionDVAE only)
+    ):
+    "embeds a whole track with bounded memory; returns latents (d, n_frames). For IceBox, d=1 and the latents are codes"
+    if isinstance(model, IceBoxModel):
+        device = next(model.parameters()).device
+        audio = audio.mean(0, keepdim=True)  # jukebox is mono
+        def encode_fn(x):
+            x = rearrange(x.to(device), 'b c n -> b n c')
+            return model.encode(x, levels=[level])[0].unsqueeze(1)
+    else:
+        device = model.device
+        encode_fn = lambda x: ad_encode_it(x, device, model, num_quantizers=num_quantizers)
+    return encode_long(audio.to(device), encode_fn, win_len=win_len, hop=hop, max_batch=max_batch, mem_target=mem_target)
 
 # %% ../nbs/train_aa_mixer.ipynb 7
+def quantize_dvae_encoder(
+    dvae,                      # a frozen DiffusionDVAE
+    mode='int8',               # 'int8', 'fp16' or 'bf16', see core.quantize_frozen
+    calib=None,                # list of audio batches (b, 2, n) to calibrate int8 with
+    quantize_quantizer=False,  # the residual memcodes too? they pick discrete codes, which small errors can flip
+    print=print,
+    ) -> nn.Module:
+    "a CPU stand-in for dvae with a low-precision copy of its frozen encoder (encoder_ema & quantizer_ema)"
+    qdvae = nn.Module()
+    qdvae.device, qdvae.num_quantizers = torch.device('cpu'), getattr(dvae, 'num_quantizers', 0)
+    calib = None if calib is None else [x.cpu() for x in calib]
+    qdvae.encoder_ema = quantize_frozen(dvae.encoder_ema, mode, calib=calib, print=print)
+    if qdvae.num_quantizers > 0:
+        if quantize_quantizer:
+            with torch.inference_mode():
+                tokens = None if calib is None else [rearrange(dvae.encoder_ema(x.to(dvae.device)).float().cpu(), 'b d n -> b n d') for x in calib]
+            qdvae.quantizer_ema = quantize_frozen(dvae.quantizer_ema, mode, calib=tokens, print=print)
+        else:
+            qdvae.quantizer_ema = deepcopy(dvae.quantizer_ema).cpu().eval()
+    return qdvae.eval()
+
+# %% ../nbs/train_aa_mixer.ipynb 9
 class EmbedBlock(nn.Module):
     def __init__(self, dims:int, **kwargs) -> None:
         super().__init__()
@@ -196,6 +254,35 @@ class EmbedBlock(nn.Module):
         return self.act(x)
 
 
+def in_batch_negatives(
+    zsum,              # predicted mix latents (b, n, d)
+    zmix,              # target mix latents (b, n, d)
+    mode='hard',       # 'hard': the other item's zsum closest to this zmix; 'semihard': the closest one that's still
+                       #   farther than this item's own zsum; 'random': any other item's
+    exclude=None,      # optional (b, b) bool mask of pairs that mustn't be negatives, e.g. items sharing stems
+    ):
+    """Negatives for the triplet loss from the batch itself: for each item i, the stem sum zsum[j] of some other item j,
+    picked from the masked (b, b) matrix of distances between zsum[j] & zmix[i]. So no extra encoder passes.
+    Returns znegsum like zsum (None for a batch of one). Items whose every pair is excluded ignore `exclude`"""
+    b = zsum.shape[0]
+    if b < 2: return None
+    with torch.no_grad():
+        dist = torch.cdist(zmix.detach().flatten(1).float()[None], zsum.detach().flatten(1).float()[None])[0]   # [i, j]
+        eye = torch.eye(b, dtype=torch.bool, device=zsum.device)
+        bad = eye if exclude is None else eye | exclude.to(zsum.device)
+        if mode == 'random':
+            dist = torch.rand_like(dist)
+        elif mode == 'semihard':    # if nothing's farther than the positive, fall back to the hardest
+            farther = dist > dist.diagonal()[:, None]
+            dist = torch.where(farther, dist, dist + dist.max() + 1)
+        elif mode != 'hard':
+            raise ValueError(f"mode should be 'hard', 'semihard' or 'random', not {mode!r}")
+        masked = dist.masked_fill(bad, float('inf'))
+        none_left = torch.isinf(masked).all(1)   # everything excluded: better an imperfect negative than none
+        masked[none_left] = dist[none_left].masked_fill(eye[none_left], float('inf'))
+    return zsum[masked.argmin(1)]
+
+
 class AudioAlgebra(nn.Module):
     def __init__(self, global_args, device, enc_model):
         super().__init__()
@@ -205,6 +292,9 @@ class AudioAlgebra(nn.Module):
         self.dims = global_args.latent_dim
         self.sample_size = global_args.sample_size
         self.num_quantizers = global_args.num_quantizers
+        self.loss_type = getattr(global_args, 'loss_type', 'noshrink')
+        self.margin = getattr(global_args, 'margin', 1.0)
+        self.negatives = getattr(global_args, 'negatives', 'hard')   # how to pick in-batch negatives for the triplet loss
 
         self.reembedding = nn.Sequential(  # something simple at first
             EmbedBlock(self.dims),
@@ -223,35 +313,46 @@ class AudioAlgebra(nn.Module):
         frozen-encoder embeddings for each (fader-adjusted) stem and for the total mix.
         "z0" denotes an embedding from the frozen encoder, "z" denotes re-mapped embeddings
         in (hopefully) the learned vector space"""
-        with torch.cuda.amp.autocast():
+        with autocast(self.device):
             zs, z0s, zsum, z0sum = [], [], None, None
             mix = torch.zeros_like(stems[0]).float()
             #print("mix.shape = ",mix.shape)
             for s, f in zip(stems, faders):
                 mix_s = s * f             # audio stem adjusted by gain fader f
-                with torch.no_grad():
+                with torch.no_grad(), phase('encode'):
                     #z0 = self.encoder.encode(mix_s).float()  # initial/frozen embedding/latent for that input
                     z0 = ad_encode_it(mix_s, self.device, self.enc_model, sample_size=self.sample_size, num_quantizers=self.num_quantizers)
                 z0sum = z0 if z0sum is None else z0sum + z0 
                 #print("z0.shape = ",z0.shape)  # most likely [8,32,152]
                 z0 = rearrange(z0, 'b d n -> b n d')
-                z = self.reembedding(z0).float()   # <-- this is the main work of the model
+                with phase('reembed'):
+                    z = self.reembedding(z0).float()   # <-- this is the main work of the model
                 zsum = z if zsum is None else zsum + z # compute the sum of all the z's. we'll end up using this in our (metric) loss as "pred"
                 mix += mix_s              # save a record of full audio mix
                 zs.append(z)              # save a list of individual z's
                 z0s.append(z0)            # save a list of individual z0's
 
-            with torch.no_grad():
+            with torch.no_grad(), phase('encode'):
                 #z0mix = self.encoder.encode(mix).float()  # compute frozen embedding / latent for the full mix
                 z0mix = ad_encode_it(mix, self.device, self.enc_model, sample_size=self.sample_size, num_quantizers=self.num_quantizers)
             z0mix = rearrange(z0mix, 'b d n -> b n d')
-            zmix = self.reembedding(z0mix).float()        # map that according to our learned re-embedding. this will be the "target" in the metric loss
+            with phase('reembed'):
+                zmix = self.reembedding(z0mix).float()        # map that according to our learned re-embedding. this will be the "target" in the metric loss
             z0mix = rearrange(z0mix, 'b n d -> b d n')
             
             archive = {'zs':zs, 'mix':mix, 'znegsum':None, 'z0s': z0s, 'z0sum':z0sum, 'z0mix':z0mix}
 
         return zsum, zmix, archive    # zsum = pred, zmix = target, and "archive" of extra stuff zs & zmix are just for extra info
 
+    def embed(self,
+        audio,        # (b, 2, n), e.g. one fader-adjusted stem
+        ):
+        "frozen-encoder + re-embedding latents (b, n_frames, d), i.e. one stem's term in zsum. See inference.FaderSession"
+        with torch.no_grad():
+            z0 = ad_encode_it(audio, self.device, self.enc_model, sample_size=self.sample_size, num_quantizers=self.num_quantizers)
+        with autocast(self.device):
+            return self.reembedding(rearrange(z0, 'b d n -> b n d')).float()
+
 
     def mag(self, v):
         return torch.norm( v, dim=(1,2) ) # L2 / Frobenius / Euclidean
@@ -260,8 +361,13 @@ class AudioAlgebra(nn.Module):
         return self.mag(pred - targ)
     
 
-    def loss(self, zsum, zmix, archive, margin=1.0, loss_type='noshrink'):
-        with torch.cuda.amp.autocast():
+    def loss(self, zsum, zmix, archive, margin=None, loss_type=None, negatives=None):
+        "margin, loss_type & negatives default to the global_args the model was made with"
+        margin = self.margin if margin is None else margin
+        loss_type = self.loss_type if loss_type is None else loss_type
+        if 'triplet' == loss_type and archive['znegsum'] is None:   # negatives from the rest of the batch
+            archive['znegsum'] = in_batch_negatives(zsum, zmix, mode=self.negatives if negatives is None else negatives)
+        with autocast(zsum.device):
             dist = self.distance(zsum, zmix) # for each member of batch, compute distance
             loss = (dist**2).mean()  # mean across batch; so loss range doesn't change w/ batch_size hyperparam
             #print("dist = ",dist)
@@ -275,7 +381,7 @@ class AudioAlgebra(nn.Module):
                 loss += 1/300*(sum(magdiffs2)/len(magdiffs2)).mean() # mean of l2 of diff in vector mag  extra .mean() for good measure  
         return loss
 
-# %% ../nbs/train_aa_mixer.ipynb 9
+# %% ../nbs/train_aa_mixer.ipynb 13
 # Define the noise schedule and sampling loop
 def get_alphas_sigmas(t):
     """Returns the scaling factors for the clean image (alpha) and for the
@@ -308,7 +414,7 @@ def sample(model, x, steps, eta, logits, post_every=25):
     for i in trange(steps):
 
         # Get the model output (v, the predicted velocity)
-        with torch.cuda.amp.autocast():
+        with autocast(x.device):
             v = model(x, ts * t[i], logits).float()
 
         # Predict the noise and the denoised image
@@ -351,7 +457,7 @@ def make_eps_model_fn(model):
 
 def make_autocast_model_fn(model, enabled=True):
     def autocast_model_fn(*args, **kwargs):
-        with torch.cuda.amp.autocast(enabled):
+        with autocast(args[0].device, enabled):
             return model(*args, **kwargs).float()
     return autocast_model_fn
 
@@ -488,40 +594,473 @@ def make_cond_model_fn(model, cond):
   return cond_model_fn
 
 
-def demo(model, log_dict, zsum, zmix, demo_samples, step, demo_steps=250, sr=48000):
-    demo_batch_size=zsum.shape[0]
-    
-    noise = torch.randn([demo_batch_size, 2, demo_samples]).to(model.device)          
-    model_fn = make_cond_model_fn(model.diffusion_ema, zsum0)
-
-    # Run the sampler
-    fakes = sample(model.diffusion_ema, noise, 500, 1, zsum)
-    fakes = rearrange(fakes, 'b d n -> d (b n)')
-    filename = f'zsum_{step:08}.wav'
-    fakes = fakes.clamp(-1, 1).mul(32767).to(torch.int16).cpu()
-    torchaudio.save(filename, fakes, self.sample_rate)
-    log_dict['zsum'] = wandb.Audio(filename, sample_rate=sr, caption='zsum')
-    fakes = sample(model.diffusion_ema, noise, demo_steps, 1, zmix)
-    fakes = rearrange(fakes, 'b d n -> d (b n)')
-    filename = f'zmix_{step:08}.wav'
-    fakes = fakes.clamp(-1, 1).mul(32767).to(torch.int16).cpu()
-    torchaudio.save(filename, fakes, self.sample_rate)
-    log_dict['zmix'] = wandb.Audio(filename, sample_rate=sr, caption='zmix')                                                          
+def wandb_audio(audio, sr, caption):
+    "packs a batch of audio (b, d, n) as one in-memory int16 wandb.Audio clip, no wav file needed"
+    audio = rearrange(audio, 'b d n -> (b n) d')
+    audio = audio.clamp(-1, 1).mul(32767).to(torch.int16).cpu().numpy()
+    return wandb.Audio(audio, sample_rate=sr, caption=caption)
+
+
+def demo(decoder, log_dict, zsum, zmix, demo_samples, step, demo_steps=250, sr=48000, max_batch=4):
+    "runs the sampler on the (frozen-encoder) latents zsum & zmix and adds the audio to log_dict. max_batch: decoder windows per sampler call"
+    device = next(decoder.parameters()).device
+    noise = torch.randn([zsum.shape[0], 2, demo_samples]).to(device)  # same noise for both, for a fair comparison
+    for name, z in [('zsum', zsum), ('zmix', zmix)]:
+        fakes = decode_long(decoder, z.to(device), steps=demo_steps, noise=noise, max_batch=max_batch)
+        log_dict[name] = wandb_audio(fakes, sr, caption=f'{name}, step {step}')
     return log_dict
-    
 
-# %% ../nbs/train_aa_mixer.ipynb 11
-def get_stems_faders(batch, dl, maxstems=6):
-    "grab some more audio stems and set faders"
-    nstems = 1 + int(torch.randint(maxstems-1,(1,1))[0][0].numpy()) # an int between 1 and maxstems, PyTorch style :-/
-    faders = 2*torch.rand(nstems)-1  # fader gains can be from -1 to 1
+
+# %% ../nbs/train_aa_mixer.ipynb 15
+def crossfade_window(n:int, fade:int, fade_in=True, fade_out=True, device='cpu'):
+    "weights for overlap-add: ones, with raised-cosine ramps of length fade at the ends"
+    w = torch.ones(n, device=device)
+    if fade > 0:
+        ramp = 0.5 - 0.5*torch.cos(math.pi * (torch.arange(fade, device=device) + 0.5) / fade)
+        if fade_in:  w[:fade] = ramp
+        if fade_out: w[-fade:] = ramp.flip(0)
+    return w
+
+
+def max_batch_for_memory(decoder, z_win, hop_length=256, mem_target=2**30, bytes_per_sample=4096, upper=64) -> int:
+    """How many decoder windows like z_win (1, d, n) fit in one batch while keeping peak memory under mem_target bytes.
+    On CUDA this is measured from one decoder call at batch sizes 1 & 2; elsewhere it's estimated at bytes_per_sample per audio sample."""
+    n_samples = z_win.shape[-1] * hop_length
+    def fn(zb):   # one decoder call, which is the peak-memory unit of the sampler
+        x = torch.randn([zb.shape[0], 2, n_samples], device=zb.device)
+        return decoder(x, torch.ones(zb.shape[0], device=zb.device), zb)
+    return fit_batch_to_memory(fn, z_win, mem_target=mem_target, bytes_per_item=n_samples*bytes_per_sample, upper=upper)
+
+
+@torch.no_grad()
+def decode_long(
+    decoder,           # diffusion decoder, e.g. dvae.diffusion_ema
+    z,                 # latents to decode, (b, d, n), where n can be much longer than one training window
+    hop_length=256,    # audio samples per latent frame. For the AD encoder that's the product of its ratios
+    win_frames=128,    # latent frames per decoder window; default 128 = 32768 samples, the usual sample_size
+    overlap_frames=16, # latent frames shared by neighboring windows, crossfaded in the output
+    steps=250,         # sampler steps
+    eta=1,             # sampler eta
+    max_batch=None,    # max windows per sampler call. None = choose from mem_target
+    mem_target=2**30,  # peak-memory target in bytes, used when max_batch is None
+    noise=None,        # optional starting noise, (b, 2, n*hop_length)
+    ):
+    "decodes arbitrarily long latent sequences via overlapping, crossfaded windows; returns audio (b, 2, n*hop_length)"
+    b, d, n = z.shape
+    win_frames = min(win_frames, n)
+    overlap_frames = min(overlap_frames, win_frames // 2)
+    hop_frames = win_frames - overlap_frames
+    starts = list(range(0, max(n - win_frames, 0) + hop_frames, hop_frames))
+    starts[-1] = max(n - win_frames, 0)          # last window ends flush with the sequence
+    starts = sorted(set(starts))
+    win_len, fade = win_frames * hop_length, overlap_frames * hop_length
+
+    if noise is None: noise = torch.randn([b, 2, n * hop_length], device=z.device)
+    assert noise.shape[-1] == n * hop_length, f"noise length {noise.shape[-1]} != {n}*{hop_length}"
+    if max_batch is None:
+        max_batch = max_batch_for_memory(decoder, z[:1, :, :win_frames], hop_length=hop_length, mem_target=mem_target)
+
+    jobs = [(i, s) for i in range(b) for s in starts]   # (batch item, start frame) of every window
+    out = torch.zeros([b, 2, n * hop_length], device=z.device)
+    wsum = torch.zeros([b, 1, n * hop_length], device=z.device)
+    for j in range(0, len(jobs), max_batch):
+        chunk = jobs[j:j + max_batch]
+        zwin = torch.stack([z[i, :, s:s + win_frames] for i, s in chunk])
+        xwin = torch.stack([noise[i, :, s*hop_length:s*hop_length + win_len] for i, s in chunk])
+        fakes = sample(decoder, xwin, steps, eta, zwin)
+        for (i, s), fake in zip(chunk, fakes):
+            a = s * hop_length
+            w = crossfade_window(win_len, fade, fade_in=(s > 0), fade_out=(s + win_frames < n), device=z.device)
+            out[i, :, a:a + win_len] += fake * w
+            wsum[i, :, a:a + win_len] += w
+    return out / wsum.clamp(min=1e-8)
+
+
+# %% ../nbs/train_aa_mixer.ipynb 17
+class DemoWorker():
+    "renders demos on a background thread so the training loop never waits for the sampler"
+    def __init__(self,
+        decoder,            # diffusion decoder to sample with, e.g. dvae.diffusion_ema. The worker keeps its own copy
+        sample_rate=48000,  # sample rate for the logged audio
+        demo_steps=250,     # number of sampler steps
+        max_queue=1,        # max demos waiting to be rendered; more than that get skipped
+        max_batch=4,        # decoder windows per sampler call
+        print=print,        # print function, e.g. a HostPrinter
+        ):
+        self.decoder = deepcopy(decoder).eval()
+        freeze(self.decoder)
+        self.device = next(self.decoder.parameters()).device
+        self.sample_rate, self.demo_steps, self.max_batch, self.print = sample_rate, demo_steps, max_batch, print
+        self.jobs, self.done = queue.Queue(maxsize=max_queue), queue.Queue()
+        self.n_skipped = 0
+        # on GPU, sample on a side stream so demos can overlap with training kernels
+        self.stream = torch.cuda.Stream(self.device) if self.device.type == 'cuda' else None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self,
+        decoder,       # current decoder, whose weights get snapshotted for this demo
+        step:int,      # training step this demo belongs to
+        zsum, zmix,    # frozen-encoder latents to decode, i.e. archive['z0sum'], archive['z0mix']
+        mix=None,      # optional real audio mix, (b, d, n), logged alongside the fakes
+        demo_samples=None, # length in samples of each demo; default is the mix length
+        ) -> bool:
+        "queues up a demo. returns False (and skips the demo) if the worker is already full"
+        if self.jobs.full():
+            self.n_skipped += 1
+            return False
+        job = {'step': step, 'zsum': zsum.detach().clone(), 'zmix': zmix.detach().clone(),
+               'state': {k: v.detach().clone() for k, v in decoder.state_dict().items()},
+               'mix': None if mix is None else mix.detach().clone(),
+               'demo_samples': demo_samples if demo_samples is not None else mix.shape[-1]}
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self.n_skipped += 1
+            return False
+        return True
+
+    def render(self, job):
+        "makes the audio for one job. runs on the worker thread"
+        self.decoder.load_state_dict(job['state'])
+        log_dict = {'demo_step': job['step']}
+        if job['mix'] is not None:
+            log_dict['mix'] = wandb_audio(job['mix'], self.sample_rate, caption=f"mix, step {job['step']}")
+        return demo(self.decoder, log_dict, job['zsum'], job['zmix'], job['demo_samples'], job['step'],
+                    demo_steps=self.demo_steps, sr=self.sample_rate, max_batch=self.max_batch)
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None: break   # shutdown signal
+            try:
+                if self.stream is not None:
+                    with torch.cuda.stream(self.stream):
+                        log_dict = self.render(job)
+                    self.stream.synchronize()
+                else:
+                    log_dict = self.render(job)
+                self.done.put(log_dict)
+                self.print(f"Demo for step {job['step']} done")
+            except Exception as e:  # a failed demo shouldn't take down the run
+                self.print(f"Demo for step {job['step']} failed: {type(e).__name__}: {e}")
+
+    def collect(self) -> dict:
+        "returns (and clears) whatever finished since the last call, for merging into the current log_dict"
+        log_dict = {}
+        while not self.done.empty():
+            log_dict.update(self.done.get_nowait())
+        if self.n_skipped: log_dict['demos_skipped'] = self.n_skipped
+        return log_dict
+
+    def close(self, timeout=None):
+        "stops the worker once it has finished what's queued (or gives up after timeout seconds)"
+        try:
+            self.jobs.put(None, timeout=timeout)
+        except queue.Full:
+            return   # it's a daemon thread; it'll go down with the process
+        self.thread.join(timeout)
+
+
+# %% ../nbs/train_aa_mixer.ipynb 19
+class VizWorker():
+    "makes visualizations (e.g. PCA point clouds) of latents on a background thread"
+    def __init__(self,
+        viz_fn=pca_point_cloud,  # tensor -> something wandb can log
+        max_queue=1,             # max jobs waiting; more than that get skipped
+        print=print,             # print function, e.g. a HostPrinter
+        ):
+        self.viz_fn, self.print = viz_fn, print
+        self.jobs, self.done = queue.Queue(maxsize=max_queue), queue.Queue()
+        self.n_skipped = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self,
+        step:int,       # training step these latents belong to
+        **tensors,      # name=tensor pairs; each gets visualized & logged under its name, e.g. zsum_pca=zsum
+        ) -> bool:
+        "queues up CPU snapshots of tensors. returns False (and skips them) if the worker is already full"
+        if self.jobs.full():
+            self.n_skipped += 1
+            return False
+        try:
+            self.jobs.put_nowait((step, {k: v.detach().float().cpu() for k, v in tensors.items()}))
+        except queue.Full:
+            self.n_skipped += 1
+            return False
+        return True
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None: break   # shutdown signal
+            step, tensors = job
+            try:
+                log_dict = {'viz_step': step}
+                for k, v in tensors.items(): log_dict[k] = self.viz_fn(v)
+                self.done.put(log_dict)
+            except Exception as e:  # a failed plot shouldn't take down the run
+                self.print(f"Visualization for step {step} failed: {type(e).__name__}: {e}")
+
+    def collect(self) -> dict:
+        "returns (and clears) whatever finished since the last call, for merging into the current log_dict"
+        log_dict = {}
+        while not self.done.empty():
+            log_dict.update(self.done.get_nowait())
+        if self.n_skipped: log_dict['viz_skipped'] = self.n_skipped
+        return log_dict
+
+    def close(self, timeout=None):
+        "stops the worker once it has finished what's queued (or gives up after timeout seconds)"
+        try:
+            self.jobs.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+# %% ../nbs/train_aa_mixer.ipynb 21
+def get_stems_faders(batch, dl, maxstems=6, generator=None):
+    "grab some more audio stems and set faders. dl: a dataloader, or better, an iterator over one. generator: for the random draws"
+    nstems = 1 + int(torch.randint(maxstems-1,(1,1), generator=generator)[0][0].numpy()) # an int between 1 and maxstems, PyTorch style :-/
+    faders = 2*torch.rand(nstems, generator=generator)-1  # fader gains can be from -1 to 1
     stems = [batch]
     dl_iter = iter(dl)
     for i in range(nstems-1):
-        stems.append(next(dl_iter)[0])  # [0] is because there are two items returned and audio is the first
-    return stems, faders
+        try:
+            stems.append(next(dl_iter)[0])  # [0] is because there are two items returned and audio is the first
+        except StopIteration:   # end of the epoch: make do with fewer stems
+            break
+    return stems, faders[:len(stems)]
+
+# %% ../nbs/train_aa_mixer.ipynb 24
+class MicroBatcher():
+    """Chooses how many batch items go through AudioAlgebra at once. Peak memory grows with batch size x number of
+    stems, and the stem count is random, so with mem_target the size is picked per step from the measured bytes per (item x stem)"""
+    def __init__(self,
+        micro_batch=0,    # fixed micro-batch size; 0 = whole batch (or automatic, with mem_target)
+        mem_target=0,     # peak memory target in bytes for automatic sizing (needs CUDA to measure); 0 = off
+        device='cpu',
+        n_measure=3,      # measure this many micro-batches; after that, no more syncs
+        ):
+        self.micro_batch, self.mem_target, self.device, self.n_measure = micro_batch, mem_target, torch.device(device), n_measure
+        self.auto = (micro_batch <= 0) and mem_target > 0 and self.device.type == 'cuda'
+        self.bytes_per_item_stem, self.n_measured = None, 0
+        self.warned_bn = False   # warned that BatchNorm makes micro-batching inexact
+
+    def size(self, batch_size, nstems) -> int:
+        if self.micro_batch > 0: return min(self.micro_batch, batch_size)
+        if not self.auto: return batch_size
+        if self.bytes_per_item_stem is None: return 1   # nothing measured yet: start small
+        return int(max(1, min(batch_size, self.mem_target // (self.bytes_per_item_stem * (nstems + 1)))))  # +1 for the mix
+
+    def run(self, fn, mb, nstems):
+        "runs fn (one micro-batch's forward & backward), learning from its peak memory while still measuring"
+        if not self.auto or self.n_measured >= self.n_measure: return fn()
+        out = None
+        def wrapped():
+            nonlocal out
+            out = fn()
+        peak = measure_peak_memory(wrapped, self.device)
+        est = peak / (mb * (nstems + 1))   # fixed overheads get counted per item, which errs on the safe side
+        self.bytes_per_item_stem = est if self.bytes_per_item_stem is None else max(est, self.bytes_per_item_stem)
+        self.n_measured += 1
+        return out
+
+
+def _cat_outputs(outs):
+    "joins AudioAlgebra outputs from micro-batches back into full-batch (detached) ones"
+    if len(outs) == 1: return outs[0][:3]
+    cat = lambda ts: torch.cat([t.detach() for t in ts])
+    zsum, zmix = cat([o[0] for o in outs]), cat([o[1] for o in outs])
+    archives = [o[2] for o in outs]
+    archive = {k: cat([a[k] for a in archives]) for k in ('mix', 'z0sum', 'z0mix')}
+    archive.update({k: [cat(zs) for zs in zip(*[a[k] for a in archives])] for k in ('zs', 'z0s')})
+    archive['znegsum'] = None
+    return zsum, zmix, archive
+
+
+def train_step(aa_model, opt, stems, faders, accelerator,
+    micro_batcher:MicroBatcher=None,  # to split the batch into micro-batches that each get their own forward & backward
+    ):
+    """One training (micro-)step; the optimizer only steps every accelerator.gradient_accumulation_steps calls.
+    With micro-batches, each one's loss gets weighted by its share of the batch, so the gradient is the full batch's
+    (the loss is a mean over batch items), unless the model has BatchNorm in training mode, as AudioAlgebra's reembedding
+    does: then each micro-batch gets normalized by its own statistics, and train_step warns that the gradients differ.
+    The triplet loss doesn't split at all: its negatives come from the whole batch, so it can't be micro-batched"""
+    batch_size = stems[0].shape[0]
+    mb = batch_size if micro_batcher is None else micro_batcher.size(batch_size, len(stems))
+    unwrapped = accelerator.unwrap_model(aa_model)
+    if mb < batch_size and unwrapped.loss_type == 'triplet':
+        raise ValueError(f"loss_type='triplet' mines its negatives from the whole batch, so it can't be split into micro-batches "
+                         f"(here {mb} of {batch_size}); set micro_batch = 0 and micro_batch_mem_gb = 0")
+    if mb < batch_size and not micro_batcher.warned_bn and \
+            any(isinstance(m, nn.modules.batchnorm._BatchNorm) and m.training for m in unwrapped.modules()):
+        warnings.warn(f"micro-batching ({mb} of {batch_size}) a model with BatchNorm in training mode: each micro-batch gets "
+                      "normalized by, and updates the running statistics with, its own batch statistics, so the gradients "
+                      "are not the full batch's. For exact full-batch training, set micro_batch = 0 and micro_batch_mem_gb = 0")
+        micro_batcher.warned_bn = True
+    with accelerator.accumulate(aa_model):
+        outs, total_loss = [], 0.0
+        for start in range(0, batch_size, mb):
+            sub = [s[start:start + mb] for s in stems]
+            last = start + mb >= batch_size
+            def fwd_bwd():
+                with phase('forward'):   # minus the encode & reembed phases inside
+                    zsum, zmix, zarchive = aa_model(sub, faders)   # through the DDP wrapper, so gradients get synced
+                with phase('loss'):
+                    loss = unwrapped.loss(zsum, zmix, zarchive) * (sub[0].shape[0] / batch_size)
+                with phase('backward'):
+                    accelerator.backward(loss)
+                return loss.detach(), (zsum, zmix, zarchive)
+            with (contextlib.nullcontext() if last else accelerator.no_sync(aa_model)):  # all-reduce just once
+                loss, out = fwd_bwd() if micro_batcher is None else micro_batcher.run(fwd_bwd, sub[0].shape[0], len(stems))
+            total_loss, outs = total_loss + loss, outs + [out]
+        with phase('opt_step'):
+            opt.step()
+            opt.zero_grad()
+    return (total_loss, *_cat_outputs(outs))
+
+# %% ../nbs/train_aa_mixer.ipynb 26
+def tiny_dvae(latent_dim=32):
+    "a small random stand-in for DiffusionDVAE's frozen encoder (same downsampling), for tests & benchmarks"
+    dvae, hop = nn.Module(), math.prod(DiffusionDVAE.ratios)
+    dvae.encoder_ema = nn.Conv1d(2, latent_dim, hop, stride=hop)
+    freeze(dvae)
+    return dvae
+
+
+def _tiny_aa_setup(accelerator, latent_dim=32, sample_size=2**13):
+    torch.manual_seed(0)   # same initial weights everywhere (DDP would broadcast rank 0's anyway)
+    args = argparse.Namespace(latent_dim=latent_dim, sample_size=sample_size, num_quantizers=0)
+    aa_model = AudioAlgebra(args, accelerator.device, tiny_dvae(latent_dim))
+    opt = optim.Adam([*aa_model.reembedding.parameters()], lr=1e-3)
+    return accelerator.prepare(aa_model, opt)
+
+
+def _random_stems(batch_size, sample_size, nstems=3):
+    return [torch.randn(batch_size, 2, sample_size) for _ in range(nstems)], 2*torch.rand(nstems)-1
+
+
+def _ddp_sync_job(steps=3, accum_steps=1, micro_batch=0, unwrapped=False, batch_size=2, sample_size=2**13, latent_dim=32):
+    "trains on different data in every process; returns how far the processes' weights ended up from rank 0's"
+    accelerator = accelerate.Accelerator(cpu=True, gradient_accumulation_steps=accum_steps)
+    aa_model, opt = _tiny_aa_setup(accelerator, latent_dim, sample_size)
+    torch.manual_seed(1000 + accelerator.process_index)
+    for _ in range(steps * accum_steps):
+        stems, faders = _random_stems(batch_size, sample_size)
+        if unwrapped:   # the way main() used to do it
+            zsum, zmix, zarchive = accelerator.unwrap_model(aa_model).forward(stems, faders)
+            accelerator.backward(accelerator.unwrap_model(aa_model).loss(zsum, zmix, zarchive))
+            opt.step()
+            opt.zero_grad()
+        else:
+            train_step(aa_model, opt, stems, faders, accelerator, MicroBatcher(micro_batch))
+    params = torch.cat([p.detach().flatten() for p in accelerator.unwrap_model(aa_model).reembedding.parameters()])
+    all_params = accelerator.gather(params[None])
+    return (all_params - all_params[0]).abs().max().item()
+
+
+def _ddp_bench_job(steps=20, warmup=3, batch_size=2, sample_size=2**13, latent_dim=32):
+    "returns this process's training steps/sec"
+    accelerator = accelerate.Accelerator(cpu=True)
+    aa_model, opt = _tiny_aa_setup(accelerator, latent_dim, sample_size)
+    batches = [_random_stems(batch_size, sample_size) for _ in range(4)]
+    for i in range(warmup): train_step(aa_model, opt, *batches[i % 4], accelerator)
+    accelerator.wait_for_everyone()
+    t0 = time.time()
+    for i in range(steps): train_step(aa_model, opt, *batches[i % 4], accelerator)
+    accelerator.wait_for_everyone()
+    return steps / (time.time() - t0)
+
+
+def _local_worker(rank, world_size, port, job, kwargs, results):
+    os.environ.update(MASTER_ADDR='127.0.0.1', MASTER_PORT=str(port), RANK=str(rank), LOCAL_RANK=str(rank),
+                      WORLD_SIZE=str(world_size), LOCAL_WORLD_SIZE=str(world_size))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))   # don't oversubscribe the cores
+    results.put((rank, job(**kwargs)))
+
+
+def launch_local(job, world_size=2, **kwargs) -> list:
+    "runs job(**kwargs) in world_size local CPU processes that form a (gloo) process group; returns the results by rank"
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    results = mp.get_context('spawn').SimpleQueue()
+    mp.spawn(_local_worker, args=(world_size, port, job, kwargs, results), nprocs=world_size, join=True)
+    out = dict(results.get() for _ in range(world_size))
+    return [out[r] for r in range(world_size)]
+
+
+def check_ddp_sync(world_size=2, steps=3, accum_steps=2, micro_batch=1, atol=1e-6, print=print) -> dict:
+    "checks that train_step keeps all processes' weights identical (and that the old unwrapped path didn't)"
+    synced = max(launch_local(_ddp_sync_job, world_size, steps=steps, accum_steps=accum_steps, micro_batch=micro_batch))
+    unsynced = max(launch_local(_ddp_sync_job, world_size, steps=steps, unwrapped=True))
+    print(f"max weight difference between processes: train_step {synced:.2e}, unwrapped forward {unsynced:.2e}")
+    assert synced <= atol, f"processes' weights diverged by {synced}"
+    return {'synced': synced, 'unwrapped': unsynced}
+
+
+def benchmark_ddp_scaling(world_sizes=(1, 2, 4), steps=20, batch_size=2, sample_size=2**13, print=print) -> list:
+    "training steps/sec vs. number of local CPU processes, each with its own batch_size"
+    results = []
+    for ws in world_sizes:
+        steps_per_sec = min(launch_local(_ddp_bench_job, ws, steps=steps, batch_size=batch_size, sample_size=sample_size))
+        items_per_sec = steps_per_sec * ws * batch_size
+        base = results[0]['items_per_sec'] / results[0]['processes'] if results else items_per_sec / ws
+        results.append({'processes': ws, 'steps_per_sec': steps_per_sec, 'items_per_sec': items_per_sec,
+                        'efficiency': items_per_sec / (base * ws)})
+        print(f"{ws} processes: {steps_per_sec:.2f} steps/sec, {items_per_sec:.1f} items/sec, "
+              f"scaling efficiency {results[-1]['efficiency']:.0%}")
+    return results
+
+
+def _straggler_job(steps=6, every=3, slow_rank=1, slow_phase='data', delay=0.1, heartbeat_dir=None, batch_size=2, sample_size=2**13):
+    "trains with a heartbeat, with slow_rank sleeping for delay seconds in slow_phase every step; returns the flagged stragglers"
+    accelerator = accelerate.Accelerator(cpu=True)
+    aa_model, opt = _tiny_aa_setup(accelerator, sample_size=sample_size)
+    profiler = StepProfiler()
+    heartbeat = Heartbeat(profiler, every=every, heartbeat_dir=heartbeat_dir, print=lambda *a: None)
+    set_profiler(profiler)
+    for _ in range(steps):
+        with phase(slow_phase):
+            if accelerator.process_index == slow_rank: time.sleep(delay)
+        train_step(aa_model, opt, *_random_stems(batch_size, sample_size), accelerator)
+        profiler.step()
+        heartbeat.step()
+    set_profiler(None)
+    return heartbeat.stragglers
+
+
+def check_stragglers(world_size=2, slow_phase='data', delay=0.1, print=print) -> list:
+    "checks that a process made slow in slow_phase gets flagged as a straggler (by every process, as they all gather)"
+    flags = launch_local(_straggler_job, world_size, slow_phase=slow_phase, delay=delay)
+    for f in flags[0]: print(f"rank {f['rank']}: {f['phase']} {f['ms']:.1f} ms vs. {f['median_ms']:.1f} ms ({f['cause']})")
+    assert all(f == flags[0] for f in flags), "processes disagree"
+    assert [(f['rank'], f['phase']) for f in flags[0]] == [(1, slow_phase)], flags[0]
+    return flags[0]
+
+
+def _tuning_job(batch_sizes=(4, None)):
+    "rank r has tuning results with batch size batch_sizes[r] (None = no results); returns the batch size it ends up with"
+    accelerator = accelerate.Accelerator(cpu=True)
+    bs = batch_sizes[accelerator.process_index]
+    tuned = None if bs is None else {'batch_size': bs, 'num_workers': 0, 'prefetch_factor': 2, 'pin_memory': False, 'num_threads': 1}
+    args = argparse.Namespace(batch_size=8, num_workers=2)
+    sync_tuning(args, tuned)
+    return args.batch_size
+
+# %% ../nbs/train_aa_mixer.ipynb 39
+def sync_tuning(args, tuned:dict) -> dict:
+    """applies this machine's tuning results, if any (see tune.apply_tuning), but with rank 0's batch size (or the config's,
+    if rank 0 has none) on every rank. Every rank has to call this, with results or without. Returns the extra DataLoader kwargs"""
+    batch_size = broadcast_object_list([tuned['batch_size'] if tuned is not None else args.batch_size])[0]
+    if tuned is None:
+        args.batch_size = batch_size
+        return {}
+    return apply_tuning(args, {**tuned, 'batch_size': batch_size})
+
 
-# %% ../nbs/train_aa_mixer.ipynb 13
 def main():
 
     args = get_all_args()
@@ -532,7 +1071,11 @@ def main():
     except RuntimeError:
         pass
 
-    accelerator = accelerate.Accelerator()
+    set_precision(getattr(args, 'precision', 'auto'))
+    mixed_precision = {'fp16': 'fp16', 'bf16': 'bf16'}.get(precision_for('cuda' if torch.cuda.is_available() else 'cpu'), 'no')
+    ddp_kwargs = accelerate.DistributedDataParallelKwargs(bucket_cap_mb=getattr(args, 'bucket_cap_mb', 25), gradient_as_bucket_view=True)
+    accelerator = accelerate.Accelerator(gradient_accumulation_steps=getattr(args, 'accum_steps', 1), kwargs_handlers=[ddp_kwargs],
+                                         mixed_precision=mixed_precision)  # for fp16, this adds gradient scaling
     device = accelerator.device
     hprint = HostPrinter(accelerator)
     hprint(f'Using device: {device}')
@@ -542,7 +1085,7 @@ def main():
     hprint(f"Using {encoder_choice} as encoder")
     if 'icebox' == encoder_choice:
         args.latent_dim = 64  # overwrite latent_dim with what Jukebox requires
-        encoder = IceBoxModel(args, device)
+        encoder = IceBoxModel(args, device, cache_dir=getattr(args, 'jukebox_cache_dir', '') or None)   # encode() checks the cache
     elif 'ad' == encoder_choice:
         dvae = DiffusionDVAE(args, device)
         #dvae = setup_weights(dvae, accelerator, device)
@@ -566,28 +1109,79 @@ def main():
 
     hprint("Setting up dataset")
     train_set = MultiStemDataset([args.training_dir], args)
-    train_dl = torchdata.DataLoader(train_set, args.batch_size, shuffle=True,
-                               num_workers=args.num_workers, persistent_workers=True, pin_memory=True)
 
-    hprint("Calling accelerator.prepare")
-    aa_model, opt, train_dl, dvae = accelerator.prepare(aa_model, opt, train_dl, dvae)
+    loader_kwargs = {'pin_memory': True}
+    if getattr(args, 'autotune', 'off') in ('run', 'apply'):
+        tune_path = tuning_file(getattr(args, 'tune_dir', '~/.cache/shazbot'))
+        tune_key = tuning_key(device, sample_size=args.sample_size)
+        if args.autotune == 'run' and accelerator.is_local_main_process:   # one process per machine times the trials
+            hprint("Tuning the data pipeline & threads for this machine")
+            batch_sizes = [int(b) for b in str(getattr(args, 'tune_batch_sizes', '') or args.batch_size).split(',')]
+            save_tuning(autotune(train_set, aa_step_fn(aa_model.to(device), device), batch_sizes=batch_sizes, print=hprint), tune_path, tune_key)
+        accelerator.wait_for_everyone()
+        torch.manual_seed(args.seed)       # the same random numbers on every rank again, tuned or not
+        tuned = load_tuning(tune_path, tune_key)   # this machine's, so workers & threads suit its cores & disks
+        if tuned is None and accelerator.is_local_main_process:   # once per machine without results
+            print(f"No tuning results for {tune_key} in {tune_path} on {socket.gethostname()}; using the config's settings", flush=True)
+        loader_kwargs.update(sync_tuning(args, tuned))   # every rank, tuned or not
+        hprint(f"Using {args.num_workers} workers, batch size {args.batch_size}, {torch.get_num_threads()} threads, {loader_kwargs}")
+
+    sampler = ResumableSampler(len(train_set), seed=args.seed)   # shuffles, in an order that a checkpoint can resume
+    train_dl = torchdata.DataLoader(train_set, args.batch_size, sampler=sampler, drop_last=True,  # stems need equal batch sizes
+                               num_workers=args.num_workers, persistent_workers=args.num_workers > 0,
+                               generator=torch.Generator().manual_seed(args.seed),  # so workers' seeds don't use up the global RNG
+                               **loader_kwargs)
 
     hprint("Setting up frozen encoder model weights")
     dvae = setup_weights(dvae, accelerator)
-    freeze(accelerator.unwrap_model(dvae))
+    freeze(dvae)
     #encoder = dvae.encoder 
 
+    hprint("Calling accelerator.prepare")
+    aa_model, opt, train_dl = accelerator.prepare(aa_model, opt, train_dl)  # dvae is frozen, so it needs no DDP wrapper
+
     hprint("Setting up wandb")
     if use_wandb:
         wandb.watch(aa_model)
+        demo_worker = DemoWorker(accelerator.unwrap_model(dvae).diffusion_ema, sample_rate=args.sample_rate,
+            demo_steps=args.demo_steps, max_queue=getattr(args, 'demo_queue', 1), max_batch=getattr(args, 'demo_max_batch', 4), print=hprint)
+
+    micro_batcher = MicroBatcher(micro_batch=getattr(args, 'micro_batch', 0), device=device,
+                                 mem_target=int(getattr(args, 'micro_batch_mem_gb', 0) * 2**30))
+
+    metrics = DeviceMetrics(every=getattr(args, 'log_every', 25))
+    viz_every = getattr(args, 'viz_every', 100)
+    if use_wandb and viz_every > 0:
+        viz_worker = VizWorker(print=hprint)
+        latent_pca = StreamingPCA(k=3, decay=getattr(args, 'pca_decay', 0.999))  # one set of axes for zsum & zmix alike
+
+    profile_every = getattr(args, 'profile_every', 100)
+    profiler = StepProfiler(sync=getattr(args, 'profile_sync', False), device=device, window=max(profile_every, 100),
+        jsonl=(getattr(args, 'profile_jsonl', '') or None) if accelerator.is_main_process else None, enabled=profile_every > 0)
+    set_profiler(profiler)
+    tracer = OnDemandTrace(getattr(args, 'trace_dir', 'traces'), steps=getattr(args, 'trace_steps', 5),
+                           rank=accelerator.process_index, print=hprint)
+    hprint(f"To profile the next {tracer.steps} steps: kill -USR2 <pid>, or touch {tracer.sentinel}")
+    heartbeat = Heartbeat(profiler if profile_every > 0 else None, every=getattr(args, 'heartbeat_every', 50),
+        heartbeat_dir=getattr(args, 'heartbeat_dir', '') or None, device=device, print=hprint)
+
+    sobol = [accelerator.unwrap_model(dvae).rng]   # random generators to checkpoint, besides the global ones
+    stem_rng = torch.Generator().manual_seed(args.seed)   # for get_stems_faders: the same stem counts on every rank
 
     hprint("Checking for checkpoint")
     if args.ckpt_path:
-        ckpt = torch.load(args.ckpt_path, map_location='cpu')
+        ckpt = torch.load(args.ckpt_path, map_location='cpu', weights_only=False)
         accelerator.unwrap_model(aa_model).load_state_dict(ckpt['model'])
         opt.load_state_dict(ckpt['opt'])
-        epoch = ckpt['epoch'] + 1
         step = ckpt['step'] + 1
+        if 'sampler' in ckpt:   # carry on mid-epoch, with the same data order & random numbers
+            sampler.load_state_dict(ckpt['sampler'])
+            set_rng_state(ckpt['rng'], sobol)
+            if 'stem_rng' in ckpt: stem_rng.set_state(ckpt['stem_rng'])
+            epoch = sampler.epoch
+            hprint(f"Resuming epoch {epoch} after {sampler.consumed} samples")
+        else:                   # older checkpoints: start the next epoch
+            epoch = ckpt['epoch'] + 1
         del ckpt
     else:
         epoch = 0
@@ -598,91 +1192,84 @@ def main():
     try:
         while True:  # training loop
             #print(f"Starting epoch {epoch}")
-            for batch in tqdm(train_dl, disable=not accelerator.is_main_process):
+            train_dl.set_epoch(epoch)   # passed on to the sampler; a resumed epoch keeps its place
+            batches = profiler.iterate(train_dl, 'data')
+            pbar = tqdm(total=len(train_dl), disable=not accelerator.is_main_process)   # counts batches, and a step uses one per stem
+            for batch in batches:
                 batch = batch[0]  # first elem is the audio, 2nd is the filename which we don't need
                 #if accelerator.is_main_process: print(f"e{epoch} s{step}: got batch. batch.shape = {batch.shape}")
-                opt.zero_grad()
-
                 # "batch" is actually not going to have all the data we want. We could rewrite the dataloader to fix this,
                 # but instead I just added get_stems_faders() which grabs "even more" audio to go with "batch"
-                stems, faders = get_stems_faders(batch, train_dl)
-
-                zsum, zmix, zarchive = accelerator.unwrap_model(aa_model).forward(stems,faders)
-                loss = accelerator.unwrap_model(aa_model).loss(zsum, zmix, zarchive)
-                accelerator.backward(loss)
-                opt.step()
-
-                if accelerator.is_main_process:
-                    if step % 25 == 0:
-                        tqdm.write(f'Epoch: {epoch}, step: {step}, loss: {loss.item():g}')
-
-                    if use_wandb:
-                        log_dict = {
-                            'epoch': epoch,
-                            'loss': loss.item(),
-                            #'lr': sched.get_last_lr()[0],
-                            'zsum_pca': pca_point_cloud(zsum.detach()),
-                            'zmix_pca': pca_point_cloud(zmix.detach())
-                        }
-
-                        if (step % args.demo_every == 0):                                                    
-                            hprint("\nMaking demo stuff")
-
-                            mix_filename = f'mix_{step:08}.wav'
-                            reals = zarchive['mix'].clamp(-1, 1).mul(32767).to(torch.int16).cpu()
-                            reals = rearrange(reals, 'b d n -> d (b n)')
-                            print("reals.shape = ",reals.shape)
-                            torchaudio.save(mix_filename, reals, args.sample_rate)
-                            log_dict['mix'] = wandb.Audio(mix_filename, sample_rate=args.sample_rate, caption='mix')
-
-                            #demo(accelerator.unwrap_model(dvae), log_dict, zsum.detach(), zmix.detach(),  batch.shape[-1], step)
-                            zsum = zarchive['z0sum'].detach() # rearrange(zarchive['z0sum'], 'b n d -> b d n').detach()
-                            zmix = zarchive['z0mix'].detach() #rearrange(zarchive['z0mix'], 'b n d -> b d n').detach()
-
-                            hprint(f"zsum.shape = {zsum.shape}")
-                            noise = torch.randn([zsum.shape[0], 2, batch.shape[-1]]).to(accelerator.device)
-                            accelerator.unwrap_model(dvae).diffusion_ema.to(accelerator.device)
-                            model_fn = make_cond_model_fn(accelerator.unwrap_model(dvae).diffusion_ema, zsum)
-                            hprint(f"noise.shape = {noise.shape}")
-
-                            # Run the sampler
-                            with torch.cuda.amp.autocast():
-                                hprint("Calling sampler for zsum")
-                                fakes = sample(accelerator.unwrap_model(dvae).diffusion_ema, noise, args.demo_steps, 1, zsum)
-                            fakes = rearrange(fakes, 'b d n -> d (b n)')
-                            zsum_filename = f'zsum_{step:08}.wav'
-                            fakes = fakes.clamp(-1, 1).mul(32767).to(torch.int16).cpu()
-                            torchaudio.save(zsum_filename, fakes, args.sample_rate)
-                            log_dict['zsum'] = wandb.Audio(zsum_filename, sample_rate=args.sample_rate, caption='zsum')
-                            
-                            with torch.cuda.amp.autocast():
-                                hprint("Calling sampler for zmix")
-                                fakes = sample(accelerator.unwrap_model(dvae).diffusion_ema, noise, args.demo_steps, 1, zmix)
-                            fakes = rearrange(fakes, 'b d n -> d (b n)')
-                            zmix_filename = f'zmix_{step:08}.wav'
-                            fakes = fakes.clamp(-1, 1).mul(32767).to(torch.int16).cpu()
-                            torchaudio.save(zmix_filename, fakes, args.sample_rate)
-                            log_dict['zmix'] = wandb.Audio(zmix_filename, sample_rate=args.sample_rate, caption='zmix')
-                            hprint("Done making demo stuff")
-                            
-                    if use_wandb: wandb.log(log_dict, step=step)
+                with phase('stems'):
+                    stems, faders = get_stems_faders(batch, batches, generator=stem_rng)
+                # every rank got as many batches (stem_rng), of the same size (accelerate's even_batches), as this one
+                sampler.advance(sum(len(s) for s in stems) * accelerator.num_processes)
+                pbar.update(len(stems))
+
+                loss, zsum, zmix, zarchive = train_step(aa_model, opt, stems, faders, accelerator, micro_batcher)
+
+                with phase('log'):
+                    if accelerator.is_main_process:
+                        log_dict = {}
+                        metrics.add(loss=loss)   # stays on the device until the next flush
+                        if metrics.due(step):
+                            log_dict = {'epoch': epoch, **metrics.flush()}
+                            tqdm.write(f'Epoch: {epoch}, step: {step}, loss: {log_dict["loss"]:g}')
+
+                        if profile_every > 0 and step % profile_every == 0 and step > 0:
+                            hprint(f"\nTiming: {profiler.breakdown()}")
+
+                        if use_wandb:
+                            if profile_every > 0 and step % profile_every == 0: log_dict.update(profiler.log_dict())
+
+                            if viz_every > 0:
+                                latent_pca.update(zsum); latent_pca.update(zmix)   # stays on the device
+                                if step % viz_every == 0:
+                                    zsum_3d = latent_pca.project(zsum)   # refreshes the axes
+                                    zmix_3d = latent_pca.project(zmix, refresh=False)
+                                    viz_worker.submit(step, zsum_pca=rearrange(zsum_3d, 'b n k -> b k n'),
+                                                      zmix_pca=rearrange(zmix_3d, 'b n k -> b k n'))
+                                log_dict.update(viz_worker.collect())
+
+                            if (step % args.demo_every == 0):
+                                with phase('demo'):
+                                    # rendering happens on demo_worker's thread; we just hand it snapshots
+                                    if demo_worker.submit(accelerator.unwrap_model(dvae).diffusion_ema, step,
+                                            zarchive['z0sum'], zarchive['z0mix'], mix=zarchive['mix'], demo_samples=batch.shape[-1]):
+                                        hprint(f"\nQueued demo for step {step}")
+                                    else:
+                                        hprint(f"\nDemo worker still busy; skipping demo for step {step}")
+                            log_dict.update(demo_worker.collect())
+
+                        if use_wandb and log_dict: wandb.log(log_dict, step=step)
 
                 if step > 0 and step % args.checkpoint_every == 0:
-                    save(accelerator, args, aa_model, opt, epoch, step)
+                    with phase('save'):
+                        save(accelerator, args, aa_model, opt, epoch, step,
+                             extra={'sampler': sampler.state_dict(), 'rng': get_rng_state(sobol), 'stem_rng': stem_rng.get_state()})
+
+                profiler.step(step)
+                tracer.step(step)
+                if heartbeat.step(step) and use_wandb: wandb.log(heartbeat.log_dict(), step=step)
 
                 step += 1
+            pbar.close()
             epoch += 1
-    except RuntimeError as err:  # ??
-        import requests
+    except RuntimeError as err:  # e.g. a collective that timed out because some rank got stuck
         import datetime
         ts = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-        resp = requests.get('http://169.254.169.254/latest/meta-data/instance-id')
-        hprint(f'ERROR at {ts} on {resp.text} {device}: {type(err).__name__}: {err}', flush=True)
+        print(f'ERROR at {ts} on {device}, {heartbeat.describe()}: {type(err).__name__}: {err}', flush=True)  # every rank
         raise err
     except KeyboardInterrupt:
         pass
-
-# %% ../nbs/train_aa_mixer.ipynb 14
+    finally:
+        if use_wandb: demo_worker.close(timeout=60)
+        if use_wandb and viz_every > 0: viz_worker.close(timeout=60)
+        profiler.close()
+        set_profiler(None)
+        tracer.close()
+
+# %% ../nbs/train_aa_mixer.ipynb 40
 # Not needed if listed in console_scripts in settings.ini
 if __name__ == '__main__' and "get_ipython" not in dir():  # don't execute in notebook
     main() 
@@ -0,0 +1,202 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/tune.ipynb.
+
+# %% auto 0
+__all__ = ['SyntheticStems', 'TimedBatches', 'time_pipeline', 'autotune', 'tuning_file', 'tuning_key', 'save_tuning',
+           'load_tuning', 'apply_tuning', 'aa_step_fn']
+
+# %% ../nbs/tune.ipynb 3
+import os
+import json
+import time
+import socket
+import torch
+from torch.utils import data as torchdata
+from .core import cpus_per_process
+
+# %% ../nbs/tune.ipynb 5
+class SyntheticStems(torchdata.Dataset):
+    "random stereo clips with the same (audio, filename) items as MultiStemDataset, for trials without audio files"
+    def __init__(self,
+        n=512,              # number of items
+        sample_size=2**16,  # samples per item
+        load_ms=0.0,        # simulated read latency per item, in ms
+        ):
+        self.n, self.sample_size, self.load_ms = n, sample_size, load_ms
+
+    def __len__(self): return self.n
+
+    def __getitem__(self, i):
+        if self.load_ms: time.sleep(self.load_ms / 1000)
+        return 0.1 * torch.randn(2, self.sample_size, generator=torch.Generator().manual_seed(i)), f'synthetic_{i}.wav'
+
+
+class TimedBatches():
+    "endless iterator over a dataloader (or a single batch, repeated), keeping track of the time spent waiting on it in .wait"
+    def __init__(self,
+        dl=None,     # dataloader to cycle through, epoch after epoch
+        batch=None,  # or: the one batch to return every time
+        ):
+        self.dl, self.batch, self.wait = dl, batch, 0.0
+        self.it = iter(dl) if dl is not None else None
+    def __iter__(self): return self
+    def __next__(self):
+        if self.it is None: return self.batch
+        t = time.perf_counter()
+        try:
+            batch = next(self.it)
+        except StopIteration:
+            self.it = iter(self.dl)
+            batch = next(self.it)
+        self.wait += time.perf_counter() - t
+        return batch
+
+
+def _time_steps(step_fn, batches, steps, warmup) -> tuple:
+    for _ in range(warmup): step_fn(next(batches), batches)
+    if torch.cuda.is_available(): torch.cuda.synchronize()
+    batches.wait, t0 = 0.0, time.perf_counter()
+    for _ in range(steps): step_fn(next(batches), batches)
+    if torch.cuda.is_available(): torch.cuda.synchronize()
+    return time.perf_counter() - t0, batches.wait
+
+
+def time_pipeline(
+    dataset,             # e.g. a MultiStemDataset
+    step_fn,             # step_fn(batch, batches): one training step
+    batch_size=8,
+    num_workers=0,
+    prefetch_factor=2,   # batches each worker keeps ready
+    pin_memory=False,
+    num_threads=None,    # torch intra-op threads; None = leave as is
+    steps=10,            # timed steps
+    warmup=2,            # untimed steps first (worker startup, allocations, ...)
+    loader=True,         # False = time just step_fn, on one batch over & over
+    seed=0,              # torch seed, so every trial gets the same random draws (e.g. of stem counts)
+    ) -> dict:
+    "one trial: steps/sec (and items/sec, and the fraction of time spent waiting for data) with these settings"
+    if num_threads: torch.set_num_threads(num_threads)
+    torch.manual_seed(seed)
+    kwargs = {'prefetch_factor': prefetch_factor, 'persistent_workers': True} if num_workers > 0 else {}
+    dl = torchdata.DataLoader(dataset, batch_size, shuffle=True, drop_last=True, num_workers=num_workers, pin_memory=pin_memory, **kwargs)
+    batches = TimedBatches(dl) if loader else TimedBatches(batch=next(iter(torchdata.DataLoader(dataset, batch_size))))
+    elapsed, wait = _time_steps(step_fn, batches, steps, warmup)
+    del batches, dl   # shuts the workers down
+    return {'batch_size': batch_size, 'num_workers': num_workers, 'prefetch_factor': prefetch_factor, 'pin_memory': pin_memory,
+            'num_threads': torch.get_num_threads(), 'steps_per_sec': steps / elapsed, 'items_per_sec': steps * batch_size / elapsed,
+            'data_wait': wait / elapsed}
+
+# %% ../nbs/tune.ipynb 8
+def _candidates(hi) -> list:
+    "1, 2, 4, ... up to hi, and hi itself"
+    out, c = [], 1
+    while c < hi:
+        out.append(c)
+        c *= 2
+    return out + [hi]
+
+
+def _pick(trials, metric, tol) -> dict:
+    "the first (i.e. cheapest) trial within tol of the best one"
+    best = max(t[metric] for t in trials)
+    return next(t for t in trials if t[metric] >= (1 - tol) * best)
+
+
+def autotune(
+    dataset,             # e.g. a MultiStemDataset, or a SyntheticStems
+    step_fn,             # step_fn(batch, batches): one training step, e.g. from aa_step_fn
+    batch_sizes=(8,),    # batch sizes to try, smallest first. one = keep it
+    max_threads=None,    # default: this process's share of the cores
+    max_workers=None,    # default: twice that
+    steps=10, warmup=2,  # per trial
+    tol=0.05,            # settings within this fraction of the fastest count as just as good
+    print=print,
+    ) -> dict:
+    "times short trials to choose threads, batch size, loader workers, prefetching & pinning. returns the settings, plus all the trials"
+    cores = cpus_per_process()
+    max_threads = max_threads or cores
+    max_workers = max_workers if max_workers is not None else 2 * cores
+    threads0, trials = torch.get_num_threads(), []
+    best = {'batch_size': batch_sizes[0], 'num_workers': 0, 'prefetch_factor': 2, 'pin_memory': False, 'num_threads': max_threads}
+    pick = None   # the trial behind best
+
+    def run(stage, options, metric='steps_per_sec', **kw):
+        nonlocal pick
+        results = []
+        for o in options:
+            try:
+                r = time_pipeline(dataset, step_fn, steps=steps, warmup=warmup, **{**best, **o}, **kw)
+            except RuntimeError as e:   # e.g. CUDA out of memory: nothing bigger will fit either
+                if 'out of memory' not in str(e): raise
+                if torch.cuda.is_available(): torch.cuda.empty_cache()
+                print(f"  {stage} {o}: out of memory")
+                break
+            print(f"  {stage} {o}: {r['steps_per_sec']:.2f} steps/sec, {r['items_per_sec']:.1f} items/sec, {r['data_wait']:.0%} waiting for data")
+            results.append({**r, 'stage': stage})
+        trials.extend(results)
+        if not results:   # not even the first option fit: keep what we have
+            print(f"  skipping {stage}")
+            return
+        pick = _pick(results, metric, tol)
+        best.update({k: pick[k] for k in best})
+
+    try:
+        run('threads', [{'num_threads': t} for t in _candidates(max_threads)], loader=False)
+        if len(batch_sizes) > 1: run('batch_size', [{'batch_size': b} for b in batch_sizes], metric='items_per_sec', loader=False)
+        run('workers', [{'num_workers': w} for w in [0] + _candidates(max_workers)])
+        if best['num_workers'] > 0: run('prefetch', [{'prefetch_factor': p} for p in (2, 4)])
+        if torch.cuda.is_available(): run('pin_memory', [{'pin_memory': p} for p in (False, True)])
+    finally:
+        torch.set_num_threads(threads0)
+    if pick is None: raise RuntimeError(f"autotune: every trial ran out of memory, even with {best}")
+    print(f"Best: {best}, {pick['steps_per_sec']:.2f} steps/sec")
+    return {**best, 'steps_per_sec': pick['steps_per_sec'], 'items_per_sec': pick['items_per_sec'],
+            'data_wait': pick['data_wait'], 'cores': cores, 'trials': trials}
+
+# %% ../nbs/tune.ipynb 12
+def tuning_file(tune_dir='~/.cache/shazbot') -> str:
+    "this host's file of tuning results"
+    return os.path.join(os.path.expanduser(tune_dir), f'tune-{socket.gethostname()}.json')
+
+
+def tuning_key(device='cpu', **setup) -> str:
+    "names the setup results were measured with, e.g. tuning_key('cuda', sample_size=65536)"
+    device = torch.device(device)
+    name = torch.cuda.get_device_name(device) if device.type == 'cuda' else device.type
+    setup = {'procs': int(os.getenv('LOCAL_WORLD_SIZE', 1)), **setup}
+    return '|'.join([name] + [f'{k}={v}' for k, v in sorted(setup.items())])
+
+
+def save_tuning(tuned:dict, path:str, key:str):
+    "adds (or replaces) the results for key in the file at path"
+    results = json.load(open(path)) if os.path.exists(path) else {}
+    results[key] = {**{k: v for k, v in tuned.items() if k != 'trials'}, 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f: json.dump(results, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def load_tuning(path:str, key:str) -> dict:
+    "the saved results for key, or None"
+    if not os.path.exists(path): return None
+    return json.load(open(path)).get(key)
+
+
+def apply_tuning(args, tuned:dict) -> dict:
+    "sets args.num_workers & args.batch_size and torch's thread count from tuned; returns the other DataLoader kwargs"
+    args.num_workers, args.batch_size = tuned['num_workers'], tuned['batch_size']
+    torch.set_num_threads(tuned['num_threads'])
+    return {'pin_memory': tuned['pin_memory'], **({'prefetch_factor': tuned['prefetch_factor']} if tuned['num_workers'] > 0 else {})}
+
+# %% ../nbs/tune.ipynb 15
+def aa_step_fn(aa_model, device='cpu', maxstems=6):
+    "a step_fn doing real AudioAlgebra forward & backward passes, minus the weight updates. aa_model: unwrapped, on device"
+    from shazbot.train_aa_mixer import get_stems_faders   # the training dependencies aren't needed for the rest
+    buffers = {k: b.clone() for k, b in aa_model.named_buffers()}   # e.g. BatchNorm statistics, which forward passes update
+    def step_fn(batch, batches):
+        stems, faders = get_stems_faders(batch[0], batches, maxstems)
+        zsum, zmix, archive = aa_model([s.to(device, non_blocking=True) for s in stems], faders)
+        aa_model.loss(zsum, zmix, archive).backward()
+        aa_model.zero_grad(set_to_none=True)
+        with torch.no_grad():
+            for k, b in aa_model.named_buffers(): b.copy_(buffers[k])
+    return step_fn